@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Online answer checking for quiz mode
+Looks up correct answers by question ID in an in-memory index so a whole
+class can be marked in one request with no database round trip. Served
+questions carry signed IDs, so an answer can still be marked by a process
+that never saw the question, or after a restart.
+"""
+
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+from question_bank import question_id
+
+def normalise_answer(answer):
+    """Normalise an answer for comparison ("  3 " and 3 mark the same)"""
+    return ' '.join(str(answer).split()).lower()
+
+class AnswerIndex:
+    """Bounded in-memory index of question ID -> correct answer
+
+    Entries are stored pre-normalised so marking is a dict lookup and a
+    string comparison per answer. Registration takes a lock; marking is
+    read-only and lock-free.
+
+    The index is per process, so with a secret registered questions are
+    given signed IDs, "<id>.<tag>", where the tag is an HMAC of the ID and
+    the normalised correct answer. An answer to a question missing from
+    the index is marked by checking the tag against the answer given;
+    every process sharing the secret agrees, though without the index
+    there is no correct answer or explanation to send back.
+    """
+
+    def __init__(self, max_entries=200000, secret=None):
+        self.max_entries = max_entries
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self._answers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._answers)
+
+    def register(self, question):
+        """Add a served question to the index"""
+        self.register_many([question])
+
+    def register_many(self, questions):
+        """Add a batch of served questions, evicting the oldest when full
+
+        Returns copies of the questions whose 'id' is the one to mark them
+        by: signed when the index has a secret, otherwise unchanged.
+        """
+        entries = []
+        served = []
+        for question in questions:
+            key = question.get('id') or question_id(question)
+            normalised = normalise_answer(question['correct_answer'])
+            entries.append((key, (
+                normalised,
+                question['correct_answer'],
+                question.get('explanation', '')
+            )))
+            served.append(dict(question, id=f"{key}.{self._tag(key, normalised)}" if self.secret else key))
+
+        with self.lock:
+            for key, entry in entries:
+                if key in self._answers:
+                    self._answers.move_to_end(key)
+                self._answers[key] = entry
+
+            while len(self._answers) > self.max_entries:
+                self._answers.popitem(last=False)
+        return served
+
+    def load_database(self, question_db):
+        """Index every question in a QuestionDatabase"""
+        self.register_many(question_db.iter_all_questions())
+
+    def grade(self, answers):
+        """Mark one pupil's answers, given as {question_id: answer}"""
+        lookup = self._answers.get
+        feedback = []
+        score = 0
+        unknown = 0
+
+        for key, answer in answers.items():
+            base, _, tag = str(key).partition('.')
+            entry = lookup(base)
+            if entry is None and tag and self.secret:
+                # Served elsewhere or before a restart: the tag says whether this answer is right
+                correct = hmac.compare_digest(tag, self._tag(base, normalise_answer(answer)))
+                score += correct
+                feedback.append({'question_id': key, 'status': 'correct' if correct else 'incorrect'})
+                continue
+            if entry is None:
+                unknown += 1
+                feedback.append({'question_id': key, 'status': 'unknown'})
+                continue
+
+            correct = normalise_answer(answer) == entry[0]
+            score += correct
+            feedback.append({
+                'question_id': key,
+                'status': 'correct' if correct else 'incorrect',
+                'correct_answer': entry[1],
+                'explanation': entry[2]
+            })
+
+        return {
+            'score': score,
+            'total': len(answers) - unknown,
+            'unknown': unknown,
+            'feedback': feedback
+        }
+
+    def _tag(self, key, normalised):
+        """Signature binding a question ID to its normalised correct answer"""
+        message = f"{key}\x1f{normalised}".encode('utf-8')
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:20]
+
+    def grade_many(self, submissions):
+        """Mark a batch of submissions, each {'pupil': ..., 'answers': {...}}"""
+        results = []
+        for submission in submissions:
+            result = self.grade(submission.get('answers', {}))
+            result['pupil'] = submission.get('pupil')
+            results.append(result)
+        return results
@@ -1,7 +1,18 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, Response, render_template, request, send_file, jsonify
+from collections import Counter
 from pdf_generator import PDFGenerator
-from question_bank import QuestionBank
+from question_bank import QuestionBank, new_seed, SEED_BITS
+from answer_checker import AnswerIndex
+from render_cache import RenderCache
+from render_pool import RenderDeadline, RenderPool, RenderTimeoutError
+from render_estimate import RenderEstimator
+from render_jobs import QueueFullError, RenderJobQueue
+from zip_bundle import stream_zip
+from diagrams import diagram_svg
+from werkzeug.utils import secure_filename
+import io
 import os
+import secrets
 import tempfile
 from datetime import datetime
 
@@ -10,7 +21,163 @@ app.config['SECRET_KEY'] = 'your-secret-key-here'
 
 # Initialize question bank and PDF generator
 question_bank = QuestionBank()
-pdf_generator = PDFGenerator()
+# Rendered PDFs are cached by content, so repeat requests skip reportlab
+render_cache = RenderCache(disk_dir=os.path.join(tempfile.gettempdir(), 'quizzykids_render_cache'))
+
+# Cache misses are laid out in separate processes so renders never block
+# catalog and preview requests. Each serving process starts its own pool
+# with start_render_pool(); until then, and with RENDER_POOL_WORKERS=0,
+# renders happen in-process
+render_pool = None
+pdf_generator = PDFGenerator(render_cache=render_cache)
+
+# Longest a pooled render may take, kept below the web server's 30s worker timeout
+RENDER_POOL_TIMEOUT = float(os.environ.get('RENDER_POOL_TIMEOUT', 25.0))
+
+# Render cost is predicted before rendering; RENDER_ESTIMATE_FILE names
+# coefficients written by render_benchmark.py --calibrate on this machine
+render_estimate_file = os.environ.get('RENDER_ESTIMATE_FILE')
+render_estimator = RenderEstimator.from_file(render_estimate_file) if render_estimate_file else RenderEstimator()
+
+# Worksheets predicted to render slower than this are queued instead of
+# rendered during the request
+MAX_INLINE_RENDER_SECONDS = float(os.environ.get('MAX_INLINE_RENDER_SECONDS', 2.0))
+
+# Worksheets predicted to render slower than this are refused outright,
+# kept below the render pool's timeout
+MAX_QUEUED_RENDER_SECONDS = float(os.environ.get('MAX_QUEUED_RENDER_SECONDS', 20.0))
+
+# Renders during a request stop after this long, well inside the web
+# server's worker timeout, so an oversized build never costs the worker
+INLINE_RENDER_TIMEOUT = float(os.environ.get('INLINE_RENDER_TIMEOUT', 10.0))
+
+# Requests whose render was stopped at its deadline, by route
+render_timeouts = Counter()
+
+# Rendered documents waiting to be downloaded, held in memory and evicted
+# oldest first; set DOCUMENT_STORE_DIR to a directory every server process
+# can reach so a download may be served by a different process
+document_store_dir = os.environ.get('DOCUMENT_STORE_DIR')
+document_store = RenderCache(
+    max_memory_mb=256,
+    disk_dir=document_store_dir,
+    max_disk_mb=int(os.environ.get('DOCUMENT_STORE_MB', 1024))
+)
+
+# Queued renders run in the process that accepted them; their records are
+# shared through RENDER_JOB_DIR (by default beside the stored documents) so
+# any process can answer a poll or cancel
+render_jobs = RenderJobQueue(
+    max_workers=int(os.environ.get('RENDER_JOB_WORKERS', 1)),
+    timeout=float(os.environ.get('QUEUED_RENDER_TIMEOUT', 60.0)),
+    shared_dir=os.environ.get(
+        'RENDER_JOB_DIR', os.path.join(document_store_dir, 'render_jobs') if document_store_dir else None
+    )
+)
+
+# With DOCUMENT_STORE_DIR on local disk behind nginx, set this to an internal
+# location aliasing that directory and nginx sends stored files itself
+DOCUMENT_ACCEL_PREFIX = os.environ.get('DOCUMENT_ACCEL_PREFIX')
+
+# Stored documents never change under their ID, so browsers may keep them this long
+DOCUMENT_MAX_AGE = 24 * 60 * 60
+
+def start_render_pool():
+    """Start this process's render pool and wait until its workers are warm
+
+    Called once in each process that serves requests: by gunicorn's
+    post_worker_init hook, after the worker has forked (and, under gevent,
+    patched threading), or by the development server below. The size comes
+    from RENDER_POOL_WORKERS, which gunicorn.conf.py sets to this worker's
+    share of the cores.
+    """
+    global render_pool
+    workers = int(os.environ.get('RENDER_POOL_WORKERS', os.cpu_count() or 1))
+    if render_pool is None and workers > 0:
+        render_pool = RenderPool(max_workers=workers, timeout=RENDER_POOL_TIMEOUT)
+        render_pool.start()
+        pdf_generator.render_pool = render_pool
+    return render_pool
+
+def store_document(data):
+    """Keep rendered PDF bytes for download, returning their ID"""
+    document_id = secrets.token_hex(16)
+    document_store.set(document_id, data)
+    return document_id
+
+def request_seed(data):
+    """Read the optional seed from a request body, drawing a new one when absent
+    
+    Seeds may be sent as integers or as strings of digits; anything else,
+    or an integer too large to survive JSON in a browser, is rejected.
+    """
+    seed = data.get('seed')
+    if seed is None:
+        return new_seed()
+    if isinstance(seed, str) and seed.isdigit():
+        seed = int(seed)
+    if isinstance(seed, bool) or not isinstance(seed, int) or not 0 <= seed < 2 ** SEED_BITS:
+        raise ValueError(f'seed must be a whole number below 2**{SEED_BITS}')
+    return seed
+
+def send_document(document_id, filename):
+    """Respond with a stored document, or None when the ID is unknown
+    
+    The ID is the ETag, so a repeat download is a 304. A document on disk
+    is sent as a file, which the WSGI server passes to sendfile (or, with
+    DOCUMENT_ACCEL_PREFIX, nginx sends itself); one only in memory is sent
+    from its bytes. Either way Range requests get a 206 of just that part.
+    """
+    path = document_store.get_file(document_id)
+    if path is None:
+        data = document_store.get(document_id)
+        if data is None:
+            return None
+        source = io.BytesIO(data)
+    elif DOCUMENT_ACCEL_PREFIX:
+        if document_id in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            # nginx answers Range and conditional requests for the file itself
+            response = app.response_class(mimetype='application/pdf')
+            relative_path = os.path.relpath(path, document_store.disk_dir).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = DOCUMENT_ACCEL_PREFIX.rstrip('/') + '/' + relative_path
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.set_etag(document_id)
+        response.cache_control.private = True
+        response.cache_control.max_age = DOCUMENT_MAX_AGE
+        return response
+    else:
+        source = path
+    
+    response = send_file(
+        source, mimetype='application/pdf', as_attachment=True, download_name=filename,
+        conditional=True, etag=document_id, max_age=DOCUMENT_MAX_AGE
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+# Correct answers for online marking, keyed by question ID; IDs are signed
+# with ANSWER_SECRET_KEY so any worker can mark any served question
+answer_index = AnswerIndex(secret=os.environ.get('ANSWER_SECRET_KEY', app.config['SECRET_KEY']))
+answer_index.load_database(question_bank.db)
+
+# Largest class set a single request may ask for
+MAX_CLASS_SET_SIZE = 40
+
+# Most questions a class set may hold across all pupils, since it renders synchronously
+MAX_CLASS_SET_QUESTIONS = 1200
+
+# Most printed copies of one worksheet a single request may ask for
+MAX_WORKSHEET_COPIES = 40
+
+# Most questions one worksheet may ask for, checked before any are generated
+MAX_WORKSHEET_QUESTIONS = 2000
+
+# Most answers a single marking request may carry
+MAX_ANSWERS_PER_REQUEST = 20000
 
 @app.route('/')
 def index():
@@ -24,72 +191,354 @@ def get_topics(subject):
     topics = question_bank.get_topics(subject)
     return jsonify(topics)
 
+def worksheet_request(data):
+    """Read and check the options of a worksheet request
+    
+    Returns (options, None), or (None, error message) for a bad request.
+    """
+    try:
+        options = {
+            'subject': data.get('subject'),
+            'topic': data.get('topic'),
+            'year_group': data.get('year_group'),
+            'difficulty': data.get('difficulty'),
+            'num_questions': int(data.get('num_questions', 10)),
+            'renderer': data.get('renderer', 'platypus'),
+            'layout': data.get('layout', 'standard'),
+            'seed': request_seed(data),
+            'copies': int(data.get('copies', 1)),
+            'async': bool(data.get('async', False))
+        }
+    except (TypeError, ValueError) as e:
+        return None, str(e)
+    if options['renderer'] not in PDFGenerator.RENDERERS:
+        return None, f"renderer must be one of: {', '.join(PDFGenerator.RENDERERS)}"
+    if options['layout'] not in PDFGenerator.LAYOUTS:
+        return None, f"layout must be one of: {', '.join(PDFGenerator.LAYOUTS)}"
+    if not 1 <= options['copies'] <= MAX_WORKSHEET_COPIES:
+        return None, f'A worksheet is limited to {MAX_WORKSHEET_COPIES} copies'
+    if not 1 <= options['num_questions'] <= MAX_WORKSHEET_QUESTIONS:
+        return None, f'A worksheet is limited to {MAX_WORKSHEET_QUESTIONS} questions'
+    return options, None
+
+def render_admission(estimate, prefer_async=False):
+    """How to run a render with this estimate: 'inline', 'queued' or 'rejected'"""
+    if estimate['seconds'] <= MAX_INLINE_RENDER_SECONDS and not prefer_async:
+        return 'inline'
+    if estimate['seconds'] <= MAX_QUEUED_RENDER_SECONDS:
+        return 'queued'
+    return 'rejected'
+
 @app.route('/generate_worksheet', methods=['POST'])
 def generate_worksheet():
-    """Generate PDF worksheet based on user selections"""
+    """Generate PDF worksheet based on user selections
+    
+    Worksheets predicted to render quickly are rendered during the
+    request; larger ones, or any sent with "async": true, are queued and
+    answered with 202 and a job to poll, and any too large to render at
+    all with 413. An inline render that overruns its deadline is stopped
+    and answered with 413 and use_async, asking the client to queue it.
+    """
     try:
-        data = request.get_json()
-        subject = data.get('subject')
-        topic = data.get('topic')
-        year_group = data.get('year_group')
-        difficulty = data.get('difficulty')
-        num_questions = int(data.get('num_questions', 10))
+        options, error = worksheet_request(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
+        subject, topic = options['subject'], options['topic']
+        year_group, difficulty = options['year_group'], options['difficulty']
         
         # Generate questions
+        generation_stats = {}
         questions = question_bank.generate_questions(
-            subject, topic, year_group, difficulty, num_questions
+            subject, topic, year_group, difficulty, options['num_questions'],
+            stats=generation_stats, seed=options['seed']
         )
         
         if not questions:
             return jsonify({'error': 'No questions available for the selected criteria'}), 400
         
-        # Generate PDF files
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        answer_index.register_many(questions)
+        
+        estimate = render_estimator.estimate(
+            questions, renderer=options['renderer'], layout=options['layout'], copies=options['copies']
+        )
+        admission = render_admission(estimate, options['async'])
+        if admission == 'rejected':
+            return jsonify({
+                'error': 'This worksheet is too large to render, please ask for fewer questions or copies',
+                'estimate': estimate
+            }), 413
         
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as worksheet_file:
-            worksheet_path = worksheet_file.name
+        def render(deadline):
+            # Generate PDFs in memory
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as answer_file:
-            answer_path = answer_file.name
+            worksheet_pdf, answer_pdf = pdf_generator.render_worksheet_and_answer_key(
+                questions, subject, topic, year_group, difficulty,
+                renderer=options['renderer'], copies=options['copies'], layout=options['layout'],
+                deadline=deadline
+            )
+            
+            return {
+                'success': True,
+                'worksheet_id': store_document(worksheet_pdf),
+                'answer_id': store_document(answer_pdf),
+                'timestamp': timestamp,
+                'num_questions': len(questions),
+                'max_distinct_questions': question_bank.get_question_capacity(
+                    subject, topic, year_group, difficulty
+                ),
+                'generation_stats': generation_stats,
+                'seed': options['seed'],
+                'estimate': estimate
+            }
+        
+        if admission == 'inline':
+            try:
+                return jsonify(render(RenderDeadline(INLINE_RENDER_TIMEOUT)))
+            except RenderTimeoutError:
+                render_timeouts['generate_worksheet'] += 1
+                return jsonify({
+                    'error': 'This worksheet is too large to render straight away, send it again with "async": true to queue it',
+                    'use_async': True,
+                    'estimate': estimate
+                }), 413
+        
+        job_id = render_jobs.submit(render, estimate['seconds'])
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/render_jobs/{job_id}',
+            'estimate': estimate
+        }), 202
+        
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except RenderTimeoutError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/render_jobs/<job_id>')
+def render_job_status(job_id):
+    """Poll a queued worksheet; once done the response matches /generate_worksheet's"""
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Render job not found'}), 404
+    
+    if job['status'] == 'done':
+        return jsonify(dict(job['result'], status='done'))
+    if job['status'] == 'failed':
+        return jsonify({'status': 'failed', 'error': job['error']}), 500
+    if job['status'] == 'timed_out':
+        return jsonify({'status': 'timed_out', 'error': job['error']}), 413
+    if job['status'] == 'cancelled':
+        return jsonify({'status': 'cancelled', 'error': job['error']})
+    return jsonify({
+        'status': job['status'],
+        'position': job.get('position', 0),
+        'estimated_seconds': job['estimated_seconds']
+    })
+
+@app.route('/render_jobs/<job_id>', methods=['DELETE'])
+def cancel_render_job(job_id):
+    """Cancel a queued or running worksheet"""
+    if not render_jobs.cancel(job_id):
+        return jsonify({'error': 'Render job not found or already finished'}), 404
+    return jsonify({'success': True, 'status': render_jobs.get(job_id)['status']})
+
+@app.route('/render_stats')
+def render_stats():
+    """Render queue, pool and deadline counters for monitoring"""
+    return jsonify({
+        'render_jobs': render_jobs.get_stats(),
+        'render_pool': render_pool.get_stats() if render_pool is not None else None,
+        'inline_timeouts': dict(render_timeouts)
+    })
+
+@app.route('/estimate_render', methods=['POST'])
+def estimate_render():
+    """Predict a worksheet's pages and render time, and whether it would be queued"""
+    try:
+        options, error = worksheet_request(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
         
-        # Generate worksheet PDF
-        pdf_generator.generate_worksheet(
-            questions, subject, topic, year_group, difficulty, worksheet_path
+        questions = question_bank.generate_questions(
+            options['subject'], options['topic'], options['year_group'], options['difficulty'],
+            options['num_questions'], seed=options['seed']
+        )
+        estimate = render_estimator.estimate(
+            questions, renderer=options['renderer'], layout=options['layout'], copies=options['copies']
         )
+        return jsonify({
+            'success': True,
+            'estimate': estimate,
+            'admission': render_admission(estimate, options['async']),
+            'seed': options['seed']
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/generate_class_set', methods=['POST'])
+def generate_class_set():
+    """Generate a different worksheet for every pupil in one call
+    
+    Class sets are costed and admitted like worksheets: rendered during
+    the request, queued and answered with 202 and a job to poll, or
+    refused with 413.
+    """
+    try:
+        data = request.get_json()
+        subject = data.get('subject')
+        topic = data.get('topic')
+        year_group = data.get('year_group')
+        difficulty = data.get('difficulty')
+        pupils = data.get('pupils')
+        prefer_async = bool(data.get('async', False))
+        try:
+            seed = request_seed(data)
+            num_questions = int(data.get('num_questions', 10))
+            num_pupils = len(pupils) if pupils else int(data.get('num_pupils', 30))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if pupils and (not isinstance(pupils, list) or not all(isinstance(label, str) for label in pupils)):
+            return jsonify({'error': 'pupils must be a list of names'}), 400
+        if not 1 <= num_pupils <= MAX_CLASS_SET_SIZE:
+            return jsonify({'error': f'A class set is limited to {MAX_CLASS_SET_SIZE} pupils'}), 400
+        if not 1 <= num_questions or num_questions * num_pupils > MAX_CLASS_SET_QUESTIONS:
+            return jsonify({'error': f'A class set is limited to {MAX_CLASS_SET_QUESTIONS} questions in total'}), 400
+        
+        pupils = pupils or [f"Pupil {i}" for i in range(1, num_pupils + 1)]
         
-        # Generate answer key PDF
-        pdf_generator.generate_answer_key(
-            questions, subject, topic, year_group, difficulty, answer_path
+        # Plan selection once across the whole class
+        spec = {
+            'subject': subject,
+            'topic': topic,
+            'year_group': year_group,
+            'difficulty': difficulty,
+            'num_questions': num_questions
+        }
+        generation_stats = {}
+        class_questions = question_bank.generate_class_set(
+            spec, len(pupils), seed=seed, stats=generation_stats
         )
         
+        if not generation_stats['pool_size']:
+            return jsonify({'error': 'No questions available for the selected criteria'}), 400
+        
+        worksheets = list(zip(pupils, class_questions))
+        for questions in class_questions:
+            answer_index.register_many(questions)
+        
+        estimate = render_estimator.estimate_class_set(class_questions)
+        admission = render_admission(estimate, prefer_async)
+        if admission == 'rejected':
+            return jsonify({
+                'error': 'This class set is too large to render, please ask for fewer pupils or questions',
+                'estimate': estimate
+            }), 413
+        
+        def render(deadline):
+            # Render every pupil's worksheet and the combined answer key in one batch
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            worksheet_pdf, answer_pdf = pdf_generator.render_class_set(
+                worksheets, subject, topic, year_group, difficulty, deadline=deadline
+            )
+            return {
+                'success': True,
+                'worksheet_id': store_document(worksheet_pdf),
+                'answer_id': store_document(answer_pdf),
+                'timestamp': timestamp,
+                'pupils': [
+                    {'label': label, 'num_questions': len(questions)} for label, questions in worksheets
+                ],
+                'generation_stats': generation_stats,
+                'seed': seed,
+                'estimate': estimate
+            }
+        
+        if admission == 'inline':
+            try:
+                return jsonify(render(RenderDeadline(INLINE_RENDER_TIMEOUT)))
+            except RenderTimeoutError:
+                render_timeouts['generate_class_set'] += 1
+                return jsonify({
+                    'error': 'This class set is too large to render straight away, send it again with "async": true to queue it',
+                    'use_async': True,
+                    'estimate': estimate
+                }), 413
+        
+        job_id = render_jobs.submit(render, estimate['seconds'])
         return jsonify({
             'success': True,
-            'worksheet_path': worksheet_path,
-            'answer_path': answer_path,
-            'timestamp': timestamp
-        })
+            'job_id': job_id,
+            'status_url': f'/render_jobs/{job_id}',
+            'estimate': estimate
+        }), 202
+        
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except RenderTimeoutError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/documents/<document_id>')
+def download_document(document_id):
+    """Download a stored PDF by its ID, saved under the optional filename given"""
+    try:
+        filename = secure_filename(request.args.get('filename', '')) or f"{document_id}.pdf"
+        response = send_document(document_id, filename)
+        if response is None:
+            return jsonify({'error': 'File not found'}), 404
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/download/<file_type>/<timestamp>')
 def download_file(file_type, timestamp):
-    """Download generated PDF files"""
+    """Download generated PDF files; kept for links made before /documents"""
     try:
         if file_type == 'worksheet':
-            file_path = request.args.get('path')
-            filename = f"worksheet_{timestamp}.pdf"
+            filename = secure_filename(f"worksheet_{timestamp}.pdf")
         elif file_type == 'answer':
-            file_path = request.args.get('path')
-            filename = f"answer_key_{timestamp}.pdf"
+            filename = secure_filename(f"answer_key_{timestamp}.pdf")
         else:
             return jsonify({'error': 'Invalid file type'}), 400
         
-        if not os.path.exists(file_path):
+        response = send_document(request.args.get('id', ''), filename)
+        if response is None:
+            return jsonify({'error': 'File not found'}), 404
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/download/bundle/<timestamp>')
+def download_bundle(timestamp):
+    """Download the worksheet and answer key together as one ZIP
+    
+    The archive is streamed from the stored PDFs with stored entries, plus
+    a manifest.json unless manifest=0 is given.
+    """
+    try:
+        worksheet_pdf = document_store.get(request.args.get('worksheet_id', ''))
+        answer_pdf = document_store.get(request.args.get('answer_id', ''))
+        if worksheet_pdf is None or answer_pdf is None:
             return jsonify({'error': 'File not found'}), 404
         
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        # The timestamp names the entries and the download, so only a safe file name part is kept
+        timestamp = secure_filename(timestamp) or datetime.now().strftime("%Y%m%d_%H%M%S")
+        files = [(f"worksheet_{timestamp}.pdf", worksheet_pdf), (f"answer_key_{timestamp}.pdf", answer_pdf)]
+        manifest = None if request.args.get('manifest') == '0' else {'generated': timestamp}
+        return Response(
+            stream_zip(files, manifest),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="worksheets_{timestamp}.zip"'}
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -103,19 +552,69 @@ def preview_questions():
         topic = data.get('topic')
         year_group = data.get('year_group')
         difficulty = data.get('difficulty')
-        num_questions = int(data.get('num_questions', 5))
+        try:
+            num_questions = int(data.get('num_questions', 5))
+            seed = request_seed(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        # Checked before any are generated or registered for marking
+        if num_questions > MAX_WORKSHEET_QUESTIONS:
+            return jsonify({'error': f'A preview is limited to {MAX_WORKSHEET_QUESTIONS} questions'}), 413
         
+        generation_stats = {}
         questions = question_bank.generate_questions(
-            subject, topic, year_group, difficulty, num_questions
+            subject, topic, year_group, difficulty, num_questions, stats=generation_stats, seed=seed
         )
+        questions = answer_index.register_many(questions)
+        for question in questions:
+            # The question text relies on its diagram, so previews draw it too
+            if question.get('diagram'):
+                question['diagram_svg'] = diagram_svg(question['diagram'])
+        
+        return jsonify({
+            'success': True,
+            'questions': questions,
+            'max_distinct_questions': question_bank.get_question_capacity(
+                subject, topic, year_group, difficulty
+            ),
+            'generation_stats': generation_stats,
+            'seed': seed
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/check_answers', methods=['POST'])
+def check_answers():
+    """Mark answers for one pupil or a whole class in a single request"""
+    try:
+        data = request.get_json()
+        
+        # Accept a single pupil's answers or a batch of submissions
+        submissions = data.get('submissions')
+        if submissions is None:
+            submissions = [{'pupil': data.get('pupil'), 'answers': data.get('answers', {})}]
+        if not isinstance(submissions, list) or not all(
+            isinstance(submission, dict) and isinstance(submission.get('answers', {}), dict)
+            for submission in submissions
+        ):
+            return jsonify({'error': 'answers must be an object of question ID to answer'}), 400
+        
+        total_answers = sum(len(submission.get('answers', {})) for submission in submissions)
+        if total_answers > MAX_ANSWERS_PER_REQUEST:
+            return jsonify({'error': f'At most {MAX_ANSWERS_PER_REQUEST} answers can be marked per request'}), 400
         
         return jsonify({
             'success': True,
-            'questions': questions
+            'results': answer_index.grade_many(submissions)
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # With the debug reloader only the child process serves requests, so
+    # the parent must not start a pool of its own
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_render_pool()
     app.run(debug=True, host='0.0.0.0', port=5000)
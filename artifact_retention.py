@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Retention for generated files kept on local disk
+Files written by the local storage fallbacks are tracked in an index with
+an expiry time and a size. A background sweeper deletes expired files,
+keeps the directory under a size quota and, when the filesystem itself
+fills past a watermark, evicts the oldest files until it has room again,
+so a busy server never fills its disk with PDFs nobody will download.
+"""
+
+import heapq
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+class ArtifactRetention:
+    """TTL, quota and disk-pressure eviction for the files in one directory
+
+    The index maps file names to their size, expiry time and when they were
+    indexed, oldest first, and a heap orders them by expiry, so a sweep only
+    looks at files that are due rather than stating the whole directory.
+    Files written by other processes are picked up by a scan that reads at
+    most scan_batch directory entries per sweep and resumes where it left
+    off; once it has been through the whole directory, index entries it did
+    not see are forgotten, since another process has deleted them.
+    """
+
+    def __init__(self, directory, ttl_seconds=24 * 60 * 60, max_size_mb=1024,
+                 high_watermark=85.0, low_watermark=75.0, scan_batch=500, sweep_interval=60):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size_mb * 1024 * 1024
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.scan_batch = scan_batch
+        self.sweep_interval = sweep_interval
+
+        self.index = OrderedDict()
+        self.total_size = 0
+        self._expiry = []
+        self._scan = None
+        self._scan_started = 0
+        self._seen = set()
+        self._sweeper = None
+        self._wake = threading.Event()
+        self.lock = threading.Lock()
+
+        self.registered = 0
+        self.adopted = 0
+        self.expired = 0
+        self.evicted_quota = 0
+        self.evicted_pressure = 0
+        self.freed_bytes = 0
+        self.sweeps = 0
+        self.last_sweep_seconds = 0
+        self.last_disk_percent = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def register(self, path, size=None, ttl_seconds=None):
+        """Track a file just written to the directory, waking the sweeper if it is over quota"""
+        name = os.path.basename(path)
+        if size is None:
+            size = os.path.getsize(os.path.join(self.directory, name))
+        with self.lock:
+            self._add(name, size, time.time() + (ttl_seconds or self.ttl_seconds))
+            self.registered += 1
+            over_quota = self.total_size > self.max_size
+        if over_quota:
+            self._wake.set()
+
+    def sweep(self, now=None):
+        """Run one pass: scan a batch of entries, then expire, enforce the quota and relieve disk pressure"""
+        start_time = time.perf_counter()
+        now = now or time.time()
+        with self.lock:
+            self._scan_batch()
+            victims = self._take_expired(now)
+            self.expired += len(victims)
+            quota_victims = self._take_oldest(lambda freed: self.total_size <= self.max_size)
+            self.evicted_quota += len(quota_victims)
+            victims += quota_victims
+
+        freed = self._delete(victims)
+        freed += self._relieve_pressure()
+
+        with self.lock:
+            self.sweeps += 1
+            self.last_sweep_seconds = time.perf_counter() - start_time
+        return freed
+
+    def start(self):
+        """Run sweeps on a daemon thread every sweep_interval seconds, or sooner when woken"""
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._run, daemon=True)
+            self._sweeper.start()
+
+    def get_stats(self):
+        """Get retention statistics"""
+        with self.lock:
+            return {
+                'files': len(self.index),
+                'size_mb': self.total_size / (1024 * 1024),
+                'quota_mb': self.max_size / (1024 * 1024),
+                'ttl_hours': self.ttl_seconds / 3600,
+                'registered': self.registered,
+                'adopted': self.adopted,
+                'expired': self.expired,
+                'evicted_quota': self.evicted_quota,
+                'evicted_pressure': self.evicted_pressure,
+                'freed_mb': self.freed_bytes / (1024 * 1024),
+                'sweeps': self.sweeps,
+                'last_sweep_ms': self.last_sweep_seconds * 1000,
+                'disk_percent': self.last_disk_percent
+            }
+
+    def _run(self):
+        """Sweeper loop"""
+        while True:
+            self._wake.wait(self.sweep_interval)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Retention sweep failed: {e}")
+
+    def _add(self, name, size, expires_at, indexed_at=None):
+        """Index a file, replacing any earlier entry for the same name (lock held)"""
+        old = self.index.pop(name, None)
+        if old is not None:
+            self.total_size -= old[0]
+        self.index[name] = (size, expires_at, indexed_at or time.time())
+        self.total_size += size
+        # Superseded heap entries are skipped when they surface
+        heapq.heappush(self._expiry, (expires_at, name))
+
+    def _forget(self, name):
+        """Drop a file from the index, returning its size (lock held)"""
+        size = self.index.pop(name)[0]
+        self.total_size -= size
+        return size
+
+    def _scan_batch(self):
+        """Adopt up to scan_batch directory entries the index does not know about (lock held)"""
+        if self._scan is None:
+            self._scan = os.scandir(self.directory)
+            self._scan_started = time.time()
+            self._seen = set()
+
+        for _ in range(self.scan_batch):
+            entry = next(self._scan, None)
+            if entry is None:
+                self._scan.close()
+                self._scan = None
+                # Anything indexed before the scan began and not seen since is gone
+                for name in [name for name in self.index if name not in self._seen]:
+                    if self.index[name][2] < self._scan_started:
+                        self._forget(name)
+                return
+
+            self._seen.add(entry.name)
+            if entry.name in self.index:
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                # Deleted by another process mid-scan
+                continue
+            self._add(entry.name, stat.st_size, stat.st_mtime + self.ttl_seconds, stat.st_mtime)
+            self.adopted += 1
+
+    def _take_expired(self, now):
+        """Remove files due to expire from the index and return their names (lock held)"""
+        victims = []
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, name = heapq.heappop(self._expiry)
+            entry = self.index.get(name)
+            if entry is not None and entry[1] == expires_at:
+                self._forget(name)
+                victims.append(name)
+        return victims
+
+    def _take_oldest(self, satisfied):
+        """Remove the oldest files from the index until satisfied(bytes freed) holds (lock held)"""
+        victims = []
+        freed = 0
+        while self.index and not satisfied(freed):
+            name = next(iter(self.index))
+            freed += self._forget(name)
+            victims.append(name)
+        return victims
+
+    def _relieve_pressure(self):
+        """Evict the oldest files while the filesystem is fuller than high_watermark"""
+        try:
+            usage = shutil.disk_usage(self.directory)
+        except OSError:
+            return 0
+        disk_percent = usage.used / usage.total * 100
+        with self.lock:
+            self.last_disk_percent = disk_percent
+            if disk_percent < self.high_watermark:
+                return 0
+            target = usage.total * self.low_watermark / 100
+            victims = self._take_oldest(lambda freed: usage.used - freed <= target)
+            self.evicted_pressure += len(victims)
+
+        logging.warning(f"Disk {disk_percent:.0f}% full, evicting {len(victims)} files from {self.directory}")
+        return self._delete(victims)
+
+    def _delete(self, names):
+        """Delete evicted files outside the lock, returning the bytes freed"""
+        freed = 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                # Already deleted by another process
+                continue
+            freed += size
+        with self.lock:
+            self.freed_bytes += freed
+        return freed
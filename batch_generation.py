@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Batch question generation across CPU cores
+Partitions a large generation plan (class sets, term packs, catalog
+pre-warming) into shards that run in a process pool, then merges the
+results back in plan order.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from question_bank import QuestionBank, make_rng, new_seed, spawn_seeds
+
+# Question bank owned by each worker process, built once by the initializer
+_worker_bank = None
+
+def _init_worker():
+    """Load the question bank once per worker process"""
+    global _worker_bank
+    _worker_bank = QuestionBank()
+
+def _generate_item(question_bank, spec, seed):
+    """Generate one plan item with its own RNG stream"""
+    rng = make_rng(seed)
+
+    if spec.get('num_worksheets'):
+        return question_bank.generate_class_set(spec, spec['num_worksheets'], rng=rng)
+
+    return question_bank.generate_questions(
+        spec['subject'], spec['topic'], spec['year_group'], spec['difficulty'],
+        spec['num_questions'], rng=rng
+    )
+
+def _generate_shard(shard):
+    """Generate every item in a shard, returning (index, questions, error) triples
+
+    One broken generator must not sink the whole batch, so failures are
+    reported per item instead of raised.
+    """
+    results = []
+    for index, spec, seed in shard:
+        try:
+            results.append((index, _generate_item(_worker_bank, spec, seed), None))
+        except Exception as e:
+            results.append((index, [], f"{type(e).__name__}: {e}"))
+    return results
+
+def catalog_plan(question_bank, num_questions=20):
+    """Build a plan covering every subject, topic, year group and difficulty"""
+    plan = []
+    for subject in question_bank.get_subjects():
+        for topic in question_bank.get_topics(subject):
+            for year_group in question_bank.year_groups:
+                for difficulty in question_bank.difficulty_levels:
+                    plan.append({
+                        'subject': subject,
+                        'topic': topic,
+                        'year_group': year_group,
+                        'difficulty': difficulty,
+                        'num_questions': num_questions
+                    })
+    return plan
+
+class BatchGenerator:
+    """Runs generation plans on a process pool with deterministic results
+
+    Each plan item gets a child seed derived from the batch seed, so the
+    output depends only on (plan, seed) and not on how many workers ran it.
+    """
+
+    def __init__(self, max_workers=None, shards_per_worker=4):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shards_per_worker = shards_per_worker
+        self._executor = None
+        self._job_executor = ThreadPoolExecutor(max_workers=1)
+
+    def _get_executor(self):
+        """Start the process pool on first use"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+        return self._executor
+
+    def _partition(self, plan, seed):
+        """Split a plan into contiguous shards of (index, spec, seed)"""
+        items = list(zip(range(len(plan)), plan, spawn_seeds(seed, len(plan))))
+        num_shards = min(len(items), self.max_workers * self.shards_per_worker) or 1
+        shard_size = -(-len(items) // num_shards)
+        return [items[start:start + shard_size] for start in range(0, len(items), shard_size)]
+
+    def generate(self, plan, seed=None, errors=None):
+        """Generate every item of a plan, returning results in plan order
+
+        Items that fail come back empty; pass a dict as errors to receive
+        their messages keyed by plan index.
+        """
+        if errors is None:
+            errors = {}
+        if seed is None:
+            seed = new_seed()
+
+        results = [None] * len(plan)
+        shards = self._partition(plan, seed)
+
+        if self.max_workers == 1:
+            # No point paying for a process pool on a single core
+            global _worker_bank
+            if _worker_bank is None:
+                _init_worker()
+            shard_results = map(_generate_shard, shards)
+        else:
+            shard_results = self._get_executor().map(_generate_shard, shards)
+
+        for shard_result in shard_results:
+            for index, questions, error in shard_result:
+                results[index] = questions
+                if error:
+                    errors[index] = error
+
+        return results
+
+    def submit(self, plan, seed=None, errors=None):
+        """Run a plan as a background job, returning a concurrent.futures.Future"""
+        return self._job_executor.submit(self.generate, plan, seed, errors)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self._job_executor.shutdown(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+def load_plan(path):
+    """Read a plan from an NDJSON file of worksheet specs"""
+    plan = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                plan.append(json.loads(line))
+    return plan
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Generate questions for a large plan across all CPU cores")
+    parser.add_argument('plan', nargs='?', help="NDJSON file with one worksheet spec per line")
+    parser.add_argument('--catalog', action='store_true', help="Generate every catalog combination instead of a plan file")
+    parser.add_argument('--num-questions', type=int, default=20, help="Questions per catalog worksheet")
+    parser.add_argument('--output', required=True, help="NDJSON output file")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=None, help="Batch seed for reproducible output")
+    args = parser.parse_args(argv)
+
+    if args.catalog:
+        plan = catalog_plan(QuestionBank(), args.num_questions)
+    elif args.plan:
+        plan = load_plan(args.plan)
+    else:
+        parser.error("a plan file or --catalog is required")
+
+    seed = args.seed if args.seed is not None else new_seed()
+    generator = BatchGenerator(max_workers=args.workers)
+
+    errors = {}
+    start_time = time.time()
+    try:
+        results = generator.generate(plan, seed=seed, errors=errors)
+    finally:
+        generator.shutdown()
+    elapsed = time.time() - start_time
+
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for index, (spec, questions) in enumerate(zip(plan, results)):
+            record = {'index': index, 'spec': spec, 'questions': questions}
+            if index in errors:
+                record['error'] = errors[index]
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    print(f"✅ Generated {len(plan)} plan items with {generator.max_workers} workers "
+          f"in {elapsed:.2f}s ({len(plan) / max(elapsed, 1e-9):.0f} items/s, seed {seed})")
+    if errors:
+        print(f"⚠️ {len(errors)} plan items failed; see the 'error' field in {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Offline batch renderer
+Renders every worksheet in an NDJSON manifest, with its answer key, on a
+process pool outside the web app, for term packs, print-shop batches and
+pre-rendering popular worksheets. Finished items are recorded in a
+checkpoint file as they land, so an interrupted run picks up where it
+stopped. Output is a directory of PDFs or, for a .zip path, a ZIP of
+stored entries packed from the finished directory at the end. Plain
+platypus items are streamed: questions are generated as the layout
+consumes them and pages go straight to the file, so a worker's memory
+does not grow with the size of a worksheet.
+
+Each manifest line is a worksheet spec: subject, topic, year_group,
+difficulty and num_questions, plus optional seed, name, renderer,
+layout, copies and answer_key (default true).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from batch_generation import load_plan
+from question_bank import QuestionBank, new_seed, spawn_seeds
+from render_benchmark import page_count
+from zip_bundle import CHUNK_SIZE, stream_zip
+
+# Name of the checkpoint file kept in the output directory
+CHECKPOINT_FILE = 'checkpoint.ndjson'
+
+# Question bank and PDF generator owned by each worker process
+_worker_bank = None
+_worker_generator = None
+
+def _init_worker():
+    """Load the question bank and PDF styles once per worker process"""
+    global _worker_bank, _worker_generator
+    from pdf_generator import PDFGenerator
+    _worker_bank = QuestionBank()
+    _worker_generator = PDFGenerator()
+
+def _render_item(item):
+    """Generate and render one manifest item into the output directory
+
+    Files are written under temporary names and renamed into place, so a
+    file with its final name is always complete. Returns the item's
+    checkpoint record; failures are recorded rather than raised.
+    """
+    index, spec, seed, name, directory = item
+    record = {'index': index, 'name': name, 'seed': seed, 'files': [], 'pages': 0, 'bytes': 0}
+    details = (spec['subject'], spec['topic'], spec['year_group'], spec['difficulty'])
+    options = {
+        'renderer': spec.get('renderer', 'platypus'),
+        'copies': spec.get('copies', 1),
+        'layout': spec.get('layout', 'standard')
+    }
+    try:
+        if options == {'renderer': 'platypus', 'copies': 1, 'layout': 'standard'}:
+            _stream_item(spec, seed, name, directory, record)
+            return record
+
+        questions = _worker_bank.generate_questions(*details, spec['num_questions'], seed=seed)
+        if not questions:
+            raise ValueError("no questions available for this spec")
+        if spec.get('answer_key', True):
+            documents = zip(('worksheet', 'answer_key'),
+                            _worker_generator.render_worksheet_and_answer_key(questions, *details, **options))
+        else:
+            documents = [('worksheet', _worker_generator.render_worksheet(questions, *details, **options))]
+
+        for kind, pdf in documents:
+            filename = f"{name}_{kind}.pdf"
+            path = os.path.join(directory, filename)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(pdf)
+            os.replace(path + '.tmp', path)
+            record['files'].append(filename)
+            record['pages'] += page_count(pdf)
+            record['bytes'] += len(pdf)
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+def _stream_item(spec, seed, name, directory, record):
+    """Lay an item's documents out straight into their files as questions are generated
+
+    The worksheet and answer key each draw the questions afresh from the
+    item's seed, which yields the same questions both times, so no
+    document's questions are ever held as a list.
+    """
+    details = (spec['subject'], spec['topic'], spec['year_group'], spec['difficulty'])
+    writers = [('worksheet', _worker_generator.generate_worksheet)]
+    if spec.get('answer_key', True):
+        writers.append(('answer_key', _worker_generator.generate_answer_key))
+
+    for kind, write in writers:
+        questions = _worker_bank.iter_questions(spec, seed=seed)
+        first = next(questions, None)
+        if first is None:
+            raise ValueError("no questions available for this spec")
+        filename = f"{name}_{kind}.pdf"
+        path = os.path.join(directory, filename)
+        write(itertools.chain([first], questions), *details, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        record['files'].append(filename)
+        record['pages'] += file_page_count(path)
+        record['bytes'] += os.path.getsize(path)
+
+def file_page_count(path):
+    """Count the pages in a reportlab PDF file, reading it a chunk at a time"""
+    marker = b'/Type /Page\n'
+    pages = 0
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return pages
+            # Keep a marker's length of overlap so one split across chunks still counts once
+            data = tail + chunk
+            pages += data.count(marker)
+            tail = data[-(len(marker) - 1):]
+
+def item_name(index, spec):
+    """File name stem for a manifest item: its 'name', or its position and spec"""
+    if spec.get('name'):
+        stem = spec['name']
+    else:
+        stem = f"{index:05d}_{spec['subject']}_{spec['topic']}_{spec['year_group']}_{spec['difficulty']}"
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', stem)
+
+def load_checkpoint(path):
+    """Read a checkpoint: (batch seed or None, {index: record} for finished items)"""
+    seed = None
+    done = {}
+    if not os.path.exists(path):
+        return seed, done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption; its item is simply redone
+                continue
+            if 'batch_seed' in record:
+                seed = record['batch_seed']
+            elif 'error' not in record:
+                done[record['index']] = record
+    return seed, done
+
+class BatchRenderer:
+    """Renders manifest items on a process pool, checkpointing each as it finishes
+
+    Items without their own seed get a child seed of the batch seed, as in
+    BatchGenerator, so a resumed run renders exactly what the first would
+    have. At most two items per worker are in flight, keeping memory flat
+    however long the manifest is.
+    """
+
+    def __init__(self, max_workers=None, progress_interval=50):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.progress_interval = progress_interval
+
+    def render(self, plan, directory, seed=None, restart=False):
+        """Render a plan into directory, returning totals for this run"""
+        os.makedirs(directory, exist_ok=True)
+        checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+        if restart and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        saved_seed, done = load_checkpoint(checkpoint_path)
+        if seed is None:
+            seed = saved_seed if saved_seed is not None else new_seed()
+        elif saved_seed is not None and saved_seed != seed:
+            raise ValueError(f"the checkpoint was made with seed {saved_seed}; use --restart to start over")
+
+        seeds = spawn_seeds(seed, len(plan))
+        items = [
+            (index, spec, spec.get('seed', seeds[index]), item_name(index, spec), directory)
+            for index, spec in enumerate(plan) if index not in done
+        ]
+        totals = {'seed': seed, 'items': 0, 'skipped': len(done), 'failed': 0, 'pages': 0, 'bytes': 0, 'errors': {}}
+
+        start_time = time.perf_counter()
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            if saved_seed is None:
+                self._checkpoint(checkpoint, {'batch_seed': seed})
+            for record in self._run(items):
+                self._checkpoint(checkpoint, record)
+                totals['items'] += 1
+                if 'error' in record:
+                    totals['failed'] += 1
+                    totals['errors'][record['index']] = record['error']
+                totals['pages'] += record['pages']
+                totals['bytes'] += record['bytes']
+                if totals['items'] % self.progress_interval == 0:
+                    report(f"{totals['items']}/{len(items)}", totals, time.perf_counter() - start_time)
+
+        totals['seconds'] = time.perf_counter() - start_time
+        return totals
+
+    def _run(self, items):
+        """Yield checkpoint records as items finish, in whatever order they do"""
+        if self.max_workers == 1:
+            # No point paying for a process pool on a single core
+            if _worker_bank is None:
+                _init_worker()
+            yield from map(_render_item, items)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker) as executor:
+            pending = iter(items)
+            running = set()
+            while True:
+                for item in pending:
+                    running.add(executor.submit(_render_item, item))
+                    if len(running) >= 2 * self.max_workers:
+                        break
+                if not running:
+                    return
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+
+    @staticmethod
+    def _checkpoint(checkpoint, record):
+        """Append a record and make sure it reaches the disk before moving on"""
+        checkpoint.write(json.dumps(record) + '\n')
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+def report(label, totals, elapsed):
+    """Print throughput so far"""
+    elapsed = max(elapsed, 1e-9)
+    print(f"  {label}: {totals['pages'] / elapsed:.1f} pages/s, "
+          f"{totals['bytes'] / elapsed / 1024 / 1024:.2f} MB/s, {totals['items'] / elapsed:.1f} items/s")
+
+def pack_zip(directory, zip_path):
+    """Write every PDF in directory into a ZIP of stored entries, one chunk at a time"""
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.pdf'))
+
+    def chunks(name):
+        with open(os.path.join(directory, name), 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    with open(zip_path + '.tmp', 'wb') as out:
+        for chunk in stream_zip(((name, chunks(name)) for name in names), {'generated': time.strftime('%Y%m%d_%H%M%S')}):
+            out.write(chunk)
+    os.replace(zip_path + '.tmp', zip_path)
+    return len(names)
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Render every worksheet in a manifest across all CPU cores")
+    parser.add_argument('manifest', help="NDJSON file with one worksheet spec per line")
+    parser.add_argument('--output', required=True, help="Output directory, or a .zip file")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=None, help="Batch seed for items without their own")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and render everything")
+    args = parser.parse_args(argv)
+
+    plan = load_plan(args.manifest)
+    to_zip = args.output.lower().endswith('.zip')
+    # A ZIP is packed once every item is done, from a directory the run can resume in
+    directory = args.output + '.parts' if to_zip else args.output
+
+    renderer = BatchRenderer(max_workers=args.workers)
+    try:
+        totals = renderer.render(plan, directory, seed=args.seed, restart=args.restart)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✅ Rendered {totals['items']} manifest items with {renderer.max_workers} workers "
+          f"in {totals['seconds']:.2f}s (seed {totals['seed']}, {totals['skipped']} already done)")
+    report("Throughput", totals, totals['seconds'])
+    if totals['failed']:
+        for index, error in sorted(totals['errors'].items()):
+            print(f"  ⚠️ item {index}: {error}")
+        print(f"⚠️ {totals['failed']} items failed; run again to retry them")
+        return 1
+
+    if to_zip:
+        files = pack_zip(directory, args.output)
+        shutil.rmtree(directory)
+        print(f"📦 Packed {files} PDFs into {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Direct-canvas renderer for multiple-choice worksheets
+Worksheets are a fixed stack of header lines and "question + options"
+blocks, so they can be drawn straight onto a reportlab canvas with
+stringWidth-based wrapping and manual pagination, skipping platypus
+markup parsing and the flow layout engine. Content this renderer cannot
+reproduce faithfully raises UnsupportedContent so the caller can fall
+back to platypus.
+"""
+
+import io
+import threading
+from collections import OrderedDict
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from diagrams import diagram_size, draw_diagram
+
+# Gap below a question diagram, matching DiagramFlowable's spaceAfter
+DIAGRAM_SPACE_AFTER = 6
+
+# SimpleDocTemplate's frame pads its content by this much on every side
+FRAME_PADDING = 6
+
+# Tolerance platypus frames allow when deciding whether a flowable fits
+FIT_TOLERANCE = 1e-6
+
+# Bold variant of each standard font, for the "Question n:" and option letter prefixes
+BOLD_FONTS = {
+    'Helvetica': 'Helvetica-Bold',
+    'Times-Roman': 'Times-Bold',
+    'Courier': 'Courier-Bold'
+}
+
+class UnsupportedContent(Exception):
+    """Raised for content the canvas renderer cannot lay out like platypus would"""
+
+class FragmentCache:
+    """LRU cache of laid-out question blocks
+    
+    A fragment holds a question's wrapped lines and its block height, so a
+    popular question is wrapped once per process and later worksheets only
+    stack fragments and write bytes. Entries are keyed by question ID,
+    layout width and template version; each keeps the text it was wrapped
+    from, so an edited question under an old ID is simply re-wrapped.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, source):
+        """Get the fragment for key if it was built from source; None otherwise"""
+        with self.lock:
+            fragment = self.entries.get(key)
+            if fragment is None or fragment['source'] != source:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, key, fragment):
+        """Store a fragment, evicting the least recently used beyond max_entries"""
+        with self.lock:
+            self.entries[key] = fragment
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_stats(self):
+        """Get cache statistics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0,
+                'entries': len(self.entries)
+            }
+
+class CanvasRenderer:
+    """Draws worksheets from a PDFGenerator document model
+
+    Fonts, sizes and spacing are read from the generator's paragraph
+    styles so both backends stay visually in step. Pagination follows a
+    platypus frame: spaceBefore is dropped at the top of a page and
+    overlaps the previous spaceAfter, spacers and diagrams move whole to
+    the next page, and a paragraph that does not fit splits between lines
+    unless only one line would be left behind.
+    
+    For several copies each page is drawn once into a form XObject and
+    every copy references the forms, so the layout work and the page
+    content are not repeated per copy. An optional RenderDeadline is
+    checked before each question block.
+    """
+
+    def __init__(self, generator, pagesize=A4, margin=inch, deadline=None):
+        self.generator = generator
+        self.deadline = deadline
+        self.page_width, self.page_height = pagesize
+        self.left = margin + FRAME_PADDING
+        self.top = self.page_height - margin - FRAME_PADDING
+        self.bottom = margin + FRAME_PADDING
+        self.frame_width = self.page_width - 2 * self.left
+
+    def render_worksheet(self, model, pupil_label=None, copies=1):
+        """Render a worksheet document model and return the PDF bytes"""
+        entries = model['entries']
+        if not isinstance(entries, list):
+            raise UnsupportedContent("the canvas renderer needs every question up front")
+
+        buffer = io.BytesIO()
+        self.canvas = canvas.Canvas(buffer, pagesize=(self.page_width, self.page_height), pageCompression=1)
+        self.forms = [] if copies > 1 else None
+        self._start_page()
+
+        gen = self.generator
+        normal = gen.styles['Normal']
+        self._centered(model_text("Mathematics Worksheet"), gen.title_style)
+        self._centered(model_text(model['subtitle']), gen.subtitle_style)
+        if pupil_label:
+            self._paragraph(self._wrap(model_text(pupil_label), normal, prefix="Name: "), normal)
+        self._paragraph(self._wrap(gen._info_text(model, model['num_questions']), normal), normal)
+        self._place(20)
+        self._paragraph(self._wrap("Instructions: Circle the correct answer for each question below.", normal), normal)
+        self._place(20)
+
+        for entry in entries:
+            if self.deadline is not None:
+                self.deadline.check()
+            self._question_block(entry)
+
+        self._place(30)
+        self._paragraph(self._wrap(f"Generated on: {model['date']} | UK Curriculum Aligned", normal), normal)
+
+        self._end_page()
+        if self.forms is not None:
+            for _ in range(copies):
+                for name in self.forms:
+                    self.canvas.doForm(name)
+                    self.canvas.showPage()
+        self.canvas.save()
+        return buffer.getvalue()
+
+    def _question_block(self, entry):
+        """Draw one question, its diagram and its options, flowing them like the platypus story"""
+        question_style = self.generator.question_style
+        fragment = self._fragment(entry)
+
+        # The question number is the only part of a fragment that varies by worksheet
+        prefix = f"Question {entry['number']}: "
+        question_lines = [(prefix if index == 0 else '', line) for index, (_, line) in enumerate(fragment['question'])]
+
+        self._paragraph(question_lines, question_style)
+        if entry.get('diagram'):
+            y = self._place(fragment['diagram_height'], space_after=DIAGRAM_SPACE_AFTER)
+            draw_diagram(self.canvas, entry['diagram'], self.left + question_style.leftIndent, y)
+        for lines in fragment['options']:
+            self._paragraph(lines, self.generator.option_style)
+        self._place(10)
+
+    def _fragment(self, entry):
+        """Get a question's wrapped lines, from the fragment cache when possible
+
+        Bold digits share one width, so the wrap only depends on how many
+        digits the question number has, which is part of the key.
+        """
+        question_style = self.generator.question_style
+        option_style = self.generator.option_style
+        cache = getattr(self.generator, 'fragment_cache', None)
+
+        key = None
+        source = (entry['question'], tuple(entry['options']), entry.get('diagram'))
+        if cache is not None and entry.get('id'):
+            key = (entry['id'], len(str(entry['number'])), self.frame_width, self.generator.TEMPLATE_VERSION)
+            fragment = cache.get(key, source)
+            if fragment is not None:
+                return fragment
+
+        question_lines = self._wrap(
+            model_text(entry['question']), question_style, prefix=f"Question {entry['number']}: "
+        )
+        option_lines = [
+            self._wrap(model_text(option), option_style, prefix=f"{letter}. ")
+            for letter, option in entry['options']
+        ]
+        fragment = {
+            'source': source,
+            'question': question_lines,
+            'options': option_lines,
+            'diagram_height': diagram_size(entry['diagram'])[1] if entry.get('diagram') else 0
+        }
+        if key is not None:
+            cache.set(key, fragment)
+        return fragment
+
+    def _centered(self, text, style):
+        """Draw a single centred heading line"""
+        if stringWidth(text, style.fontName, style.fontSize) > self.frame_width:
+            raise UnsupportedContent("heading does not fit on one line")
+
+        y = self._place(style.leading, style.spaceBefore, style.spaceAfter)
+        self.canvas.setFillColor(style.textColor)
+        self.canvas.setFont(style.fontName, style.fontSize)
+        self.canvas.drawCentredString(self.left + self.frame_width / 2, y + style.leading - style.fontSize, text)
+
+    def _space_before(self, space):
+        """Space a flowable needs above it: none at the top of a page, less the previous spaceAfter elsewhere"""
+        return 0 if self.at_top else max(space - self.space_after, 0)
+
+    def _place(self, height, space_before=0, space_after=0):
+        """Reserve room for an item that cannot split, on a new page if needed; returns its bottom edge"""
+        if self.y - self._space_before(space_before) - height < self.bottom - FIT_TOLERANCE:
+            if self.at_top:
+                raise UnsupportedContent("an item is taller than the page")
+            self._new_page()
+        y = self.y - self._space_before(space_before) - height
+        self.y = y - space_after
+        self.space_after = space_after
+        self.at_top = False
+        return y
+
+    def _paragraph(self, lines, style):
+        """Draw wrapped lines, splitting them across pages the way platypus splits a paragraph"""
+        while True:
+            room = self.y - self._space_before(style.spaceBefore) - self.bottom
+            fits = max(int(room / style.leading), 0) if len(lines) * style.leading > room + FIT_TOLERANCE else len(lines)
+            # Platypus will not leave a single line behind, so that moves on with the rest
+            if fits <= 1 and fits < len(lines):
+                if self.at_top:
+                    raise UnsupportedContent("a line is taller than the page")
+                self._new_page()
+                continue
+            y = self._place(fits * style.leading, style.spaceBefore, style.spaceAfter)
+            self._lines(lines[:fits], style, y + fits * style.leading)
+            lines = lines[fits:]
+            if not lines:
+                return
+            self._new_page()
+
+    def _lines(self, lines, style, top):
+        """Draw wrapped lines of (prefix, text) at the style's indent, downwards from top"""
+        self.canvas.setFillColor(style.textColor)
+        x = self.left + style.leftIndent
+        for index, (prefix, text) in enumerate(lines):
+            baseline = top - index * style.leading - style.fontSize
+            offset = 0
+            if prefix:
+                bold = BOLD_FONTS.get(style.fontName, style.fontName)
+                self.canvas.setFont(bold, style.fontSize)
+                self.canvas.drawString(x, baseline, prefix)
+                offset = stringWidth(prefix, bold, style.fontSize)
+            self.canvas.setFont(style.fontName, style.fontSize)
+            self.canvas.drawString(x + offset, baseline, text)
+
+    def _wrap(self, text, style, prefix=''):
+        """Greedy word wrap using font metrics; returns a list of (prefix, text) lines
+
+        The bold prefix is only on the first line, which is narrowed to
+        make room for it; when even the first word does not fit beside it,
+        the prefix gets a line of its own, as in platypus.
+        """
+        width = self.frame_width - style.leftIndent - style.rightIndent
+        bold = BOLD_FONTS.get(style.fontName, style.fontName)
+        space = stringWidth(' ', style.fontName, style.fontSize)
+
+        lines = []
+        current = []
+        available = width - stringWidth(prefix, bold, style.fontSize)
+        used = 0
+        for word in text.split():
+            word_width = stringWidth(word, style.fontName, style.fontSize)
+            if word_width > width:
+                raise UnsupportedContent("a word is wider than the page")
+            needed = word_width + (space if current else 0)
+            # With nothing on the line yet this only trips on the first word after a prefix
+            if used + needed > available:
+                lines.append(' '.join(current))
+                current, used, available = [word], word_width, width
+            else:
+                current.append(word)
+                used += needed
+        lines.append(' '.join(current))
+
+        return [(prefix if index == 0 else '', line) for index, line in enumerate(lines)]
+
+    def _new_page(self):
+        """Finish the current page and move to the top of the next"""
+        self._end_page()
+        self._start_page()
+
+    def _start_page(self):
+        """Begin a page, or the form holding it when drawing copies"""
+        if self.forms is not None:
+            self.forms.append(f"page{len(self.forms) + 1}")
+            self.canvas.beginForm(self.forms[-1])
+        self.y = self.top
+        self.at_top = True
+        self.space_after = 0
+
+    def _end_page(self):
+        """Finish the current page or page form"""
+        if self.forms is not None:
+            self.canvas.endForm()
+        else:
+            self.canvas.showPage()
+
+def model_text(value):
+    """Return text as platypus would show it, or refuse text that platypus treats as markup"""
+    text = str(value)
+    if '<' in text or '&' in text:
+        raise UnsupportedContent("text contains markup")
+    return text
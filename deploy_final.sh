@@ -93,6 +93,12 @@ pip install -r requirements_final.txt
 # Copy application files
 log "📋 Copying application files..."
 cp final_app.py $APP_DIR/
+cp render_cache.py $APP_DIR/
+cp render_estimate.py $APP_DIR/
+cp render_pool.py $APP_DIR/
+cp diagrams.py $APP_DIR/
+cp zip_bundle.py $APP_DIR/
+cp artifact_retention.py $APP_DIR/
 cp gunicorn_final.conf.py $APP_DIR/
 cp nginx_final.conf /etc/nginx/sites-available/$APP_NAME
 cp templates/index.html $APP_DIR/templates/
@@ -110,6 +116,10 @@ R2_ACCOUNT_ID=your_account_id_here
 R2_ACCESS_KEY_ID=your_access_key_here
 R2_SECRET_ACCESS_KEY=your_secret_key_here
 
+# Local PDF fallback retention (files expire after the TTL; the directory is capped at the quota)
+LOCAL_PDF_TTL_HOURS=24
+LOCAL_PDF_CACHE_MB=1024
+
 # Database Configuration
 DATABASE_PATH=$APP_DIR/questions.db
 
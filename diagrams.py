@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Vector diagrams for geometry questions
+A question may carry a 'diagram' dict from a small vocabulary (regular
+polygons, circles, rectangles, angles and coordinate grids). Each distinct
+diagram is built into a reportlab Drawing once per process and drawn into
+each PDF once as a form XObject, so a shape that appears on every page or
+in every worksheet costs one drawing and one reference per use. A grid's
+labelled point is drawn over a form of the bare grid, so every point on
+the same grid shares it. HTML previews get the same drawing as inline SVG.
+"""
+
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from reportlab.graphics import renderPDF, renderSVG
+from reportlab.graphics.shapes import Circle, Drawing, Group, Line, Polygon, Rect, String, Wedge
+from reportlab.lib import colors
+from reportlab.platypus import Flowable
+
+# Diagram kinds and the parameters each one takes
+DIAGRAM_KINDS = {
+    'polygon': ('sides',),
+    'circle': (),
+    'rectangle': (),
+    'angle': ('degrees',),
+    'grid': ('size', 'point', 'label')
+}
+
+# Side of the square a shape or angle diagram is drawn in, in points
+SHAPE_SIZE = 80
+
+# Grid squares are this many points wide, inside a margin for the axis numbers
+GRID_CELL = 18
+GRID_MARGIN = 14
+
+# Most distinct Drawings kept in memory per process
+MAX_CACHED_DRAWINGS = 1000
+
+_drawings = OrderedDict()
+_drawings_lock = threading.Lock()
+
+def diagram_key(diagram):
+    """Stable short key for a diagram's parameters, used to name its form"""
+    payload = json.dumps(diagram, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def get_drawing(diagram):
+    """Get the Drawing for a diagram, building it the first time it is seen"""
+    key = diagram_key(diagram)
+    with _drawings_lock:
+        drawing = _drawings.get(key)
+        if drawing is not None:
+            _drawings.move_to_end(key)
+            return drawing
+
+    drawing = build_drawing(diagram)
+    with _drawings_lock:
+        _drawings[key] = drawing
+        while len(_drawings) > MAX_CACHED_DRAWINGS:
+            _drawings.popitem(last=False)
+    return drawing
+
+def build_drawing(diagram):
+    """Build a Drawing from a diagram dict; ValueError for an unknown kind"""
+    kind = diagram.get('kind')
+    if kind not in DIAGRAM_KINDS:
+        raise ValueError(f"Unknown diagram kind: {kind!r}")
+
+    if kind == 'grid':
+        return _grid_drawing(diagram['size'])
+
+    drawing = Drawing(SHAPE_SIZE, SHAPE_SIZE)
+    centre = SHAPE_SIZE / 2
+    radius = SHAPE_SIZE / 2 - 4
+    style = {'strokeColor': colors.black, 'strokeWidth': 1.5, 'fillColor': colors.lightblue}
+
+    if kind == 'polygon':
+        sides = int(diagram['sides'])
+        # Odd shapes start at the top vertex and even ones half a side round, so all sit on a flat base
+        start = math.pi / 2 + (math.pi / sides if sides % 2 == 0 else 0)
+        points = []
+        for i in range(sides):
+            theta = start + 2 * math.pi * i / sides
+            points.extend([centre + radius * math.cos(theta), centre + radius * math.sin(theta)])
+        drawing.add(Polygon(points, **style))
+    elif kind == 'circle':
+        drawing.add(Circle(centre, centre, radius, **style))
+    elif kind == 'rectangle':
+        drawing.add(Rect(4, SHAPE_SIZE / 4, SHAPE_SIZE - 8, SHAPE_SIZE / 2, **style))
+    elif kind == 'angle':
+        degrees = float(diagram['degrees'])
+        vertex_x = 10 if degrees < 120 else centre
+        length = SHAPE_SIZE - vertex_x - 4
+        theta = math.radians(degrees)
+        drawing.add(Wedge(vertex_x, 10, 16, 0, degrees, fillColor=colors.lightblue, strokeColor=None))
+        drawing.add(Line(vertex_x, 10, vertex_x + length, 10, strokeWidth=1.5))
+        drawing.add(Line(
+            vertex_x, 10, vertex_x + length * math.cos(theta), 10 + length * math.sin(theta), strokeWidth=1.5
+        ))
+
+    return drawing
+
+def _grid_drawing(size):
+    """Square coordinate grid from 0 to size on both axes"""
+    margin = GRID_MARGIN
+    extent = size * GRID_CELL
+    drawing = Drawing(extent + margin + 12, extent + margin + 12)
+
+    for i in range(size + 1):
+        offset = margin + i * GRID_CELL
+        drawing.add(Line(offset, margin, offset, margin + extent, strokeColor=colors.lightgrey, strokeWidth=0.5))
+        drawing.add(Line(margin, offset, margin + extent, offset, strokeColor=colors.lightgrey, strokeWidth=0.5))
+        drawing.add(String(offset, 2, str(i), fontName='Helvetica', fontSize=7, textAnchor='middle'))
+        drawing.add(String(4, offset - 2, str(i), fontName='Helvetica', fontSize=7, textAnchor='middle'))
+
+    drawing.add(Line(margin, margin, margin + extent, margin, strokeWidth=1))
+    drawing.add(Line(margin, margin, margin, margin + extent, strokeWidth=1))
+    return drawing
+
+def draw_diagram(canv, diagram, x, y):
+    """Draw a diagram with its lower-left corner at (x, y)
+
+    The first use in a document draws it into a form XObject named after
+    its key; every use, including the first, is a reference to the form.
+    """
+    base = _base_diagram(diagram)
+    drawing = get_drawing(base)
+    name = 'diagram_' + diagram_key(base)
+    if not canv.hasForm(name):
+        canv.beginForm(name, upperx=drawing.width, uppery=drawing.height)
+        renderPDF.draw(drawing, canv, 0, 0)
+        canv.endForm()
+
+    canv.saveState()
+    canv.translate(x, y)
+    canv.doForm(name)
+    if diagram['kind'] == 'grid':
+        point_x = GRID_MARGIN + diagram['point'][0] * GRID_CELL
+        point_y = GRID_MARGIN + diagram['point'][1] * GRID_CELL
+        canv.setFillColor(colors.darkred)
+        canv.circle(point_x, point_y, 3, stroke=0, fill=1)
+        canv.setFont('Helvetica-Bold', 9)
+        canv.drawString(point_x + 4, point_y + 4, diagram.get('label', ''))
+    canv.restoreState()
+
+def diagram_svg(diagram):
+    """Inline SVG markup for a diagram, as drawn in the PDF, for HTML previews"""
+    base = _base_diagram(diagram)
+    drawing = get_drawing(base)
+    if diagram['kind'] == 'grid':
+        # The cached grid is shared, so the point goes on a new drawing over it
+        point_x = GRID_MARGIN + diagram['point'][0] * GRID_CELL
+        point_y = GRID_MARGIN + diagram['point'][1] * GRID_CELL
+        marked = Drawing(drawing.width, drawing.height)
+        marked.add(Group(*drawing.contents))
+        marked.add(Circle(point_x, point_y, 3, fillColor=colors.darkred, strokeColor=None))
+        marked.add(String(point_x + 4, point_y + 4, diagram.get('label', ''), fontName='Helvetica-Bold', fontSize=9))
+        drawing = marked
+
+    svg = renderSVG.drawToString(drawing)
+    # Drop the XML prologue, and give the clip path an ID of its own so
+    # several diagrams can share one HTML page
+    clip = 'clip-' + diagram_key(diagram)
+    svg = svg[svg.index('<svg'):]
+    return svg.replace('id="clip"', f'id="{clip}"').replace('url(#clip)', f'url(#{clip})')
+
+def _base_diagram(diagram):
+    """The part of a diagram shared by a form: a grid without its point, or the whole shape"""
+    if diagram.get('kind') == 'grid':
+        return {'kind': 'grid', 'size': diagram['size']}
+    return diagram
+
+def diagram_size(diagram):
+    """Width and height of a diagram in points"""
+    drawing = get_drawing(_base_diagram(diagram))
+    return drawing.width, drawing.height
+
+class DiagramFlowable(Flowable):
+    """Platypus flowable for a question diagram, indented like the question text"""
+
+    def __init__(self, diagram, indent=0, space_after=6):
+        super().__init__()
+        self.diagram = diagram
+        self.indent = indent
+        self.spaceAfter = space_after
+
+    def wrap(self, available_width, available_height):
+        width, height = diagram_size(self.diagram)
+        return self.indent + width, height
+
+    def draw(self):
+        draw_diagram(self.canv, self.diagram, self.indent, 0)
@@ -8,7 +8,7 @@ Cost: £0-£2/month for 500,000+ users
 import os
 import sqlite3
 import json
-import tempfile
+import io
 import shutil
 import subprocess
 import threading
@@ -18,7 +18,7 @@ import pickle
 from datetime import datetime, timedelta
 from collections import defaultdict, OrderedDict
 from functools import wraps
-from flask import Flask, request, jsonify, render_template, send_file, abort
+from flask import Flask, request, jsonify, render_template, send_file, send_from_directory, abort
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -32,6 +32,11 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 import boto3
 from botocore.exceptions import ClientError
+from artifact_retention import ArtifactRetention
+from render_cache import RenderCache
+from render_estimate import RenderEstimator
+from render_pool import RenderDeadline, RenderTimeoutError
+from zip_bundle import stream_zip
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -276,34 +281,34 @@ class R2StorageManager:
             self.storage_available = False
             logging.warning("R2 credentials not configured, using local storage")
         
-        # Local cache directory
+        # Local cache directory, with files expired and evicted in the background
         self.local_cache_dir = '/tmp/pdf_cache'
         os.makedirs(self.local_cache_dir, exist_ok=True)
+        self.retention = ArtifactRetention(
+            self.local_cache_dir,
+            ttl_seconds=float(os.getenv('LOCAL_PDF_TTL_HOURS', 24)) * 3600,
+            max_size_mb=int(os.getenv('LOCAL_PDF_CACHE_MB', 1024))
+        )
     
-    def upload_pdf(self, file_path, user_id, subject, topic):
-        """Upload PDF to R2 storage"""
+    def upload_pdf(self, pdf_data, user_id, subject, topic, kind='worksheet', extension='pdf',
+                   content_type='application/pdf'):
+        """Upload PDF bytes (or a ZIP bundle, given its extension and type) to R2 storage"""
         if not self.storage_available:
-            return self._local_fallback(file_path, user_id)
+            return self._local_fallback(pdf_data, user_id, kind, extension)
         
         try:
             # Generate filename
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"pdfs/{user_id}/{subject}/{topic}/{timestamp}.pdf"
+            filename = f"pdfs/{user_id}/{subject}/{topic}/{timestamp}_{kind}.{extension}"
             
-            # Compress PDF
-            compressed_path = self._compress_pdf(file_path)
-            
-            # Upload to R2
-            with open(compressed_path, 'rb') as file:
-                self.s3_client.upload_fileobj(
-                    file, 
-                    self.bucket_name, 
-                    filename,
-                    ExtraArgs={'ContentEncoding': 'gzip', 'ContentType': 'application/pdf'}
-                )
-            
-            # Clean up compressed file
-            os.remove(compressed_path)
+            # Compress and upload straight from memory
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=filename,
+                Body=gzip.compress(pdf_data),
+                ContentEncoding='gzip',
+                ContentType=content_type
+            )
             
             # Generate download URL
             download_url = f"https://{self.bucket_name}.r2.cloudflarestorage.com/{filename}"
@@ -313,25 +318,19 @@ class R2StorageManager:
             
         except Exception as e:
             logging.error(f"R2 upload failed: {e}")
-            return self._local_fallback(file_path, user_id)
+            return self._local_fallback(pdf_data, user_id, kind, extension)
     
-    def _compress_pdf(self, file_path):
-        """Compress PDF file"""
-        compressed_path = file_path + '.gz'
-        with open(file_path, 'rb') as f_in:
-            with gzip.open(compressed_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        return compressed_path
-    
-    def _local_fallback(self, file_path, user_id):
+    def _local_fallback(self, pdf_data, user_id, kind='worksheet', extension='pdf'):
         """Local storage fallback"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        local_filename = f"{user_id}_{timestamp}.pdf"
+        local_filename = f"{user_id}_{timestamp}_{kind}.{extension}"
         local_path = os.path.join(self.local_cache_dir, local_filename)
         
-        shutil.copy2(file_path, local_path)
+        with open(local_path, 'wb') as f:
+            f.write(pdf_data)
+        self.retention.register(local_path, len(pdf_data))
         logging.info(f"PDF stored locally: {local_path}")
-        return local_path
+        return f"/download/local/{local_filename}"
     
     def cleanup_old_files(self, days=7):
         """Clean up old files"""
@@ -356,7 +355,13 @@ r2_storage = R2StorageManager()
 
 # PDF Generator
 class PDFGenerator:
-    def __init__(self):
+    # Bump whenever the layout or styles change so cached renders are not reused
+    TEMPLATE_VERSION = 1
+    
+    def __init__(self, render_cache=None, render_timeout=20):
+        self.render_cache = render_cache
+        # Builds stop after this many seconds, inside gunicorn's 30s worker timeout
+        self.render_timeout = render_timeout
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
     
@@ -379,64 +384,96 @@ class PDFGenerator:
         ))
     
     def generate_worksheet(self, questions, subject, topic, year_group, difficulty):
-        """Generate PDF worksheet"""
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.close()
-        
-        doc = SimpleDocTemplate(temp_file.name, pagesize=A4)
-        story = []
-        
-        # Header
-        header_text = f"{subject.title()} - {topic.title()} - Year {year_group} - {difficulty.title()}"
-        story.append(Paragraph(header_text, self.styles['Title']))
-        story.append(Spacer(1, 20))
-        
-        # Questions
-        for i, question_data in enumerate(questions, 1):
-            # Question
-            question_text = f"Question {i}: {question_data['question']}"
-            story.append(Paragraph(question_text, self.styles['QuestionStyle']))
-            
-            # Options
-            for j, option in enumerate(question_data['options'], 1):
-                option_text = f"{chr(64+j)}. {option}"
-                story.append(Paragraph(option_text, self.styles['OptionStyle']))
-            
-            story.append(Spacer(1, 15))
-        
-        doc.build(story)
-        return temp_file.name
+        """Generate PDF worksheet, returning the PDF bytes"""
+        return self._generate(['worksheet'], questions, subject, topic, year_group, difficulty)[0]
     
     def generate_answer_key(self, questions, subject, topic, year_group, difficulty):
-        """Generate PDF answer key"""
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.close()
-        
-        doc = SimpleDocTemplate(temp_file.name, pagesize=A4)
-        story = []
-        
-        # Header
-        header_text = f"Answer Key - {subject.title()} - {topic.title()} - Year {year_group} - {difficulty.title()}"
-        story.append(Paragraph(header_text, self.styles['Title']))
-        story.append(Spacer(1, 20))
+        """Generate PDF answer key, returning the PDF bytes"""
+        return self._generate(['answer_key'], questions, subject, topic, year_group, difficulty)[0]
+    
+    def generate_worksheet_and_answer_key(self, questions, subject, topic, year_group, difficulty):
+        """Generate worksheet and answer key PDFs from one pass over the questions"""
+        return self._generate(['worksheet', 'answer_key'], questions, subject, topic, year_group, difficulty)
+    
+    def _generate(self, kinds, questions, subject, topic, year_group, difficulty):
+        """Render the requested documents, reusing cached bytes for identical content"""
+        metadata = [subject, topic, year_group, difficulty]
+        keys = [
+            self.render_cache.make_key(kind, self.TEMPLATE_VERSION, questions, metadata) if self.render_cache else None
+            for kind in kinds
+        ]
+        results = [self.render_cache.get(key) if key else None for key in keys]
+        
+        missing = [kind for kind, data in zip(kinds, results) if data is None]
+        if not missing:
+            return results
+        
+        # Checked after every flowable; RenderTimeoutError stops an oversized build
+        deadline = RenderDeadline(self.render_timeout)
+        stories = self._build_stories(missing, questions, subject, topic, year_group, difficulty)
+        for index, (kind, key) in enumerate(zip(kinds, keys)):
+            if results[index] is None:
+                buffer = io.BytesIO()
+                document = SimpleDocTemplate(buffer, pagesize=A4)
+                document.afterFlowable = lambda flowable: deadline.check()
+                document.build(stories[kind])
+                results[index] = buffer.getvalue()
+                if key:
+                    self.render_cache.set(key, results[index])
+        
+        return results
+    
+    def _build_stories(self, kinds, questions, subject, topic, year_group, difficulty):
+        """Build flowables for each requested kind in a single traversal of the questions"""
+        header_text = f"{subject.title()} - {topic.title()} - Year {year_group} - {difficulty.title()}"
+        worksheet = [Paragraph(header_text, self.styles['Title']), Spacer(1, 20)] if 'worksheet' in kinds else None
+        answer_key = [Paragraph(f"Answer Key - {header_text}", self.styles['Title']), Spacer(1, 20)] if 'answer_key' in kinds else None
         
-        # Answers
         for i, question_data in enumerate(questions, 1):
-            # Question and answer
-            answer_text = f"Question {i}: {question_data['correct_answer']}"
-            story.append(Paragraph(answer_text, self.styles['QuestionStyle']))
-            
-            # Explanation if available
-            if question_data.get('explanation'):
-                explanation_text = f"Explanation: {question_data['explanation']}"
-                story.append(Paragraph(explanation_text, self.styles['OptionStyle']))
+            if worksheet is not None:
+                # Question and options
+                question_text = f"Question {i}: {question_data['question']}"
+                worksheet.append(Paragraph(question_text, self.styles['QuestionStyle']))
+                
+                for j, option in enumerate(question_data['options'], 1):
+                    option_text = f"{chr(64+j)}. {option}"
+                    worksheet.append(Paragraph(option_text, self.styles['OptionStyle']))
+                
+                worksheet.append(Spacer(1, 15))
             
-            story.append(Spacer(1, 15))
-        
-        doc.build(story)
-        return temp_file.name
-
-pdf_generator = PDFGenerator()
+            if answer_key is not None:
+                # Answer and explanation if available
+                answer_text = f"Question {i}: {question_data['correct_answer']}"
+                answer_key.append(Paragraph(answer_text, self.styles['QuestionStyle']))
+                
+                if question_data.get('explanation'):
+                    explanation_text = f"Explanation: {question_data['explanation']}"
+                    answer_key.append(Paragraph(explanation_text, self.styles['OptionStyle']))
+                
+                answer_key.append(Spacer(1, 15))
+        
+        return {'worksheet': worksheet, 'answer_key': answer_key}
+
+# Rendered PDF cache shared by all workers through the disk tier
+render_cache = RenderCache(max_memory_mb=32, disk_dir='/tmp/render_cache', max_disk_mb=1024)
+pdf_generator = PDFGenerator(render_cache=render_cache)
+
+# Posted question lists are costed before rendering; renders happen on the
+# gunicorn worker, so anything predicted to take longer is refused
+render_estimator = RenderEstimator()
+MAX_RENDER_SECONDS = float(os.environ.get('MAX_RENDER_SECONDS', 5.0))
+
+def oversized_render(questions, answer_key=True):
+    """Error response for a question list too large to render in a request, or None"""
+    if not isinstance(questions, list) or not all(isinstance(question, dict) for question in questions):
+        return jsonify({'error': 'questions must be a list of questions'}), 400
+    estimate = render_estimator.estimate(questions, answer_key=answer_key)
+    if estimate['seconds'] > MAX_RENDER_SECONDS:
+        return jsonify({
+            'error': 'Too many questions to render at once, please split them into smaller worksheets',
+            'estimate': estimate
+        }), 413
+    return None
 
 # Backup Manager
 class BackupManager:
@@ -570,6 +607,8 @@ def dashboard():
             'storage': {
                 'r2_available': r2_storage.storage_available
             },
+            'local_retention': r2_storage.retention.get_stats(),
+            'render_cache': render_cache.get_stats(),
             'timestamp': datetime.now().isoformat()
         }
     
@@ -661,23 +700,55 @@ def generate_worksheet():
         
         if not questions:
             return jsonify({'error': 'No questions provided'}), 400
+        include_answer_key = data.get('include_answer_key', False) or data.get('bundle', False)
+        rejection = oversized_render(questions, answer_key=include_answer_key)
+        if rejection:
+            return rejection
         
-        # Generate PDF
-        pdf_path = pdf_generator.generate_worksheet(questions, subject, topic, year_group, difficulty)
-        
-        # Upload to R2
         user_id = request.remote_addr
-        download_url = r2_storage.upload_pdf(pdf_path, user_id, subject, topic)
         
-        # Clean up temp file
-        os.unlink(pdf_path)
+        # Clients that want the answer key too can ask for it here instead
+        # of re-posting the questions to /generate_answer_key
+        if not include_answer_key:
+            pdf_data = pdf_generator.generate_worksheet(questions, subject, topic, year_group, difficulty)
+            return jsonify({
+                'success': True,
+                'download_url': r2_storage.upload_pdf(pdf_data, user_id, subject, topic),
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        # Generate both PDFs from one pass over the questions
+        worksheet_data, answer_data = pdf_generator.generate_worksheet_and_answer_key(
+            questions, subject, topic, year_group, difficulty
+        )
         
+        # A bundle is one upload: both PDFs and a manifest in a stored ZIP
+        if data.get('bundle', False):
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            bundle_data = b''.join(stream_zip(
+                [(f"worksheet_{timestamp}.pdf", worksheet_data), (f"answer_key_{timestamp}.pdf", answer_data)],
+                {'generated': timestamp, 'subject': subject, 'topic': topic,
+                 'year_group': year_group, 'difficulty': difficulty, 'num_questions': len(questions)}
+            ))
+            return jsonify({
+                'success': True,
+                'bundle_url': r2_storage.upload_pdf(
+                    bundle_data, user_id, subject, topic, kind='bundle', extension='zip', content_type='application/zip'
+                ),
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        # Upload to R2
         return jsonify({
             'success': True,
-            'download_url': download_url,
+            'download_url': r2_storage.upload_pdf(worksheet_data, user_id, subject, topic),
+            'answer_key_url': r2_storage.upload_pdf(answer_data, user_id, subject, topic, kind='answer_key'),
             'timestamp': datetime.now().isoformat()
         })
     
+    except RenderTimeoutError:
+        error_monitor.log_error('render_timeout')
+        return jsonify({'error': 'Too many questions to render at once, please split them into smaller worksheets'}), 413
     except Exception as e:
         error_monitor.log_error('generate_worksheet')
         logging.error(f"Generate worksheet failed: {e}")
@@ -700,16 +771,16 @@ def generate_answer_key():
         
         if not questions:
             return jsonify({'error': 'No questions provided'}), 400
+        rejection = oversized_render(questions)
+        if rejection:
+            return rejection
         
         # Generate PDF
-        pdf_path = pdf_generator.generate_answer_key(questions, subject, topic, year_group, difficulty)
+        pdf_data = pdf_generator.generate_answer_key(questions, subject, topic, year_group, difficulty)
         
         # Upload to R2
         user_id = request.remote_addr
-        download_url = r2_storage.upload_pdf(pdf_path, user_id, subject, topic)
-        
-        # Clean up temp file
-        os.unlink(pdf_path)
+        download_url = r2_storage.upload_pdf(pdf_data, user_id, subject, topic, kind='answer_key')
         
         return jsonify({
             'success': True,
@@ -717,11 +788,24 @@ def generate_answer_key():
             'timestamp': datetime.now().isoformat()
         })
     
+    except RenderTimeoutError:
+        error_monitor.log_error('render_timeout')
+        return jsonify({'error': 'Too many questions to render at once, please split them into smaller answer keys'}), 413
     except Exception as e:
         error_monitor.log_error('generate_answer_key')
         logging.error(f"Generate answer key failed: {e}")
         return jsonify({'error': 'Failed to generate answer key'}), 500
 
+@app.route('/download/local/<filename>')
+def download_local(filename):
+    """Serve a file kept in the local cache when R2 was unavailable
+    
+    These are the /download/local/ URLs handed out by the local storage
+    fallbacks. Files are sent with sendfile and answer If-None-Match and
+    Range requests, so resumed downloads only send what is missing.
+    """
+    return send_from_directory(r2_storage.local_cache_dir, filename, as_attachment=True, conditional=True, max_age=3600)
+
 @app.route('/backup', methods=['POST'])
 def trigger_backup():
     """Trigger manual backup"""
@@ -740,7 +824,8 @@ def cleanup_old_files():
     """Clean up old files"""
     try:
         r2_storage.cleanup_old_files(days=7)
-        return jsonify({'success': True, 'message': 'Cleanup completed'})
+        freed = r2_storage.retention.sweep()
+        return jsonify({'success': True, 'message': 'Cleanup completed', 'local_freed_mb': freed / (1024 * 1024)})
     except Exception as e:
         logging.error(f"Cleanup failed: {e}")
         return jsonify({'error': 'Cleanup failed'}), 500
@@ -773,5 +858,7 @@ cleanup_thread.start()
 backup_thread = threading.Thread(target=background_backup, daemon=True)
 backup_thread.start()
 
+r2_storage.retention.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
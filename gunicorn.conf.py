@@ -3,6 +3,7 @@
 
 import multiprocessing
 import os
+import sys
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -15,7 +16,11 @@ worker_connections = 1000  # High connection limit
 max_requests = 1000  # Restart workers periodically
 max_requests_jitter = 100  # Add randomness to restarts
 
-# Timeouts
+# Every worker owns a render pool; share the cores between them so the
+# server runs about one reportlab process per core, and at least one each
+os.environ.setdefault('RENDER_POOL_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+
+# Timeouts (render pool renders stop at RENDER_POOL_TIMEOUT, 25s, before this)
 timeout = 30
 keepalive = 2
 graceful_timeout = 30
@@ -53,3 +58,11 @@ worker_tmp_dir = "/dev/shm"  # Use RAM for temporary files
 
 # Health check
 check_config = True
+
+def post_worker_init(worker):
+    """Start the worker's render pool once it has forked and patched for gevent"""
+    # The preloaded app's pool is created here rather than in the master, so its
+    # locks are gevent's and its render processes belong to this worker
+    app_module = sys.modules.get('app')
+    if hasattr(app_module, 'start_render_pool'):
+        app_module.start_render_pool()
@@ -1,13 +1,115 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, LongTable, TableStyle, PageBreak
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from xml.sax.saxutils import escape
+from canvas_renderer import CanvasRenderer, FragmentCache, UnsupportedContent
+from pdf_merge import concatenate_pdfs, repeat_pdf
+from diagrams import DiagramFlowable, diagram_key, diagram_svg
+import io
 import os
+import tempfile
+
+class StreamingStory(list):
+    """Story list that pulls flowables from an iterator as the build consumes them
+    
+    SimpleDocTemplate.build checks len() before handling each flowable, so
+    topping up a small lookahead buffer there lets the first page be laid
+    out while later questions are still being produced.
+    """
+    
+    def __init__(self, flowables, lookahead=20):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+    
+    def __len__(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return list.__len__(self)
 
 class PDFGenerator:
-    def __init__(self):
+    # Bump whenever the layout or styles change so cached renders are not reused
+    TEMPLATE_VERSION = 1
+    
+    # Spooled renders move from memory to a temporary file above this size
+    SPILL_THRESHOLD = 8 * 1024 * 1024
+    
+    # Fewest pupils per render process when a class pack is split across the pool
+    CLASS_PACK_CHUNK = 8
+    
+    # Rows per answer key table; longer keys are a run of tables this size
+    ANSWER_TABLE_CHUNK = 100
+    
+    # HTML preview templates; every element is styled by class from the shared stylesheet
+    PREVIEW_STYLESHEET = (
+        '<style>'
+        '.qk-preview{font-family:Arial,sans-serif;max-width:800px;margin:0 auto;padding:20px}'
+        '.qk-preview h1{text-align:center;color:#2c3e50;margin-bottom:10px}'
+        '.qk-preview h2{text-align:center;color:#27ae60;margin-bottom:20px}'
+        '.qk-box{background-color:#f8f9fa;padding:15px;border-radius:5px;margin-bottom:20px}'
+        '.qk-instructions{background-color:#e8f4fd}'
+        '.qk-question{margin-bottom:20px;padding:15px;border:1px solid #ddd;border-radius:5px}'
+        '.qk-question .qk-stem{font-weight:bold;margin-bottom:10px}'
+        '.qk-question .qk-option{margin-left:20px;margin-bottom:5px}'
+        '.qk-question .qk-diagram{margin:0 0 10px 20px}'
+        '.qk-answers{width:100%;border-collapse:collapse;margin-bottom:20px}'
+        '.qk-answers th{background-color:#34495e;color:white}'
+        '.qk-answers th,.qk-answers td{padding:12px;text-align:left;border:1px solid #ddd}'
+        '.qk-answers tbody tr:nth-child(even){background-color:#f8f9fa}'
+        '.qk-answers .qk-number{font-weight:bold}'
+        '.qk-answers .qk-correct{color:#e74c3c;font-weight:bold}'
+        '.qk-footer{margin-top:30px}'
+        '.qk-footer p{text-align:center;color:#666}'
+        '</style>'
+    )
+    PREVIEW_HEADER = (
+        '<div class="qk-preview"><h1>{title}</h1><h2>{subtitle}</h2>'
+        '<div class="qk-box"><p><strong>Year Group:</strong> {year_group} | <strong>Difficulty:</strong> {difficulty} | '
+        '<strong>Questions:</strong> {num_questions}</p></div>'
+    )
+    PREVIEW_INSTRUCTIONS = (
+        '<div class="qk-box qk-instructions"><p><strong>Instructions:</strong> '
+        'Circle the correct answer for each question below.</p></div>'
+    )
+    PREVIEW_QUESTION = '<div class="qk-question"><p class="qk-stem">Question {number}: {question}</p>{diagram}{options}</div>'
+    PREVIEW_DIAGRAM = '<div class="qk-diagram">{svg}</div>'
+    PREVIEW_OPTION = '<p class="qk-option">{letter}. {option}</p>'
+    PREVIEW_TABLE_HEAD = (
+        '<table class="qk-answers"><thead><tr><th>Question</th><th>Correct Answer</th><th>Explanation</th></tr></thead><tbody>'
+    )
+    PREVIEW_ANSWER_ROW = '<tr><td class="qk-number">Question {number}</td><td class="qk-correct">{answer}</td><td>{explanation}</td></tr>'
+    PREVIEW_TABLE_FOOT = '</tbody></table>'
+    PREVIEW_FOOTER = '<div class="qk-box qk-footer"><p>{text} | UK Curriculum Aligned</p></div></div>'
+    
+    # Document kinds accepted by render_bytes and the story method for each
+    story_builders = {
+        'worksheet': '_worksheet_story',
+        'answer_key': '_answer_key_story',
+        'worksheet_model': '_worksheet_model_story',
+        'worksheet_compact': '_worksheet_compact_story',
+        'answer_key_model': '_answer_key_model_story',
+        'class_set_worksheets': '_class_set_story',
+        'class_set_answer_key': '_class_set_answer_story'
+    }
+    
+    # Worksheet backends: platypus flows paragraphs, canvas draws the fixed layout directly
+    RENDERERS = ('platypus', 'canvas')
+    
+    # Worksheet layouts: one option per line, or options packed into columns
+    LAYOUTS = ('standard', 'compact')
+    
+    def __init__(self, render_cache=None, render_pool=None):
+        self.render_cache = render_cache
+        self.render_pool = render_pool
+        self.fragment_cache = FragmentCache()
+        self.preview_fragments = FragmentCache()
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
     
@@ -54,6 +156,22 @@ class PDFGenerator:
             textColor=colors.black
         )
         
+        # Question style with the tighter spacing of the compact layout
+        self.compact_question_style = ParagraphStyle(
+            'CompactQuestion',
+            parent=self.question_style,
+            spaceBefore=8,
+            spaceAfter=4
+        )
+        
+        # Option style inside a compact layout's option columns
+        self.compact_option_style = ParagraphStyle(
+            'CompactOption',
+            parent=self.option_style,
+            leftIndent=0,
+            spaceAfter=0
+        )
+        
         # Answer style
         self.answer_style = ParagraphStyle(
             'Answer',
@@ -65,6 +183,14 @@ class PDFGenerator:
             backColor=colors.lightyellow
         )
         
+        # Answer key table cell style
+        self.answer_cell_style = ParagraphStyle(
+            'AnswerCell',
+            parent=self.styles['Normal'],
+            fontSize=10,
+            leading=12
+        )
+        
         # Explanation style
         self.explanation_style = ParagraphStyle(
             'Explanation',
@@ -76,92 +202,471 @@ class PDFGenerator:
             fontName='Helvetica-Oblique'
         )
 
-    def generate_worksheet(self, questions, subject, topic, year_group, difficulty, output_path):
-        """Generate a printable worksheet PDF"""
-        doc = SimpleDocTemplate(output_path, pagesize=A4)
-        story = []
+    def generate_worksheet(self, questions, subject, topic, year_group, difficulty, output_path, num_questions=None):
+        """Generate a printable worksheet PDF
+        
+        questions may be any iterable, such as QuestionBank.iter_questions.
+        A stream can end short of its requested size, so its question count
+        is printed in the footer once every question has been laid out;
+        num_questions is not needed for a stream.
+        """
+        if num_questions is None and isinstance(questions, (list, tuple)):
+            num_questions = len(questions)
+        
+        self._build('worksheet', (questions, subject, topic, year_group, difficulty, num_questions), output_path)
+
+    def render_worksheet(self, questions, subject, topic, year_group, difficulty, num_questions=None,
+                         renderer='platypus', copies=1, layout='standard'):
+        """Render a worksheet and return the PDF bytes
+        
+        renderer='canvas' uses the direct-canvas fast path for a question
+        list; streams always go through platypus. copies repeats the whole
+        worksheet for printing, laid out once whichever backend draws it:
+        the canvas backend draws each page once as a form XObject shared by
+        every copy, and platypus output is repeated with repeat_pdf, whose
+        extra copies are page objects sharing the first copy's content
+        streams. layout='compact' packs options into columns; only platypus
+        draws it.
+        """
+        self._check_renderer(renderer, layout)
+        if num_questions is None and isinstance(questions, (list, tuple)):
+            num_questions = len(questions)
+        
+        if (copies > 1 or layout == 'compact') and not isinstance(questions, (list, tuple)):
+            questions = list(questions)
         
+        if layout == 'compact':
+            model = self._document_model(questions, subject, topic, year_group, difficulty, num_questions)
+            return repeat_pdf(self._render('worksheet_compact', (model,)), copies)
+        
+        if renderer == 'canvas' and isinstance(questions, (list, tuple)):
+            model = self._document_model(questions, subject, topic, year_group, difficulty, num_questions)
+            return self._render('worksheet_canvas', (model, None, copies))
+        
+        data = self._render('worksheet', (questions, subject, topic, year_group, difficulty, num_questions))
+        return repeat_pdf(data, copies)
+
+    def _worksheet_story(self, questions, subject, topic, year_group, difficulty, num_questions, pupil_label=None):
+        """Yield worksheet flowables, consuming questions one at a time"""
+        model = self._document_model(questions, subject, topic, year_group, difficulty, num_questions)
+        return self._worksheet_model_story(model, pupil_label)
+
+    def _worksheet_compact_story(self, model, pupil_label=None):
+        """Yield compact worksheet flowables, with options in columns"""
+        return self._worksheet_model_story(model, pupil_label, compact=True)
+
+    def _worksheet_model_story(self, model, pupil_label=None, compact=False):
+        """Yield worksheet flowables from a document model"""
         # Header
-        title = Paragraph(f"Mathematics Worksheet", self.title_style)
-        story.append(title)
+        yield Paragraph(f"Mathematics Worksheet", self.title_style)
+        yield Paragraph(model['subtitle'], self.subtitle_style)
         
-        subtitle = Paragraph(f"{subject.title()} - {topic.replace('_', ' ').title()}", self.subtitle_style)
-        story.append(subtitle)
+        if pupil_label:
+            yield Paragraph(f"<b>Name:</b> {escape(pupil_label)}", self.styles['Normal'])
         
-        # Worksheet info
-        info_text = f"Year Group: {year_group} | Difficulty: {difficulty} | Questions: {len(questions)}"
-        info_para = Paragraph(info_text, self.styles['Normal'])
-        story.append(info_para)
-        story.append(Spacer(1, 20))
+        # Worksheet info; a stream may end early, so its count waits for the footer
+        streamed = not isinstance(model['entries'], list)
+        yield Paragraph(self._info_text(model, None if streamed else model['num_questions']), self.styles['Normal'])
+        yield Spacer(1, 20)
         
         # Instructions
-        instructions = Paragraph(
+        yield Paragraph(
             "Instructions: Circle the correct answer for each question below.",
             self.styles['Normal']
         )
-        story.append(instructions)
-        story.append(Spacer(1, 20))
+        yield Spacer(1, 20)
         
         # Questions
-        for i, question in enumerate(questions, 1):
+        num_questions = 0
+        for entry in model['entries']:
+            num_questions += 1
             # Question text
-            question_text = f"<b>Question {i}:</b> {question['question']}"
-            question_para = Paragraph(question_text, self.question_style)
-            story.append(question_para)
+            question_text = f"<b>Question {entry['number']}:</b> {entry['question']}"
+            yield Paragraph(question_text, self.compact_question_style if compact else self.question_style)
+            
+            # Diagram, drawn once per document as a shared form
+            if entry['diagram']:
+                yield DiagramFlowable(entry['diagram'], indent=self.question_style.leftIndent)
             
             # Options
-            for j, option in enumerate(question['options']):
-                option_text = f"<b>{chr(65 + j)}.</b> {option}"
-                option_para = Paragraph(option_text, self.option_style)
-                story.append(option_para)
+            if compact:
+                yield self._option_columns(entry['options'])
+            else:
+                for letter, option in entry['options']:
+                    option_text = f"<b>{letter}.</b> {option}"
+                    yield Paragraph(option_text, self.option_style)
             
-            story.append(Spacer(1, 10))
+            yield Spacer(1, 4 if compact else 10)
         
         # Footer
-        story.append(Spacer(1, 30))
-        footer = Paragraph(
-            f"Generated on: {self._get_current_date()} | UK Curriculum Aligned",
+        yield Spacer(1, 30)
+        if streamed:
+            yield Paragraph(f"Questions: {num_questions}", self.styles['Normal'])
+        yield Paragraph(
+            f"Generated on: {model['date']} | UK Curriculum Aligned",
             self.styles['Normal']
         )
-        story.append(footer)
+
+    def _option_columns(self, options):
+        """Lay a question's options out in 4, 2 or 1 columns, the most that fit on one line each
         
-        # Build PDF
-        doc.build(story)
+        Widths are measured with the standard font metrics, so short
+        numeric options share a row instead of taking a line each.
+        """
+        style = self.compact_option_style
+        bold_font = 'Helvetica-Bold'
+        width = A4[0] - 2 * inch - 12 - self.option_style.leftIndent
+        widest = max(
+            stringWidth(f"{letter}. ", bold_font, style.fontSize) + stringWidth(str(option), style.fontName, style.fontSize)
+            for letter, option in options
+        )
+        
+        columns = 1
+        for candidate in (4, 2):
+            if candidate <= len(options) and widest + 12 <= width / candidate:
+                columns = candidate
+                break
+        
+        cells = [Paragraph(f"<b>{letter}.</b> {option}", style) for letter, option in options]
+        cells += [''] * (-len(cells) % columns)
+        rows = [cells[start:start + columns] for start in range(0, len(cells), columns)]
+        
+        # Right-aligning the table keeps the options' usual indent
+        table = Table(rows, colWidths=[width / columns] * columns, hAlign='RIGHT')
+        table.setStyle(TableStyle([
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 12),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), self.option_style.spaceAfter),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP')
+        ]))
+        return table
 
     def generate_answer_key(self, questions, subject, topic, year_group, difficulty, output_path):
-        """Generate an answer key PDF"""
-        doc = SimpleDocTemplate(output_path, pagesize=A4)
-        story = []
+        """Generate an answer key PDF
         
+        questions may be any iterable; it is consumed once.
+        """
+        self._build('answer_key', (questions, subject, topic, year_group, difficulty), output_path)
+
+    def render_answer_key(self, questions, subject, topic, year_group, difficulty):
+        """Render an answer key and return the PDF bytes"""
+        return self._render('answer_key', (questions, subject, topic, year_group, difficulty))
+
+    def render_worksheet_and_answer_key(self, questions, subject, topic, year_group, difficulty,
+                                        renderer='platypus', copies=1, layout='standard', deadline=None):
+        """Render a worksheet and its answer key in one call, returning both as bytes
+        
+        The questions are walked once into a document model that both
+        layouts consume; with a render pool the two builds run in parallel
+        on separate workers. renderer, copies and layout shape the worksheet
+        as in render_worksheet; there is one answer key. An optional
+        RenderDeadline stops the builds with RenderTimeoutError or
+        RenderCancelledError.
+        """
+        self._check_renderer(renderer, layout)
+        model = self._document_model(list(questions), subject, topic, year_group, difficulty)
+        if layout == 'compact':
+            worksheet_job = ('worksheet_compact', (model,))
+        elif renderer == 'canvas':
+            worksheet_job = ('worksheet_canvas', (model, None, copies))
+        else:
+            worksheet_job = ('worksheet_model', (model,))
+        worksheet_pdf, answer_pdf = self._render_many([worksheet_job, ('answer_key_model', (model,))], deadline)
+        if worksheet_job[0] != 'worksheet_canvas':
+            worksheet_pdf = repeat_pdf(worksheet_pdf, copies)
+        return worksheet_pdf, answer_pdf
+    
+    def _check_renderer(self, renderer, layout='standard'):
+        """Reject an unknown worksheet backend or layout name"""
+        if renderer not in self.RENDERERS:
+            raise ValueError(f"renderer must be one of: {', '.join(self.RENDERERS)}")
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"layout must be one of: {', '.join(self.LAYOUTS)}")
+
+    def _answer_key_story(self, questions, subject, topic, year_group, difficulty):
+        """Build the answer key flowables"""
+        return self._answer_key_model_story(self._document_model(questions, subject, topic, year_group, difficulty))
+
+    def _answer_key_model_story(self, model):
+        """Yield the answer key flowables from a document model
+        
+        The answer table is produced in chunks as the build reaches it, so
+        a key for an entire topic never holds every row at once.
+        """
         # Header
-        title = Paragraph(f"Answer Key", self.title_style)
-        story.append(title)
+        yield Paragraph(f"Answer Key", self.title_style)
+        yield Paragraph(model['subtitle'], self.subtitle_style)
         
-        subtitle = Paragraph(f"{subject.title()} - {topic.replace('_', ' ').title()}", self.subtitle_style)
-        story.append(subtitle)
+        # Worksheet info; a stream's count waits for the summary
+        streamed = not isinstance(model['entries'], list)
+        yield Paragraph(self._info_text(model, None if streamed else len(model['entries'])), self.styles['Normal'])
+        yield Spacer(1, 20)
         
-        # Worksheet info
-        info_text = f"Year Group: {year_group} | Difficulty: {difficulty} | Questions: {len(questions)}"
-        info_para = Paragraph(info_text, self.styles['Normal'])
-        story.append(info_para)
-        story.append(Spacer(1, 20))
+        # Answer tables
+        num_questions = 0
+        for table, num_rows in self._answer_tables(model['entries']):
+            num_questions += num_rows
+            yield table
+        yield Spacer(1, 20)
         
-        # Answer table
-        answer_data = [['Question', 'Correct Answer', 'Explanation']]
+        # Summary
+        summary_text = f"Total Questions: {num_questions} | Subject: {model['subject']} | Topic: {model['topic']}"
+        yield Paragraph(summary_text, self.styles['Normal'])
         
+        # Footer
+        yield Spacer(1, 20)
+        yield Paragraph(
+            f"Answer Key Generated on: {model['date']} | UK Curriculum Aligned",
+            self.styles['Normal']
+        )
+
+    def _document_model(self, questions, subject, topic, year_group, difficulty, num_questions=None):
+        """Build the intermediate representation shared by the worksheet and answer key
+        
+        Header text, the date and each question's lettered options and
+        answer line are worked out once here. Entries stay lazy for a
+        question stream; for a list they are computed up front so several
+        layouts can share them.
+        """
+        entries = self._question_entries(questions)
+        if isinstance(questions, (list, tuple)):
+            entries = list(entries)
+            if num_questions is None:
+                num_questions = len(entries)
+        
+        return {
+            'subject': subject.title(),
+            'topic': topic.replace('_', ' ').title(),
+            'subtitle': f"{subject.title()} - {topic.replace('_', ' ').title()}",
+            'year_group': year_group,
+            'difficulty': difficulty,
+            'num_questions': num_questions,
+            'date': self._get_current_date(),
+            'entries': entries
+        }
+
+    def _question_entries(self, questions):
+        """Yield the layout-ready form of each question"""
         for i, question in enumerate(questions, 1):
             # Find the letter of the correct answer
             correct_index = question['options'].index(question['correct_answer'])
-            correct_letter = chr(65 + correct_index)
             
-            answer_data.append([
-                f"Question {i}",
-                f"{correct_letter}. {question['correct_answer']}",
-                question['explanation']
+            yield {
+                'id': question.get('id'),
+                'number': i,
+                'question': question['question'],
+                'options': [(chr(65 + j), option) for j, option in enumerate(question['options'])],
+                'diagram': question.get('diagram'),
+                'answer': f"{chr(65 + correct_index)}. {question['correct_answer']}",
+                'explanation': question['explanation']
+            }
+
+    def _info_text(self, model, num_questions):
+        """Format the year group, difficulty and question count line; None leaves the count out"""
+        info_text = f"Year Group: {model['year_group']} | Difficulty: {model['difficulty']}"
+        if num_questions is None:
+            return info_text
+        return f"{info_text} | Questions: {num_questions}"
+
+    def generate_class_set(self, worksheets, subject, topic, year_group, difficulty, worksheet_path, answer_path):
+        """Generate one worksheet PDF for a whole class and a combined answer key
+        
+        worksheets is a list of (pupil_label, questions). Each pupil starts
+        on a new page; the answer key has one section per pupil.
+        """
+        worksheet_pdf, answer_pdf = self.render_class_set(worksheets, subject, topic, year_group, difficulty)
+        for path, data in ((worksheet_path, worksheet_pdf), (answer_path, answer_pdf)):
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def render_class_set(self, worksheets, subject, topic, year_group, difficulty, deadline=None):
+        """Render a class set, returning (worksheet bytes, answer key bytes)
+        
+        With a render pool the pupils are split into chunks that render on
+        separate workers alongside the answer key, and the chunks are
+        concatenated into one class pack. deadline is as for
+        render_worksheet_and_answer_key.
+        """
+        worksheets = list(worksheets)
+        details = (subject, topic, year_group, difficulty)
+        
+        chunk_size = len(worksheets) or 1
+        if self.render_pool is not None:
+            chunk_size = max(self.CLASS_PACK_CHUNK, -(-len(worksheets) // self.render_pool.max_workers))
+        chunks = [worksheets[start:start + chunk_size] for start in range(0, len(worksheets), chunk_size)] or [worksheets]
+        
+        jobs = [('class_set_worksheets', (chunk,) + details) for chunk in chunks]
+        jobs.append(('class_set_answer_key', (worksheets,) + details))
+        rendered = self._render_many(jobs, deadline)
+        return concatenate_pdfs(rendered[:-1]), rendered[-1]
+
+    def _class_set_story(self, worksheets, subject, topic, year_group, difficulty):
+        """Yield the class set worksheets: one build, one page break per pupil
+        
+        Each pupil's flowables are produced only when the build reaches
+        them, so the story never holds more than the lookahead.
+        """
+        for index, (pupil_label, questions) in enumerate(worksheets):
+            if index:
+                yield PageBreak()
+            model = self._document_model(questions, subject, topic, year_group, difficulty)
+            yield from self._worksheet_model_story(model, pupil_label=pupil_label)
+
+    def _class_set_answer_story(self, worksheets, subject, topic, year_group, difficulty):
+        """Yield the combined class set answer key indexed by pupil"""
+        yield Paragraph(f"Class Set Answer Key", self.title_style)
+        yield Paragraph(f"{subject.title()} - {topic.replace('_', ' ').title()}", self.subtitle_style)
+        yield Paragraph(
+            f"Year Group: {year_group} | Difficulty: {difficulty} | Pupils: {len(worksheets)}",
+            self.styles['Normal']
+        )
+        yield Spacer(1, 20)
+        
+        for pupil_label, questions in worksheets:
+            yield Paragraph(f"{escape(pupil_label)} ({len(questions)} questions)", self.styles['Heading3'])
+            for table, _ in self._answer_tables(self._question_entries(questions)):
+                yield table
+            yield Spacer(1, 20)
+        
+        yield Paragraph(
+            f"Answer Key Generated on: {self._get_current_date()} | UK Curriculum Aligned",
+            self.styles['Normal']
+        )
+
+    def render_bytes(self, kind, *args, deadline=None):
+        """Render a document in this process and return the PDF bytes
+        
+        kind is a key of story_builders; args are the story method's
+        arguments, starting with the questions (or class set worksheets).
+        'worksheet_canvas' takes a document model and draws it directly,
+        falling back to platypus for content the canvas renderer refuses.
+        A RenderDeadline is checked after every flowable (or canvas
+        question block), so an oversized build stops instead of running on.
+        """
+        if kind == 'worksheet_canvas':
+            return self._canvas_worksheet(*args, deadline=deadline)
+        
+        buffer = io.BytesIO()
+        self._build_story(kind, args, buffer, deadline)
+        return buffer.getvalue()
+
+    def _canvas_worksheet(self, model, pupil_label=None, copies=1, deadline=None):
+        """Draw a worksheet with the canvas backend, or lay it out with platypus if it refuses"""
+        try:
+            return CanvasRenderer(self, deadline=deadline).render_worksheet(model, pupil_label, copies)
+        except UnsupportedContent:
+            pdf = self.render_bytes('worksheet_model', model, pupil_label, deadline=deadline)
+            return repeat_pdf(pdf, copies)
+
+    def render_spooled(self, kind, *args, spill_threshold=None):
+        """Render a document into a SpooledTemporaryFile, rewound for reading
+        
+        Small documents stay in memory; very large ones, such as long
+        streamed worksheets, spill to disk instead of growing a buffer.
+        """
+        if spill_threshold is None:
+            spill_threshold = self.SPILL_THRESHOLD
+        
+        output = tempfile.SpooledTemporaryFile(max_size=spill_threshold, suffix='.pdf')
+        self._build_story(kind, args, output)
+        output.seek(0)
+        return output
+
+    def _build_story(self, kind, args, output, deadline=None):
+        """Lay out a document into a path or file-like object"""
+        story = StreamingStory(getattr(self, self.story_builders[kind])(*args))
+        document = SimpleDocTemplate(output, pagesize=A4, pageCompression=1)
+        if deadline is not None:
+            document.afterFlowable = lambda flowable: deadline.check()
+        document.build(story)
+
+    def _build(self, kind, args, output_path):
+        """Build a PDF to output_path"""
+        if not isinstance(args[0], (list, tuple, dict)):
+            # Lay streams out straight into the file as they arrive
+            self._build_story(kind, args, output_path)
+            return
+        
+        with open(output_path, 'wb') as f:
+            f.write(self._render(kind, args))
+
+    def _render(self, kind, args):
+        """Render a document to bytes via the render cache and pool when possible
+        
+        Only concrete lists and document models go through the cache and
+        pool; a lazy question stream would have to be drained to compute the
+        key and cannot be sent to another process, so it is laid out here as
+        it arrives. The footer date is part of the key as a dynamic
+        component, so cached copies roll over at midnight.
+        """
+        if not isinstance(args[0], (list, tuple, dict)):
+            return self.render_bytes(kind, *args)
+        
+        return self._render_many([(kind, args)])[0]
+
+    def _render_many(self, jobs, deadline=None):
+        """Render several (kind, args) jobs, sending every cache miss to the pool at once"""
+        results = [None] * len(jobs)
+        keys = [None] * len(jobs)
+        
+        if self.render_cache is not None:
+            date = self._get_current_date()
+            for index, (kind, args) in enumerate(jobs):
+                keys[index] = self.render_cache.make_key(
+                    kind, self.TEMPLATE_VERSION, args[0], list(args[1:]), dynamic=(date,)
+                )
+                results[index] = self.render_cache.get(keys[index])
+        
+        misses = [index for index, data in enumerate(results) if data is None]
+        if not misses:
+            return results
+        
+        if self.render_pool is not None:
+            rendered = self.render_pool.render_many([jobs[index] for index in misses], deadline=deadline)
+        else:
+            rendered = [self.render_bytes(jobs[index][0], *jobs[index][1], deadline=deadline) for index in misses]
+        
+        for index, data in zip(misses, rendered):
+            results[index] = data
+            if keys[index] is not None:
+                self.render_cache.set(keys[index], data)
+        
+        return results
+
+    def _answer_tables(self, entries):
+        """Yield (table, number of rows) for the answer key, ANSWER_TABLE_CHUNK questions per table
+        
+        Cells are wrapped Paragraphs so long explanations wrap and rows
+        split cleanly across pages, and each table repeats its header row
+        on every page it spans. Chunking keeps layout time linear in the
+        number of questions.
+        """
+        rows = []
+        tables = 0
+        for entry in entries:
+            rows.append([
+                Paragraph(f"Question {entry['number']}", self.answer_cell_style),
+                Paragraph(escape(entry['answer']), self.answer_cell_style),
+                Paragraph(escape(str(entry['explanation'])), self.answer_cell_style)
             ])
+            if len(rows) == self.ANSWER_TABLE_CHUNK:
+                yield self._answer_table(rows), len(rows)
+                tables += 1
+                rows = []
         
-        # Create table
-        table = Table(answer_data, colWidths=[1*inch, 2*inch, 3*inch])
+        # An empty key still gets its header row
+        if rows or not tables:
+            yield self._answer_table(rows), len(rows)
+
+    def _answer_table(self, rows):
+        """Build one answer key table from body rows"""
+        table = LongTable(
+            [['Question', 'Correct Answer', 'Explanation']] + rows,
+            colWidths=[1*inch, 2*inch, 3*inch],
+            repeatRows=1,
+            splitByRow=1
+        )
         table.setStyle(TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -175,113 +680,86 @@ class PDFGenerator:
             ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
         ]))
         
-        story.append(table)
-        story.append(Spacer(1, 20))
-        
-        # Summary
-        summary_text = f"Total Questions: {len(questions)} | Subject: {subject.title()} | Topic: {topic.replace('_', ' ').title()}"
-        summary_para = Paragraph(summary_text, self.styles['Normal'])
-        story.append(summary_para)
-        
-        # Footer
-        story.append(Spacer(1, 20))
-        footer = Paragraph(
-            f"Answer Key Generated on: {self._get_current_date()} | UK Curriculum Aligned",
-            self.styles['Normal']
-        )
-        story.append(footer)
-        
-        # Build PDF
-        doc.build(story)
+        return table
 
     def _get_current_date(self):
         """Get current date in a formatted string"""
         from datetime import datetime
         return datetime.now().strftime("%B %d, %Y")
 
-    def generate_preview_worksheet(self, questions, subject, topic, year_group, difficulty):
-        """Generate a preview worksheet (returns HTML for web display)"""
-        html_content = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px;">
-            <h1 style="text-align: center; color: #2c3e50; margin-bottom: 10px;">Mathematics Worksheet</h1>
-            <h2 style="text-align: center; color: #27ae60; margin-bottom: 20px;">{subject.title()} - {topic.replace('_', ' ').title()}</h2>
-            
-            <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-                <p><strong>Year Group:</strong> {year_group} | <strong>Difficulty:</strong> {difficulty} | <strong>Questions:</strong> {len(questions)}</p>
-            </div>
-            
-            <div style="background-color: #e8f4fd; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-                <p><strong>Instructions:</strong> Circle the correct answer for each question below.</p>
-            </div>
+    def generate_preview_worksheet(self, questions, subject, topic, year_group, difficulty, include_stylesheet=True):
+        """Generate a preview worksheet (returns HTML for web display)
+        
+        Pages showing several previews can pass include_stylesheet=False
+        and emit PREVIEW_STYLESHEET once themselves.
         """
+        parts = [self.PREVIEW_STYLESHEET] if include_stylesheet else []
+        parts.append(self._preview_header("Mathematics Worksheet", subject, topic, year_group, difficulty, len(questions)))
+        parts.append(self.PREVIEW_INSTRUCTIONS)
         
         for i, question in enumerate(questions, 1):
-            html_content += f"""
-            <div style="margin-bottom: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 5px;">
-                <p style="font-weight: bold; margin-bottom: 10px;">Question {i}: {question['question']}</p>
-            """
-            
-            for j, option in enumerate(question['options']):
-                html_content += f"""
-                <p style="margin-left: 20px; margin-bottom: 5px;">{chr(65 + j)}. {option}</p>
-                """
-            
-            html_content += "</div>"
-        
-        html_content += f"""
-            <div style="margin-top: 30px; padding: 15px; background-color: #f8f9fa; border-radius: 5px;">
-                <p style="text-align: center; color: #666;">Generated on: {self._get_current_date()} | UK Curriculum Aligned</p>
-            </div>
-        </div>
-        """
+            fragment = self._preview_fragment(question)
+            parts.append(self.PREVIEW_QUESTION.format(
+                number=i, question=fragment['question'], diagram=fragment['diagram'], options=fragment['options']
+            ))
         
-        return html_content
+        parts.append(self.PREVIEW_FOOTER.format(text=f"Generated on: {self._get_current_date()}"))
+        return ''.join(parts)
 
-    def generate_preview_answer_key(self, questions, subject, topic, year_group, difficulty):
+    def generate_preview_answer_key(self, questions, subject, topic, year_group, difficulty, include_stylesheet=True):
         """Generate a preview answer key (returns HTML for web display)"""
-        html_content = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px;">
-            <h1 style="text-align: center; color: #2c3e50; margin-bottom: 10px;">Answer Key</h1>
-            <h2 style="text-align: center; color: #27ae60; margin-bottom: 20px;">{subject.title()} - {topic.replace('_', ' ').title()}</h2>
-            
-            <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-                <p><strong>Year Group:</strong> {year_group} | <strong>Difficulty:</strong> {difficulty} | <strong>Questions:</strong> {len(questions)}</p>
-            </div>
-            
-            <table style="width: 100%; border-collapse: collapse; margin-bottom: 20px;">
-                <thead>
-                    <tr style="background-color: #34495e; color: white;">
-                        <th style="padding: 12px; text-align: left; border: 1px solid #ddd;">Question</th>
-                        <th style="padding: 12px; text-align: left; border: 1px solid #ddd;">Correct Answer</th>
-                        <th style="padding: 12px; text-align: left; border: 1px solid #ddd;">Explanation</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
+        parts = [self.PREVIEW_STYLESHEET] if include_stylesheet else []
+        parts.append(self._preview_header("Answer Key", subject, topic, year_group, difficulty, len(questions)))
+        parts.append(self.PREVIEW_TABLE_HEAD)
         
         for i, question in enumerate(questions, 1):
-            # Find the letter of the correct answer
-            correct_index = question['options'].index(question['correct_answer'])
-            correct_letter = chr(65 + correct_index)
-            
-            row_color = "#f8f9fa" if i % 2 == 0 else "white"
-            
-            html_content += f"""
-                <tr style="background-color: {row_color};">
-                    <td style="padding: 12px; border: 1px solid #ddd; font-weight: bold;">Question {i}</td>
-                    <td style="padding: 12px; border: 1px solid #ddd; color: #e74c3c; font-weight: bold;">{correct_letter}. {question['correct_answer']}</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">{question['explanation']}</td>
-                </tr>
-            """
-        
-        html_content += f"""
-                </tbody>
-            </table>
-            
-            <div style="margin-top: 20px; padding: 15px; background-color: #f8f9fa; border-radius: 5px;">
-                <p style="text-align: center; color: #666;">Answer Key Generated on: {self._get_current_date()} | UK Curriculum Aligned</p>
-            </div>
-        </div>
+            fragment = self._preview_fragment(question)
+            parts.append(self.PREVIEW_ANSWER_ROW.format(number=i, answer=fragment['answer'], explanation=fragment['explanation']))
+        
+        parts.append(self.PREVIEW_TABLE_FOOT)
+        parts.append(self.PREVIEW_FOOTER.format(text=f"Answer Key Generated on: {self._get_current_date()}"))
+        return ''.join(parts)
+
+    def _preview_header(self, title, subject, topic, year_group, difficulty, num_questions):
+        """Fill in the preview title block"""
+        return self.PREVIEW_HEADER.format(
+            title=title,
+            subtitle=escape(f"{subject.title()} - {topic.replace('_', ' ').title()}"),
+            year_group=escape(str(year_group)),
+            difficulty=escape(str(difficulty)),
+            num_questions=num_questions
+        )
+
+    def _preview_fragment(self, question):
+        """Get a question's escaped preview HTML, memoized by question ID
+        
+        Only the question number differs between worksheets, so the
+        question text, options and answer cells are built once per
+        question and reused.
         """
+        diagram = question.get('diagram')
+        source = (
+            question['question'], tuple(question['options']), question['correct_answer'], question['explanation'],
+            diagram_key(diagram) if diagram else None
+        )
+        key = ('preview', question.get('id'))
+        if key[1]:
+            fragment = self.preview_fragments.get(key, source)
+            if fragment is not None:
+                return fragment
         
-        return html_content
+        correct_index = question['options'].index(question['correct_answer'])
+        fragment = {
+            'source': source,
+            'question': escape(str(question['question'])),
+            'diagram': self.PREVIEW_DIAGRAM.format(svg=diagram_svg(diagram)) if diagram else '',
+            'options': ''.join(
+                self.PREVIEW_OPTION.format(letter=chr(65 + j), option=escape(str(option)))
+                for j, option in enumerate(question['options'])
+            ),
+            'answer': escape(f"{chr(65 + correct_index)}. {question['correct_answer']}"),
+            'explanation': escape(str(question['explanation']))
+        }
+        if key[1]:
+            self.preview_fragments.set(key, fragment)
+        return fragment
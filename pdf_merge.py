@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Concatenation of reportlab PDFs
+Large class packs are rendered in pieces on several render processes and
+joined here into one document, and printed copies of one document are
+made here without repeating its page contents. Only the structure
+reportlab itself writes is supported: numbered objects, a single page
+tree and a plain xref table.
+"""
+
+import re
+
+OBJECT_START = re.compile(rb'\s*(\d+) 0 obj\s*')
+REFERENCE = re.compile(rb'(?<![\d.])(\d+) 0 R\b')
+STREAM_LENGTH = re.compile(rb'/Length (\d+)')
+ROOT = re.compile(rb'/Root (\d+) 0 R')
+INFO = re.compile(rb'/Info (\d+) 0 R')
+PAGES = re.compile(rb'/Pages (\d+) 0 R')
+KIDS = re.compile(rb'/Kids \[([^\]]*)\]')
+COUNT = re.compile(rb'/Count (\d+)')
+
+def read_objects(data):
+    """Split a PDF into {number: (dictionary, stream)}; stream is None for plain objects
+
+    Stream data is sliced out by its /Length rather than searched, so
+    binary content can never be mistaken for PDF syntax.
+    """
+    objects = {}
+    pos = data.index(b'\n', data.index(b'\n') + 1) + 1
+    while True:
+        match = OBJECT_START.match(data, pos)
+        if not match:
+            break
+        number = int(match.group(1))
+        end = data.index(b'endobj', match.end())
+        stream_start = data.find(b'stream', match.end(), end)
+        if stream_start == -1:
+            objects[number] = (data[match.end():end].rstrip(), None)
+            pos = end + len(b'endobj')
+            continue
+
+        dictionary = data[match.end():stream_start].rstrip()
+        length = int(STREAM_LENGTH.search(dictionary).group(1))
+        body_start = stream_start + len(b'stream')
+        body_start += 2 if data[body_start:body_start + 2] == b'\r\n' else 1
+        stream = data[body_start:body_start + length]
+        pos = data.index(b'endobj', data.index(b'endstream', body_start + length)) + len(b'endobj')
+        objects[number] = (dictionary, stream)
+
+    return objects
+
+def concatenate_pdfs(parts):
+    """Join several PDFs into one, keeping every page in order
+
+    Each part's objects are renumbered into one sequence, its page tree is
+    hung under a new root and its catalog is dropped. The first part's
+    document info is kept.
+    """
+    if len(parts) == 1:
+        return parts[0]
+
+    # Objects 1 and 2 are the new catalog and page tree root
+    output = [None, None]
+    kids = []
+    page_count = 0
+    info = None
+
+    for index, data in enumerate(parts):
+        trailer = data[data.rindex(b'trailer'):]
+        objects = read_objects(data)
+        offset = len(output) - min(objects) + 1
+        root = int(ROOT.search(trailer).group(1))
+        pages = int(PAGES.search(objects[root][0]).group(1))
+
+        def renumber(text, offset=offset, pages=pages):
+            # Only page /Parent entries point at the old page tree root
+            def reference(match):
+                number = int(match.group(1))
+                return b'2 0 R' if number == pages else b'%d 0 R' % (number + offset)
+            return REFERENCE.sub(reference, text)
+
+        pages_dictionary = objects[pages][0]
+        kids.append(renumber(KIDS.search(pages_dictionary).group(1)).strip())
+        page_count += int(COUNT.search(pages_dictionary).group(1))
+        info_match = INFO.search(trailer)
+        if index == 0 and info_match:
+            info = int(info_match.group(1)) + offset
+
+        for number in range(min(objects), max(objects) + 1):
+            if number in (root, pages) or number not in objects:
+                # Keep numbering dense; a null stands in for the dropped object
+                output.append((b'null', None))
+                continue
+            dictionary, stream = objects[number]
+            output.append((renumber(dictionary), stream))
+
+    return _write_pdf(output, kids, page_count, info)
+
+def repeat_pdf(data, copies):
+    """Repeat every page of a PDF copies times, sharing one set of page contents
+
+    The document's objects are written once; each further copy adds only
+    new page dictionaries pointing at the same content streams and
+    resources, so a copy costs a few dozen bytes a page rather than the
+    whole document again.
+    """
+    if copies == 1:
+        return data
+
+    trailer = data[data.rindex(b'trailer'):]
+    objects = read_objects(data)
+    offset = 2 - min(objects) + 1
+    root = int(ROOT.search(trailer).group(1))
+    pages = int(PAGES.search(objects[root][0]).group(1))
+
+    def renumber(text):
+        def reference(match):
+            number = int(match.group(1))
+            return b'2 0 R' if number == pages else b'%d 0 R' % (number + offset)
+        return REFERENCE.sub(reference, text)
+
+    output = [None, None]
+    for number in range(min(objects), max(objects) + 1):
+        if number in (root, pages) or number not in objects:
+            output.append((b'null', None))
+            continue
+        dictionary, stream = objects[number]
+        output.append((renumber(dictionary), stream))
+
+    pages_dictionary = objects[pages][0]
+    page_numbers = [int(number) for number in REFERENCE.findall(KIDS.search(pages_dictionary).group(1))]
+    kids = [renumber(KIDS.search(pages_dictionary).group(1)).strip()]
+    for _ in range(copies - 1):
+        copy = []
+        for number in page_numbers:
+            output.append((renumber(objects[number][0]), None))
+            copy.append(b'%d 0 R' % len(output))
+        kids.append(b' '.join(copy))
+
+    info_match = INFO.search(trailer)
+    info = int(info_match.group(1)) + offset if info_match else None
+    page_count = int(COUNT.search(pages_dictionary).group(1)) * copies
+    return _write_pdf(output, kids, page_count, info)
+
+def _write_pdf(output, kids, page_count, info):
+    """Serialise renumbered objects under a new catalog (1) and page tree root (2)"""
+    output[0] = (b'<<\n/Pages 2 0 R /Type /Catalog\n>>', None)
+    output[1] = (b'<<\n/Count %d /Kids [ %s ] /Type /Pages\n>>' % (page_count, b' '.join(kids)), None)
+
+    pdf = [b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n']
+    size = len(pdf[0])
+    offsets = []
+    for number, (dictionary, stream) in enumerate(output, 1):
+        offsets.append(size)
+        chunk = b'%d 0 obj\n%s\n' % (number, dictionary)
+        if stream is not None:
+            chunk += b'stream\n' + stream + b'\nendstream\n'
+        chunk += b'endobj\n'
+        pdf.append(chunk)
+        size += len(chunk)
+
+    xref = [b'xref\n0 %d\n0000000000 65535 f \n' % (len(output) + 1)]
+    xref.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+    trailer = b'trailer\n<<\n/Root 1 0 R /Size %d' % (len(output) + 1)
+    if info is not None:
+        trailer += b' /Info %d 0 R' % info
+    pdf.extend(xref)
+    pdf.append(trailer + b'\n>>\nstartxref\n%d\n%%%%EOF\n' % size)
+    return b''.join(pdf)
@@ -1,7 +1,45 @@
 import random
 import math
+import hashlib
+import secrets
+from itertools import islice
 from question_database import QuestionDatabase
 
+# Seeds are handed to browsers as JSON numbers, which JavaScript reads as
+# doubles; above 2**53 they would come back changed
+SEED_BITS = 53
+
+def new_seed():
+    """Draw a fresh seed for a request or job that survives a JSON round trip"""
+    return secrets.randbits(SEED_BITS)
+
+def make_rng(seed=None):
+    """Create an independent random.Random for one request or job
+    
+    Integer seeds take the fast seeding path; with no seed a fresh one
+    is drawn so the stream can still be reproduced from the seed.
+    """
+    if seed is None:
+        seed = new_seed()
+    return random.Random(seed)
+
+def spawn_seeds(seed, count):
+    """Derive count independent child seeds from one parent seed
+    
+    Used to give each shard of a batch job its own reproducible stream.
+    """
+    seeds = []
+    for index in range(count):
+        digest = hashlib.blake2b(f"{seed}:{index}".encode(), digest_size=8).digest()
+        seeds.append(int.from_bytes(digest, 'big'))
+    return seeds
+
+def question_id(question):
+    """Stable ID for a question, derived from its text and correct answer"""
+    text = ' '.join(str(question['question']).lower().split())
+    digest = hashlib.blake2b(f"{text}\x1f{question['correct_answer']}".encode(), digest_size=8)
+    return digest.hexdigest()
+
 class QuestionBank:
     def __init__(self):
         # Initialize the question database
@@ -67,6 +105,20 @@ class QuestionBank:
         
         self.year_groups = ['Year 1', 'Year 2', 'Year 3', 'Year 4', 'Year 5', 'Year 6']
         self.difficulty_levels = ['Easy', 'Medium', 'Hard']
+        
+        # Generators whose question space is small enough to enumerate.
+        # Each enumerator returns every distinct question for a year group
+        # and difficulty, or None when that band is not enumerable.
+        self.enumerable_generators = {
+            'ratio_proportion': self._enumerate_ratio_proportion_questions,
+            'geometry_shape': self._enumerate_geometry_shape_questions,
+            'geometry_position': self._enumerate_geometry_position_questions
+        }
+        self.question_space_cache = {}
+        
+        # Extra generation passes allowed per difficulty when topping up
+        # a worksheet after duplicate questions were discarded
+        self.max_generation_retries = 5
 
     def get_subjects(self):
         """Get all available subjects"""
@@ -78,70 +130,235 @@ class QuestionBank:
             return self.subjects[subject]['topics']
         return {}
 
-    def generate_questions(self, subject, topic, year_group, difficulty, num_questions):
-        """Generate questions based on criteria"""
+    def get_question_space(self, topic, year_group, difficulty):
+        """Get the cached table of every distinct question, or None if unbounded"""
+        key = (topic, year_group, difficulty)
+        if key not in self.question_space_cache:
+            enumerator = self.enumerable_generators.get(topic)
+            self.question_space_cache[key] = enumerator(year_group, difficulty) if enumerator else None
+        return self.question_space_cache[key]
+
+    def get_question_capacity(self, subject, topic, year_group, difficulty):
+        """Get the maximum number of distinct questions available, or None if unbounded"""
+        db_count = self.db.count_questions(subject, topic, year_group)
+        if db_count:
+            return db_count
+        
+        if subject != 'maths':
+            return 0
+        
+        question_space = self.get_question_space(topic, year_group, difficulty)
+        if question_space is None:
+            return None
+        return len(question_space)
+
+    def _iter_question_space(self, topic, year_group, difficulty, rng):
+        """Stream an enumerated question space in shuffled passes without replacement"""
+        question_space = self.get_question_space(topic, year_group, difficulty)
+        
+        while True:
+            for entry in rng.sample(question_space, len(question_space)):
+                wrong_answers = rng.sample(entry['distractors'], 3)
+                all_answers = [entry['correct_answer']] + wrong_answers
+                rng.shuffle(all_answers)
+                
+                question = {
+                    'question': entry['question'],
+                    'options': all_answers,
+                    'correct_answer': entry['correct_answer'],
+                    'explanation': entry['explanation']
+                }
+                if 'diagram' in entry:
+                    question['diagram'] = entry['diagram']
+                yield question
+
+    def generate_questions(self, subject, topic, year_group, difficulty, num_questions, stats=None, seed=None, rng=None):
+        """Generate questions based on criteria
+        
+        Question text is unique within the returned list. Pass a dict as
+        stats to receive this request's collision and retry counts, and a
+        seed or random.Random as rng for a reproducible selection.
+        """
+        spec = {
+            'subject': subject,
+            'topic': topic,
+            'year_group': year_group,
+            'difficulty': difficulty,
+            'num_questions': num_questions
+        }
+        return list(self.iter_questions(spec, seed=seed, stats=stats, rng=rng))
+
+    def iter_questions(self, spec, seed=None, stats=None, rng=None):
+        """Stream unique questions for a worksheet spec one at a time
+        
+        spec holds subject, topic, year_group, difficulty and num_questions.
+        The same seed always yields the same questions; an injected rng
+        takes precedence. stats is filled in as the stream is consumed.
+        """
+        if rng is None:
+            rng = make_rng(seed)
+        
+        subject = spec['subject']
+        topic = spec['topic']
+        year_group = spec['year_group']
+        difficulty = spec['difficulty']
+        num_questions = spec['num_questions']
+        
+        if stats is None:
+            stats = {}
+        stats.update({'collisions': 0, 'retries': 0, 'fallback_difficulties': []})
+        seen_questions = set()
+        produced = 0
+        
         # First try to get questions from the database
-        db_questions = self.db.get_questions(subject, topic, year_group, difficulty, num_questions)
+        if self.db.count_questions(subject, topic, year_group):
+            db_questions = self.db.iter_questions(subject, topic, year_group, difficulty, num_questions, rng=rng)
+            for question in self._unique_questions(db_questions, seen_questions, stats):
+                yield question
+            return
+        
+        # If no questions in database, fall back to generated questions,
+        # widening to neighbouring difficulties once the retry budget is spent
+        for attempt_difficulty in self._neighbouring_difficulties(difficulty):
+            if attempt_difficulty != difficulty:
+                stats['fallback_difficulties'].append(attempt_difficulty)
+            
+            question_space = self.get_question_space(topic, year_group, attempt_difficulty) if subject == 'maths' else None
+            stream = self._iter_procedural_questions(subject, topic, year_group, attempt_difficulty, rng)
+            retries = 0
+            
+            while produced < num_questions and retries <= self.max_generation_retries:
+                if question_space is not None and len(seen_questions) >= len(question_space):
+                    break
+                
+                # One pass draws as many candidates as questions still needed
+                for question in self._unique_questions(
+                    islice(stream, num_questions - produced), seen_questions, stats
+                ):
+                    produced += 1
+                    yield question
+                
+                if produced < num_questions:
+                    retries += 1
+                    stats['retries'] += 1
+            
+            if produced >= num_questions:
+                break
+
+    def generate_class_set(self, spec, num_worksheets, seed=None, stats=None, rng=None):
+        """Generate num_worksheets different worksheets for one spec
         
-        if db_questions:
-            return db_questions
+        Selection is planned once for the whole class: a single pool of
+        unique questions is drawn and dealt out so worksheets are disjoint
+        when the pool allows, with any overlap spread evenly when it doesn't.
+        Returns a list of question lists, one per worksheet.
+        """
+        if stats is None:
+            stats = {}
         
-        # If no questions in database, fall back to generated questions
+        questions_per_worksheet = spec['num_questions']
+        pool_spec = dict(spec, num_questions=questions_per_worksheet * num_worksheets)
+        pool = list(self.iter_questions(pool_spec, seed=seed, stats=stats, rng=rng))
+        
+        stats['pool_size'] = len(pool)
+        stats['disjoint'] = len(pool) >= questions_per_worksheet * num_worksheets
+        if not pool:
+            return [[] for _ in range(num_worksheets)]
+        
+        # Deal consecutive runs from the pool, wrapping round when it is
+        # smaller than the class needs; a run never repeats within a worksheet
+        questions_per_worksheet = min(questions_per_worksheet, len(pool))
+        worksheets = []
+        for index in range(num_worksheets):
+            start = index * questions_per_worksheet
+            worksheets.append([
+                pool[(start + offset) % len(pool)] for offset in range(questions_per_worksheet)
+            ])
+        
+        return worksheets
+
+    def _iter_procedural_questions(self, subject, topic, year_group, difficulty, rng):
+        """Dispatch to the question stream for a subject"""
         if subject == 'maths':
-            return self._generate_maths_questions(topic, year_group, difficulty, num_questions)
+            return self._iter_maths_questions(topic, year_group, difficulty, rng)
         elif subject == 'science':
-            return self._generate_science_questions(topic, year_group, difficulty, num_questions)
+            return self._iter_science_questions(topic, year_group, difficulty, rng)
         elif subject == 'computing':
-            return self._generate_computing_questions(topic, year_group, difficulty, num_questions)
+            return self._iter_computing_questions(topic, year_group, difficulty, rng)
         elif subject == 'history':
-            return self._generate_history_questions(topic, year_group, difficulty, num_questions)
+            return self._iter_history_questions(topic, year_group, difficulty, rng)
         elif subject == 'geography':
-            return self._generate_geography_questions(topic, year_group, difficulty, num_questions)
-        return []
+            return self._iter_geography_questions(topic, year_group, difficulty, rng)
+        return iter(())
+
+    def _question_key(self, question):
+        """Canonical key used to detect a repeated question"""
+        if 'id' in question:
+            return question['id']
+        return ' '.join(str(question['question']).lower().split())
+
+    def _unique_questions(self, candidates, seen_questions, stats):
+        """Yield candidates whose key has not been seen yet, tagged with an id"""
+        for question in candidates:
+            if 'id' not in question:
+                question = dict(question, id=question_id(question))
+            
+            key = self._question_key(question)
+            if key in seen_questions:
+                stats['collisions'] += 1
+                continue
+            
+            seen_questions.add(key)
+            yield question
 
-    def _generate_maths_questions(self, topic, year_group, difficulty, num_questions):
-        """Generate mathematics questions"""
-        questions = []
+    def _neighbouring_difficulties(self, difficulty):
+        """Get the requested difficulty followed by the others, nearest first"""
+        if difficulty not in self.difficulty_levels:
+            return [difficulty]
         
+        index = self.difficulty_levels.index(difficulty)
+        order = sorted(range(len(self.difficulty_levels)), key=lambda i: (abs(i - index), i))
+        return [self.difficulty_levels[i] for i in order]
+
+    def _iter_maths_questions(self, topic, year_group, difficulty, rng):
+        """Stream mathematics questions indefinitely"""
         if topic == 'place_value':
-            questions = self._generate_place_value_questions(year_group, difficulty, num_questions)
+            return self._iter_place_value_questions(year_group, difficulty, rng)
         elif topic == 'addition_subtraction':
-            questions = self._generate_addition_subtraction_questions(year_group, difficulty, num_questions)
+            return self._iter_addition_subtraction_questions(year_group, difficulty, rng)
         elif topic == 'multiplication_division':
-            questions = self._generate_multiplication_division_questions(year_group, difficulty, num_questions)
+            return self._iter_multiplication_division_questions(year_group, difficulty, rng)
         elif topic == 'fractions_decimals':
-            questions = self._generate_fractions_decimals_questions(year_group, difficulty, num_questions)
+            return self._iter_fractions_decimals_questions(year_group, difficulty, rng)
         elif topic == 'ratio_proportion':
-            questions = self._generate_ratio_proportion_questions(year_group, difficulty, num_questions)
+            return self._iter_ratio_proportion_questions(year_group, difficulty, rng)
         elif topic == 'algebra':
-            questions = self._generate_algebra_questions(year_group, difficulty, num_questions)
+            return self._iter_algebra_questions(year_group, difficulty, rng)
         elif topic == 'measurement':
-            questions = self._generate_measurement_questions(year_group, difficulty, num_questions)
+            return self._iter_measurement_questions(year_group, difficulty, rng)
         elif topic == 'geometry_shape':
-            questions = self._generate_geometry_shape_questions(year_group, difficulty, num_questions)
+            return self._iter_geometry_shape_questions(year_group, difficulty, rng)
         elif topic == 'geometry_position':
-            questions = self._generate_geometry_position_questions(year_group, difficulty, num_questions)
+            return self._iter_geometry_position_questions(year_group, difficulty, rng)
         elif topic == 'statistics':
-            questions = self._generate_statistics_questions(year_group, difficulty, num_questions)
-        
-        return questions
+            return self._iter_statistics_questions(year_group, difficulty, rng)
+        return iter(())
 
-    def _generate_place_value_questions(self, year_group, difficulty, num_questions):
-        """Generate place value questions"""
-        questions = []
+    def _iter_place_value_questions(self, year_group, difficulty, rng):
+        """Stream place value questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
+        while True:
             if year_num <= 2:
                 # Years 1-2: Numbers up to 100
                 if difficulty == 'Easy':
-                    num = random.randint(10, 50)
+                    num = rng.randint(10, 50)
                 elif difficulty == 'Medium':
-                    num = random.randint(20, 80)
+                    num = rng.randint(20, 80)
                 else:  # Hard
-                    num = random.randint(50, 100)
+                    num = rng.randint(50, 100)
                 
-                question_text = f"What is the value of the digit {random.choice(['tens', 'ones'])} in {num}?"
+                question_text = f"What is the value of the digit {rng.choice(['tens', 'ones'])} in {num}?"
                 
                 if 'tens' in question_text:
                     correct_answer = num // 10
@@ -150,21 +367,23 @@ class QuestionBank:
                 
                 # Generate wrong answers
                 wrong_answers = []
+                seen_answers = {correct_answer}
                 while len(wrong_answers) < 3:
-                    wrong = random.randint(0, 9)
-                    if wrong != correct_answer and wrong not in wrong_answers:
+                    wrong = rng.randint(0, 9)
+                    if wrong not in seen_answers:
+                        seen_answers.add(wrong)
                         wrong_answers.append(wrong)
                 
             elif year_num <= 4:
                 # Years 3-4: Numbers up to 1000
                 if difficulty == 'Easy':
-                    num = random.randint(100, 500)
+                    num = rng.randint(100, 500)
                 elif difficulty == 'Medium':
-                    num = random.randint(200, 800)
+                    num = rng.randint(200, 800)
                 else:  # Hard
-                    num = random.randint(500, 999)
+                    num = rng.randint(500, 999)
                 
-                place = random.choice(['hundreds', 'tens', 'ones'])
+                place = rng.choice(['hundreds', 'tens', 'ones'])
                 question_text = f"What is the value of the {place} digit in {num}?"
                 
                 if place == 'hundreds':
@@ -176,21 +395,23 @@ class QuestionBank:
                 
                 # Generate wrong answers
                 wrong_answers = []
+                seen_answers = {correct_answer}
                 while len(wrong_answers) < 3:
-                    wrong = random.randint(0, 9)
-                    if wrong != correct_answer and wrong not in wrong_answers:
+                    wrong = rng.randint(0, 9)
+                    if wrong not in seen_answers:
+                        seen_answers.add(wrong)
                         wrong_answers.append(wrong)
             
             else:
                 # Years 5-6: Numbers up to 10000
                 if difficulty == 'Easy':
-                    num = random.randint(1000, 5000)
+                    num = rng.randint(1000, 5000)
                 elif difficulty == 'Medium':
-                    num = random.randint(2000, 8000)
+                    num = rng.randint(2000, 8000)
                 else:  # Hard
-                    num = random.randint(5000, 9999)
+                    num = rng.randint(5000, 9999)
                 
-                place = random.choice(['thousands', 'hundreds', 'tens', 'ones'])
+                place = rng.choice(['thousands', 'hundreds', 'tens', 'ones'])
                 question_text = f"What is the value of the {place} digit in {num}?"
                 
                 if place == 'thousands':
@@ -204,67 +425,66 @@ class QuestionBank:
                 
                 # Generate wrong answers
                 wrong_answers = []
+                seen_answers = {correct_answer}
                 while len(wrong_answers) < 3:
-                    wrong = random.randint(0, 9)
-                    if wrong != correct_answer and wrong not in wrong_answers:
+                    wrong = rng.randint(0, 9)
+                    if wrong not in seen_answers:
+                        seen_answers.add(wrong)
                         wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': f"The {place if 'place' in locals() else 'digit'} value is {correct_answer}."
-            })
-        
-        return questions
+            }
 
-    def _generate_addition_subtraction_questions(self, year_group, difficulty, num_questions):
-        """Generate addition and subtraction questions"""
-        questions = []
+    def _iter_addition_subtraction_questions(self, year_group, difficulty, rng):
+        """Stream addition and subtraction questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
-            operation = random.choice(['addition', 'subtraction'])
+        while True:
+            operation = rng.choice(['addition', 'subtraction'])
             
             if year_num <= 2:
                 # Years 1-2: Numbers up to 100
                 if difficulty == 'Easy':
-                    a = random.randint(1, 20)
-                    b = random.randint(1, 20)
+                    a = rng.randint(1, 20)
+                    b = rng.randint(1, 20)
                 elif difficulty == 'Medium':
-                    a = random.randint(10, 50)
-                    b = random.randint(10, 50)
+                    a = rng.randint(10, 50)
+                    b = rng.randint(10, 50)
                 else:  # Hard
-                    a = random.randint(20, 80)
-                    b = random.randint(20, 80)
+                    a = rng.randint(20, 80)
+                    b = rng.randint(20, 80)
                 
             elif year_num <= 4:
                 # Years 3-4: Numbers up to 1000
                 if difficulty == 'Easy':
-                    a = random.randint(50, 200)
-                    b = random.randint(50, 200)
+                    a = rng.randint(50, 200)
+                    b = rng.randint(50, 200)
                 elif difficulty == 'Medium':
-                    a = random.randint(100, 500)
-                    b = random.randint(100, 500)
+                    a = rng.randint(100, 500)
+                    b = rng.randint(100, 500)
                 else:  # Hard
-                    a = random.randint(200, 800)
-                    b = random.randint(200, 800)
+                    a = rng.randint(200, 800)
+                    b = rng.randint(200, 800)
             
             else:
                 # Years 5-6: Numbers up to 10000
                 if difficulty == 'Easy':
-                    a = random.randint(500, 2000)
-                    b = random.randint(500, 2000)
+                    a = rng.randint(500, 2000)
+                    b = rng.randint(500, 2000)
                 elif difficulty == 'Medium':
-                    a = random.randint(1000, 5000)
-                    b = random.randint(1000, 5000)
+                    a = rng.randint(1000, 5000)
+                    b = rng.randint(1000, 5000)
                 else:  # Hard
-                    a = random.randint(2000, 8000)
-                    b = random.randint(2000, 8000)
+                    a = rng.randint(2000, 8000)
+                    b = rng.randint(2000, 8000)
             
             if operation == 'addition':
                 question_text = f"What is {a} + {b}?"
@@ -280,71 +500,70 @@ class QuestionBank:
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
                 if operation == 'addition':
-                    wrong = correct_answer + random.randint(-10, 10)
+                    wrong = correct_answer + rng.randint(-10, 10)
                 else:
-                    wrong = correct_answer + random.randint(-10, 10)
+                    wrong = correct_answer + rng.randint(-10, 10)
                 
-                if wrong != correct_answer and wrong > 0 and wrong not in wrong_answers:
+                if wrong > 0 and wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
-        
-        return questions
+            }
 
-    def _generate_multiplication_division_questions(self, year_group, difficulty, num_questions):
-        """Generate multiplication and division questions"""
-        questions = []
+    def _iter_multiplication_division_questions(self, year_group, difficulty, rng):
+        """Stream multiplication and division questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
-            operation = random.choice(['multiplication', 'division'])
+        while True:
+            operation = rng.choice(['multiplication', 'division'])
             
             if year_num <= 2:
                 # Years 1-2: Simple multiplication tables
                 if difficulty == 'Easy':
-                    a = random.randint(2, 5)
-                    b = random.randint(2, 5)
+                    a = rng.randint(2, 5)
+                    b = rng.randint(2, 5)
                 elif difficulty == 'Medium':
-                    a = random.randint(2, 10)
-                    b = random.randint(2, 10)
+                    a = rng.randint(2, 10)
+                    b = rng.randint(2, 10)
                 else:  # Hard
-                    a = random.randint(5, 12)
-                    b = random.randint(5, 12)
+                    a = rng.randint(5, 12)
+                    b = rng.randint(5, 12)
             
             elif year_num <= 4:
                 # Years 3-4: Extended tables
                 if difficulty == 'Easy':
-                    a = random.randint(2, 12)
-                    b = random.randint(2, 12)
+                    a = rng.randint(2, 12)
+                    b = rng.randint(2, 12)
                 elif difficulty == 'Medium':
-                    a = random.randint(5, 15)
-                    b = random.randint(5, 15)
+                    a = rng.randint(5, 15)
+                    b = rng.randint(5, 15)
                 else:  # Hard
-                    a = random.randint(10, 20)
-                    b = random.randint(10, 20)
+                    a = rng.randint(10, 20)
+                    b = rng.randint(10, 20)
             
             else:
                 # Years 5-6: Larger numbers
                 if difficulty == 'Easy':
-                    a = random.randint(10, 25)
-                    b = random.randint(10, 25)
+                    a = rng.randint(10, 25)
+                    b = rng.randint(10, 25)
                 elif difficulty == 'Medium':
-                    a = random.randint(15, 50)
-                    b = random.randint(15, 50)
+                    a = rng.randint(15, 50)
+                    b = rng.randint(15, 50)
                 else:  # Hard
-                    a = random.randint(25, 100)
-                    b = random.randint(25, 100)
+                    a = rng.randint(25, 100)
+                    b = rng.randint(25, 100)
             
             if operation == 'multiplication':
                 question_text = f"What is {a} × {b}?"
@@ -359,41 +578,40 @@ class QuestionBank:
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
                 if operation == 'multiplication':
-                    wrong = correct_answer + random.randint(-20, 20)
+                    wrong = correct_answer + rng.randint(-20, 20)
                 else:
-                    wrong = correct_answer + random.randint(-5, 5)
+                    wrong = correct_answer + rng.randint(-5, 5)
                 
-                if wrong != correct_answer and wrong > 0 and wrong not in wrong_answers:
+                if wrong > 0 and wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
-        
-        return questions
+            }
 
-    def _generate_fractions_decimals_questions(self, year_group, difficulty, num_questions):
-        """Generate fractions and decimals questions"""
-        questions = []
+    def _iter_fractions_decimals_questions(self, year_group, difficulty, rng):
+        """Stream fractions and decimals questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
-            question_type = random.choice(['fraction_equivalent', 'decimal_fraction', 'percentage'])
+        while True:
+            question_type = rng.choice(['fraction_equivalent', 'decimal_fraction', 'percentage'])
             
             if year_num <= 2:
                 # Years 1-2: Simple fractions
                 if question_type == 'fraction_equivalent':
-                    num = random.randint(1, 4)
-                    den = random.randint(2, 6)
+                    num = rng.randint(1, 4)
+                    den = rng.randint(2, 6)
                     question_text = f"What fraction is equivalent to {num}/{den}?"
                     correct_answer = f"{num}/{den}"
                     explanation = f"{num}/{den} is already in simplest form."
@@ -401,13 +619,13 @@ class QuestionBank:
             elif year_num <= 4:
                 # Years 3-4: Fractions and simple decimals
                 if question_type == 'fraction_equivalent':
-                    num = random.randint(1, 6)
-                    den = random.randint(2, 8)
+                    num = rng.randint(1, 6)
+                    den = rng.randint(2, 8)
                     question_text = f"What fraction is equivalent to {num}/{den}?"
                     correct_answer = f"{num}/{den}"
                     explanation = f"{num}/{den} is already in simplest form."
                 elif question_type == 'decimal_fraction':
-                    decimal = random.choice([0.25, 0.5, 0.75, 0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9])
+                    decimal = rng.choice([0.25, 0.5, 0.75, 0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9])
                     question_text = f"What is {decimal} as a fraction?"
                     if decimal == 0.25:
                         correct_answer = "1/4"
@@ -422,13 +640,13 @@ class QuestionBank:
             else:
                 # Years 5-6: Complex fractions, decimals, and percentages
                 if question_type == 'fraction_equivalent':
-                    num = random.randint(1, 8)
-                    den = random.randint(2, 12)
+                    num = rng.randint(1, 8)
+                    den = rng.randint(2, 12)
                     question_text = f"What fraction is equivalent to {num}/{den}?"
                     correct_answer = f"{num}/{den}"
                     explanation = f"{num}/{den} is already in simplest form."
                 elif question_type == 'decimal_fraction':
-                    decimal = random.choice([0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875])
+                    decimal = rng.choice([0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875])
                     question_text = f"What is {decimal} as a fraction?"
                     if decimal == 0.125:
                         correct_answer = "1/8"
@@ -446,125 +664,131 @@ class QuestionBank:
                         correct_answer = "7/8"
                     explanation = f"{decimal} = {correct_answer}"
                 elif question_type == 'percentage':
-                    percentage = random.choice([25, 50, 75, 10, 20, 30, 40, 60, 70, 80, 90])
+                    percentage = rng.choice([25, 50, 75, 10, 20, 30, 40, 60, 70, 80, 90])
                     question_text = f"What is {percentage}% as a decimal?"
                     correct_answer = percentage / 100
                     explanation = f"{percentage}% = {correct_answer}"
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
                 if question_type == 'fraction_equivalent':
-                    wrong = f"{random.randint(1, 8)}/{random.randint(2, 12)}"
+                    wrong = f"{rng.randint(1, 8)}/{rng.randint(2, 12)}"
                 elif question_type == 'decimal_fraction':
-                    wrong = random.choice([0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9])
+                    wrong = rng.choice([0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9])
                 elif question_type == 'percentage':
-                    wrong = random.choice([0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9])
+                    wrong = rng.choice([0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9])
                 
-                if wrong != correct_answer and wrong not in wrong_answers:
+                if wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
-        
-        return questions
+            }
 
-    def _generate_ratio_proportion_questions(self, year_group, difficulty, num_questions):
-        """Generate ratio and proportion questions"""
-        questions = []
-        year_num = int(year_group.split()[-1])
+    def _iter_ratio_proportion_questions(self, year_group, difficulty, rng):
+        """Stream ratio and proportion questions indefinitely"""
+        if self.get_question_space('ratio_proportion', year_group, difficulty) is not None:
+            yield from self._iter_question_space('ratio_proportion', year_group, difficulty, rng)
+            return
         
-        for i in range(num_questions):
-            if year_num <= 4:
-                # Years 3-4: Simple ratios
-                a = random.randint(1, 5)
-                b = random.randint(1, 5)
-                question_text = f"What is the ratio of {a} to {b}?"
-                correct_answer = f"{a}:{b}"
-                explanation = f"The ratio of {a} to {b} is {a}:{b}"
-            
-            else:
-                # Years 5-6: More complex ratios
-                a = random.randint(2, 10)
-                b = random.randint(2, 10)
-                c = random.randint(2, 10)
-                question_text = f"If {a} items cost £{b}, how much do {c} items cost?"
-                correct_answer = round((b / a) * c, 2)
-                explanation = f"Cost per item = £{b} ÷ {a} = £{b/a}. Total cost = £{b/a} × {c} = £{correct_answer}"
+        while True:
+            # Years 5-6: More complex ratios
+            a = rng.randint(2, 10)
+            b = rng.randint(2, 10)
+            c = rng.randint(2, 10)
+            question_text = f"If {a} items cost £{b}, how much do {c} items cost?"
+            correct_answer = round((b / a) * c, 2)
+            explanation = f"Cost per item = £{b} ÷ {a} = £{b/a}. Total cost = £{b/a} × {c} = £{correct_answer}"
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
-                if year_num <= 4:
-                    wrong = f"{random.randint(1, 5)}:{random.randint(1, 5)}"
-                else:
-                    wrong = round(random.uniform(1, 20), 2)
+                wrong = round(rng.uniform(1, 20), 2)
                 
-                if wrong != correct_answer and wrong not in wrong_answers:
+                if wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
+            }
+
+    def _enumerate_ratio_proportion_questions(self, year_group, difficulty):
+        """Enumerate ratio questions (Years 3-4 only; Years 5-6 are unbounded)"""
+        year_num = int(year_group.split()[-1])
+        if year_num > 4:
+            return None
         
-        return questions
+        # Years 3-4: Simple ratios
+        ratios = [f"{a}:{b}" for a in range(1, 6) for b in range(1, 6)]
+        return [
+            {
+                'question': f"What is the ratio of {a} to {b}?",
+                'correct_answer': f"{a}:{b}",
+                'explanation': f"The ratio of {a} to {b} is {a}:{b}",
+                'distractors': [ratio for ratio in ratios if ratio != f"{a}:{b}"]
+            }
+            for a in range(1, 6) for b in range(1, 6)
+        ]
 
-    def _generate_algebra_questions(self, year_group, difficulty, num_questions):
-        """Generate algebra questions"""
-        questions = []
+    def _iter_algebra_questions(self, year_group, difficulty, rng):
+        """Stream algebra questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
+        while True:
             if year_num <= 4:
                 # Years 3-4: Simple patterns
-                pattern = random.choice(['add', 'multiply'])
-                start = random.randint(1, 10)
+                pattern = rng.choice(['add', 'multiply'])
+                start = rng.randint(1, 10)
                 
                 if pattern == 'add':
-                    step = random.randint(2, 5)
+                    step = rng.randint(2, 5)
                     question_text = f"What comes next in the pattern: {start}, {start + step}, {start + 2*step}, ?"
                     correct_answer = start + 3*step
                     explanation = f"Add {step} each time: {start + 3*step}"
                 else:
-                    step = random.randint(2, 3)
+                    step = rng.randint(2, 3)
                     question_text = f"What comes next in the pattern: {start}, {start * step}, {start * step * step}, ?"
                     correct_answer = start * step * step * step
                     explanation = f"Multiply by {step} each time: {correct_answer}"
             
             else:
                 # Years 5-6: Simple equations
-                x = random.randint(1, 10)
-                operation = random.choice(['add', 'subtract', 'multiply'])
+                x = rng.randint(1, 10)
+                operation = rng.choice(['add', 'subtract', 'multiply'])
                 
                 if operation == 'add':
-                    b = random.randint(1, 10)
+                    b = rng.randint(1, 10)
                     result = x + b
                     question_text = f"If x + {b} = {result}, what is x?"
                     correct_answer = x
                     explanation = f"x = {result} - {b} = {x}"
                 elif operation == 'subtract':
-                    b = random.randint(1, 10)
+                    b = rng.randint(1, 10)
                     result = x - b
                     question_text = f"If x - {b} = {result}, what is x?"
                     correct_answer = x
                     explanation = f"x = {result} + {b} = {x}"
                 else:
-                    b = random.randint(2, 5)
+                    b = rng.randint(2, 5)
                     result = x * b
                     question_text = f"If {b}x = {result}, what is x?"
                     correct_answer = x
@@ -572,51 +796,50 @@ class QuestionBank:
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
-                wrong = random.randint(1, 20)
-                if wrong != correct_answer and wrong not in wrong_answers:
+                wrong = rng.randint(1, 20)
+                if wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
-        
-        return questions
+            }
 
-    def _generate_measurement_questions(self, year_group, difficulty, num_questions):
-        """Generate measurement questions"""
-        questions = []
+    def _iter_measurement_questions(self, year_group, difficulty, rng):
+        """Stream measurement questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
-            measurement_type = random.choice(['length', 'mass', 'capacity', 'time'])
+        while True:
+            measurement_type = rng.choice(['length', 'mass', 'capacity', 'time'])
             
             if measurement_type == 'length':
                 if year_num <= 2:
                     # Years 1-2: Simple length comparisons
-                    a = random.randint(1, 10)
-                    b = random.randint(1, 10)
+                    a = rng.randint(1, 10)
+                    b = rng.randint(1, 10)
                     question_text = f"Which is longer: {a}cm or {b}cm?"
                     correct_answer = max(a, b)
                     explanation = f"{max(a, b)}cm is longer than {min(a, b)}cm"
                 
                 elif year_num <= 4:
                     # Years 3-4: Converting units
-                    cm = random.randint(10, 100)
+                    cm = rng.randint(10, 100)
                     question_text = f"How many metres is {cm}cm?"
                     correct_answer = cm / 100
                     explanation = f"{cm}cm = {cm/100}m"
                 
                 else:
                     # Years 5-6: Complex conversions
-                    km = random.randint(1, 10)
+                    km = rng.randint(1, 10)
                     question_text = f"How many metres is {km}km?"
                     correct_answer = km * 1000
                     explanation = f"{km}km = {km * 1000}m"
@@ -624,22 +847,22 @@ class QuestionBank:
             elif measurement_type == 'mass':
                 if year_num <= 2:
                     # Years 1-2: Simple mass comparisons
-                    a = random.randint(1, 10)
-                    b = random.randint(1, 10)
+                    a = rng.randint(1, 10)
+                    b = rng.randint(1, 10)
                     question_text = f"Which is heavier: {a}kg or {b}kg?"
                     correct_answer = max(a, b)
                     explanation = f"{max(a, b)}kg is heavier than {min(a, b)}kg"
                 
                 elif year_num <= 4:
                     # Years 3-4: Converting units
-                    g = random.randint(100, 1000)
+                    g = rng.randint(100, 1000)
                     question_text = f"How many kilograms is {g}g?"
                     correct_answer = g / 1000
                     explanation = f"{g}g = {g/1000}kg"
                 
                 else:
                     # Years 5-6: Complex conversions
-                    kg = random.randint(1, 10)
+                    kg = rng.randint(1, 10)
                     question_text = f"How many grams is {kg}kg?"
                     correct_answer = kg * 1000
                     explanation = f"{kg}kg = {kg * 1000}g"
@@ -647,22 +870,22 @@ class QuestionBank:
             elif measurement_type == 'capacity':
                 if year_num <= 2:
                     # Years 1-2: Simple capacity comparisons
-                    a = random.randint(1, 10)
-                    b = random.randint(1, 10)
+                    a = rng.randint(1, 10)
+                    b = rng.randint(1, 10)
                     question_text = f"Which holds more: {a}L or {b}L?"
                     correct_answer = max(a, b)
                     explanation = f"{max(a, b)}L holds more than {min(a, b)}L"
                 
                 elif year_num <= 4:
                     # Years 3-4: Converting units
-                    ml = random.randint(100, 1000)
+                    ml = rng.randint(100, 1000)
                     question_text = f"How many litres is {ml}ml?"
                     correct_answer = ml / 1000
                     explanation = f"{ml}ml = {ml/1000}L"
                 
                 else:
                     # Years 5-6: Complex conversions
-                    l = random.randint(1, 10)
+                    l = rng.randint(1, 10)
                     question_text = f"How many millilitres is {l}L?"
                     correct_answer = l * 1000
                     explanation = f"{l}L = {l * 1000}ml"
@@ -670,22 +893,22 @@ class QuestionBank:
             else:  # time
                 if year_num <= 2:
                     # Years 1-2: Simple time
-                    hour = random.randint(1, 12)
-                    minute = random.choice([0, 15, 30, 45])
+                    hour = rng.randint(1, 12)
+                    minute = rng.choice([0, 15, 30, 45])
                     question_text = f"What time is {hour}:{minute:02d}?"
                     correct_answer = f"{hour}:{minute:02d}"
                     explanation = f"The time is {hour}:{minute:02d}"
                 
                 elif year_num <= 4:
                     # Years 3-4: Time calculations
-                    hours = random.randint(1, 5)
+                    hours = rng.randint(1, 5)
                     question_text = f"How many minutes are in {hours} hours?"
                     correct_answer = hours * 60
                     explanation = f"{hours} hours = {hours * 60} minutes"
                 
                 else:
                     # Years 5-6: Complex time
-                    minutes = random.randint(60, 300)
+                    minutes = rng.randint(60, 300)
                     question_text = f"How many hours and minutes is {minutes} minutes?"
                     hours = minutes // 60
                     mins = minutes % 60
@@ -694,205 +917,153 @@ class QuestionBank:
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
                 if measurement_type == 'length':
-                    wrong = random.randint(1, 20)
+                    wrong = rng.randint(1, 20)
                 elif measurement_type == 'mass':
-                    wrong = random.randint(1, 20)
+                    wrong = rng.randint(1, 20)
                 elif measurement_type == 'capacity':
-                    wrong = random.randint(1, 20)
+                    wrong = rng.randint(1, 20)
                 else:  # time
                     if year_num <= 2:
-                        wrong = f"{random.randint(1, 12)}:{random.choice([0, 15, 30, 45]):02d}"
+                        wrong = f"{rng.randint(1, 12)}:{rng.choice([0, 15, 30, 45]):02d}"
                     elif year_num <= 4:
-                        wrong = random.randint(30, 300)
+                        wrong = rng.randint(30, 300)
                     else:
-                        wrong = f"{random.randint(1, 5)}h {random.randint(0, 59)}m"
+                        wrong = f"{rng.randint(1, 5)}h {rng.randint(0, 59)}m"
                 
-                if wrong != correct_answer and wrong not in wrong_answers:
+                if wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
-        
-        return questions
+            }
+
+    def _iter_geometry_shape_questions(self, year_group, difficulty, rng):
+        """Stream geometry shape questions without repeating until the space is exhausted"""
+        return self._iter_question_space('geometry_shape', year_group, difficulty, rng)
 
-    def _generate_geometry_shape_questions(self, year_group, difficulty, num_questions):
-        """Generate geometry shape questions"""
-        questions = []
+    def _enumerate_geometry_shape_questions(self, year_group, difficulty):
+        """Enumerate every geometry shape question for a year group"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
+        if year_num <= 4:
             if year_num <= 2:
                 # Years 1-2: Basic shapes
-                shapes = ['circle', 'square', 'triangle', 'rectangle']
-                shape = random.choice(shapes)
-                question_text = f"How many sides does a {shape} have?"
-                
-                if shape == 'circle':
-                    correct_answer = 0
-                elif shape == 'square':
-                    correct_answer = 4
-                elif shape == 'triangle':
-                    correct_answer = 3
-                elif shape == 'rectangle':
-                    correct_answer = 4
-                
-                explanation = f"A {shape} has {correct_answer} sides."
-            
-            elif year_num <= 4:
-                # Years 3-4: Properties of shapes
-                shapes = ['square', 'rectangle', 'triangle', 'pentagon', 'hexagon']
-                shape = random.choice(shapes)
-                question_text = f"How many sides does a {shape} have?"
-                
-                if shape == 'square':
-                    correct_answer = 4
-                elif shape == 'rectangle':
-                    correct_answer = 4
-                elif shape == 'triangle':
-                    correct_answer = 3
-                elif shape == 'pentagon':
-                    correct_answer = 5
-                elif shape == 'hexagon':
-                    correct_answer = 6
-                
-                explanation = f"A {shape} has {correct_answer} sides."
-            
+                sides = {'circle': 0, 'square': 4, 'triangle': 3, 'rectangle': 4}
             else:
-                # Years 5-6: Angles and properties
-                angle_type = random.choice(['acute', 'obtuse', 'right', 'straight'])
-                question_text = f"What type of angle is {random.choice([45, 90, 120, 180])} degrees?"
-                
-                if angle_type == 'acute':
-                    angle = 45
-                    correct_answer = 'acute'
-                elif angle_type == 'right':
-                    angle = 90
-                    correct_answer = 'right'
-                elif angle_type == 'obtuse':
-                    angle = 120
-                    correct_answer = 'obtuse'
-                else:  # straight
-                    angle = 180
-                    correct_answer = 'straight'
-                
-                question_text = f"What type of angle is {angle} degrees?"
-                explanation = f"An angle of {angle} degrees is a {correct_answer} angle."
-            
-            # Generate wrong answers
-            wrong_answers = []
-            while len(wrong_answers) < 3:
-                if year_num <= 4:
-                    wrong = random.randint(0, 8)
-                else:
-                    wrong = random.choice(['acute', 'obtuse', 'right', 'straight'])
-                
-                if wrong != correct_answer and wrong not in wrong_answers:
-                    wrong_answers.append(wrong)
-            
-            # Shuffle answers
-            all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+                # Years 3-4: Properties of shapes
+                sides = {'square': 4, 'rectangle': 4, 'triangle': 3, 'pentagon': 5, 'hexagon': 6}
             
-            questions.append({
-                'question': question_text,
-                'options': all_answers,
-                'correct_answer': correct_answer,
-                'explanation': explanation
-            })
+            return [
+                {
+                    'question': f"How many sides does a {shape} have?",
+                    'correct_answer': count,
+                    'explanation': f"A {shape} has {count} sides.",
+                    'distractors': [wrong for wrong in range(0, 9) if wrong != count],
+                    'diagram': self._shape_diagram(shape, count)
+                }
+                for shape, count in sides.items()
+            ]
         
-        return questions
+        # Years 5-6: Angles and properties
+        angle_types = {45: 'acute', 90: 'right', 120: 'obtuse', 180: 'straight'}
+        return [
+            {
+                'question': f"What type of angle is {angle} degrees?",
+                'correct_answer': angle_type,
+                'explanation': f"An angle of {angle} degrees is a {angle_type} angle.",
+                'distractors': [wrong for wrong in angle_types.values() if wrong != angle_type],
+                'diagram': {'kind': 'angle', 'degrees': angle}
+            }
+            for angle, angle_type in angle_types.items()
+        ]
+
+    def _shape_diagram(self, shape, sides):
+        """Diagram parameters for a named 2D shape"""
+        if shape == 'circle':
+            return {'kind': 'circle'}
+        if shape == 'rectangle':
+            return {'kind': 'rectangle'}
+        return {'kind': 'polygon', 'sides': sides}
 
-    def _generate_geometry_position_questions(self, year_group, difficulty, num_questions):
-        """Generate geometry position questions"""
-        questions = []
+    def _iter_geometry_position_questions(self, year_group, difficulty, rng):
+        """Stream geometry position questions without repeating until the space is exhausted"""
+        return self._iter_question_space('geometry_position', year_group, difficulty, rng)
+
+    def _enumerate_geometry_position_questions(self, year_group, difficulty):
+        """Enumerate every geometry position question for a year group"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
-            if year_num <= 2:
-                # Years 1-2: Basic position words
-                positions = ['above', 'below', 'left', 'right', 'in front of', 'behind']
-                position = random.choice(positions)
-                question_text = f"What is the opposite of '{position}'?"
-                
-                opposites = {
-                    'above': 'below',
-                    'below': 'above',
-                    'left': 'right',
-                    'right': 'left',
-                    'in front of': 'behind',
-                    'behind': 'in front of'
+        if year_num <= 2:
+            # Years 1-2: Basic position words
+            opposites = {
+                'above': 'below',
+                'below': 'above',
+                'left': 'right',
+                'right': 'left',
+                'in front of': 'behind',
+                'behind': 'in front of'
+            }
+            return [
+                {
+                    'question': f"What is the opposite of '{position}'?",
+                    'correct_answer': opposite,
+                    'explanation': f"The opposite of '{position}' is '{opposite}'.",
+                    'distractors': [wrong for wrong in opposites if wrong != opposite]
                 }
-                correct_answer = opposites[position]
-                explanation = f"The opposite of '{position}' is '{correct_answer}'."
-            
-            elif year_num <= 4:
-                # Years 3-4: Coordinates
-                x = random.randint(1, 5)
-                y = random.randint(1, 5)
-                question_text = f"What are the coordinates of point ({x}, {y})?"
-                correct_answer = f"({x}, {y})"
-                explanation = f"The coordinates are ({x}, {y})."
-            
-            else:
-                # Years 5-6: Reflections and translations
-                transformations = ['reflection', 'translation', 'rotation']
-                transform = random.choice(transformations)
-                question_text = f"What type of transformation moves a shape without changing its size?"
-                correct_answer = 'translation'
-                explanation = "Translation moves a shape without changing its size or shape."
-            
-            # Generate wrong answers
-            wrong_answers = []
-            while len(wrong_answers) < 3:
-                if year_num <= 2:
-                    wrong = random.choice(['above', 'below', 'left', 'right', 'in front of', 'behind'])
-                elif year_num <= 4:
-                    wrong = f"({random.randint(1, 5)}, {random.randint(1, 5)})"
-                else:
-                    wrong = random.choice(['reflection', 'translation', 'rotation'])
-                
-                if wrong != correct_answer and wrong not in wrong_answers:
-                    wrong_answers.append(wrong)
-            
-            # Shuffle answers
-            all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
-            
-            questions.append({
-                'question': question_text,
-                'options': all_answers,
-                'correct_answer': correct_answer,
-                'explanation': explanation
-            })
+                for position, opposite in opposites.items()
+            ]
+        
+        if year_num <= 4:
+            # Years 3-4: Coordinates, read off a grid with each point under its own letter
+            grid_points = [(x, y) for x in range(1, 6) for y in range(1, 6)]
+            points = [f"({x}, {y})" for x, y in grid_points]
+            return [
+                {
+                    'question': f"What are the coordinates of point {chr(65 + index)}?",
+                    'correct_answer': point,
+                    'explanation': f"Point {chr(65 + index)} is {x} across and {y} up, so its coordinates are {point}.",
+                    'distractors': [wrong for wrong in points if wrong != point],
+                    'diagram': {'kind': 'grid', 'size': 6, 'point': [x, y], 'label': chr(65 + index)}
+                }
+                for index, ((x, y), point) in enumerate(zip(grid_points, points))
+            ]
         
-        return questions
+        # Years 5-6: Reflections and translations
+        return [
+            {
+                'question': "What type of transformation moves a shape without changing its size?",
+                'correct_answer': 'translation',
+                'explanation': "Translation moves a shape without changing its size or shape.",
+                'distractors': ['reflection', 'rotation', 'enlargement']
+            }
+        ]
 
-    def _generate_statistics_questions(self, year_group, difficulty, num_questions):
-        """Generate statistics questions"""
-        questions = []
+    def _iter_statistics_questions(self, year_group, difficulty, rng):
+        """Stream statistics questions indefinitely"""
         year_num = int(year_group.split()[-1])
         
-        for i in range(num_questions):
+        while True:
             if year_num <= 2:
                 # Years 1-2: Simple counting
-                numbers = [random.randint(1, 5) for _ in range(4)]
+                numbers = [rng.randint(1, 5) for _ in range(4)]
                 question_text = f"How many items are there: {', '.join(map(str, numbers))}?"
                 correct_answer = len(numbers)
                 explanation = f"There are {len(numbers)} items in the list."
             
             elif year_num <= 4:
                 # Years 3-4: Mode and range
-                numbers = [random.randint(1, 10) for _ in range(5)]
+                numbers = [rng.randint(1, 10) for _ in range(5)]
                 question_text = f"What is the mode of {numbers}?"
                 from collections import Counter
                 counter = Counter(numbers)
@@ -901,50 +1072,50 @@ class QuestionBank:
             
             else:
                 # Years 5-6: Mean and median
-                numbers = sorted([random.randint(1, 20) for _ in range(5)])
+                numbers = sorted([rng.randint(1, 20) for _ in range(5)])
                 question_text = f"What is the median of {numbers}?"
                 correct_answer = numbers[2]  # Middle number
                 explanation = f"The median is {correct_answer} (middle number when ordered)."
             
             # Generate wrong answers
             wrong_answers = []
+            seen_answers = {correct_answer}
             while len(wrong_answers) < 3:
                 if year_num <= 2:
-                    wrong = random.randint(1, 10)
+                    wrong = rng.randint(1, 10)
                 elif year_num <= 4:
-                    wrong = random.randint(1, 10)
+                    wrong = rng.randint(1, 10)
                 else:
-                    wrong = random.randint(1, 20)
+                    wrong = rng.randint(1, 20)
                 
-                if wrong != correct_answer and wrong not in wrong_answers:
+                if wrong not in seen_answers:
+                    seen_answers.add(wrong)
                     wrong_answers.append(wrong)
             
             # Shuffle answers
             all_answers = [correct_answer] + wrong_answers
-            random.shuffle(all_answers)
+            rng.shuffle(all_answers)
             
-            questions.append({
+            yield {
                 'question': question_text,
                 'options': all_answers,
                 'correct_answer': correct_answer,
                 'explanation': explanation
-            })
-        
-        return questions
+            }
 
     # Placeholder methods for other subjects
-    def _generate_science_questions(self, topic, year_group, difficulty, num_questions):
-        """Generate science questions - placeholder for now"""
-        return []
+    def _iter_science_questions(self, topic, year_group, difficulty, rng):
+        """Stream science questions - placeholder for now"""
+        return iter(())
 
-    def _generate_computing_questions(self, topic, year_group, difficulty, num_questions):
-        """Generate computing questions - placeholder for now"""
-        return []
+    def _iter_computing_questions(self, topic, year_group, difficulty, rng):
+        """Stream computing questions - placeholder for now"""
+        return iter(())
 
-    def _generate_history_questions(self, topic, year_group, difficulty, num_questions):
-        """Generate history questions - placeholder for now"""
-        return []
+    def _iter_history_questions(self, topic, year_group, difficulty, rng):
+        """Stream history questions - placeholder for now"""
+        return iter(())
 
-    def _generate_geography_questions(self, topic, year_group, difficulty, num_questions):
-        """Generate geography questions - placeholder for now"""
-        return []
+    def _iter_geography_questions(self, topic, year_group, difficulty, rng):
+        """Stream geography questions - placeholder for now"""
+        return iter(())
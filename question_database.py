@@ -1,7 +1,7 @@
 import json
 import os
 import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 from datetime import datetime
 
 class QuestionDatabase:
@@ -169,37 +169,57 @@ class QuestionDatabase:
             print(f"⚠️ No question file found for {subject}: {filename}")
             self.questions_cache[subject] = {}
     
-    def get_questions(self, subject: str, topic: str, year_group: str, difficulty: str, num_questions: int) -> List[Dict]:
+    def get_questions(self, subject: str, topic: str, year_group: str, difficulty: str, num_questions: int,
+                      rng: Optional[random.Random] = None) -> List[Dict]:
         """Get questions for the specified criteria with hot-reload"""
+        return list(self.iter_questions(subject, topic, year_group, difficulty, num_questions, rng=rng))
+
+    def iter_questions(self, subject: str, topic: str, year_group: str, difficulty: str, num_questions: int,
+                       rng: Optional[random.Random] = None) -> Iterator[Dict]:
+        """Stream randomly selected questions for the specified criteria with hot-reload
+        
+        Pass a per-request random.Random as rng; without one a private
+        instance is created so the shared module-level state is never used.
+        """
+        if rng is None:
+            rng = random.Random()
+        
         # Check if we need to reload the subject's questions
         self._load_subject_questions(subject)
         
-        questions = []
         subject_questions = self.questions_cache.get(subject, {})
         topic_questions = subject_questions.get(topic, {})
         year_questions = topic_questions.get(year_group, {})
-        difficulty_questions = year_questions.get(difficulty, [])
         
-        if difficulty_questions:
-            # Randomly select questions
-            selected_questions = random.sample(difficulty_questions, min(num_questions, len(difficulty_questions)))
-            questions.extend(selected_questions)
+        # Requested difficulty first, then other difficulties if we don't have enough
+        difficulties = [difficulty] + [d for d in year_questions.keys() if d != difficulty]
+        remaining_needed = num_questions
         
-        # If we don't have enough questions, try other difficulties
-        if len(questions) < num_questions:
-            remaining_needed = num_questions - len(questions)
-            other_difficulties = [d for d in year_questions.keys() if d != difficulty]
+        for selected_diff in difficulties:
+            if remaining_needed <= 0:
+                break
+            pool = year_questions.get(selected_diff, [])
             
-            for other_diff in other_difficulties:
-                if remaining_needed <= 0:
-                    break
-                other_questions = year_questions[other_diff]
-                additional = random.sample(other_questions, min(remaining_needed, len(other_questions)))
-                questions.extend(additional)
-                remaining_needed -= len(additional)
-        
-        return questions[:num_questions]
-    
+            # Randomly select indices so only the chosen questions are touched
+            for index in rng.sample(range(len(pool)), min(remaining_needed, len(pool))):
+                yield pool[index]
+                remaining_needed -= 1
+
+    def iter_all_questions(self) -> Iterator[Dict]:
+        """Stream every loaded question across all subjects"""
+        for subject_questions in self.questions_cache.values():
+            for topic_questions in subject_questions.values():
+                for year_questions in topic_questions.values():
+                    for questions in year_questions.values():
+                        yield from questions
+
+    def count_questions(self, subject: str, topic: str, year_group: str) -> int:
+        """Count the distinct questions get_questions can draw from for a year group"""
+        self._load_subject_questions(subject)
+
+        year_questions = self.questions_cache.get(subject, {}).get(topic, {}).get(year_group, {})
+        return sum(len(questions) for questions in year_questions.values())
+
     def add_question(self, subject: str, question_data: Dict) -> bool:
         """Add a new question to the appropriate JSON file"""
         try:
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Worksheet renderer benchmark
+Renders the same question lists with the platypus and direct-canvas
+backends and reports the time per worksheet, pages and size for each, so
+the speedup of the fast path can be checked on real content. A second
+table does the same for multi-copy printing, where the canvas backend
+shares one form XObject per page across every copy, and a third compares
+the standard and compact layouts across every topic of the subject.
+With --calibrate it instead fits the render cost estimator's coefficients
+to timed renders and can write them out for the app to load.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pdf_generator import PDFGenerator
+from question_bank import QuestionBank, new_seed
+from render_estimate import RenderEstimator, fit_line
+
+def benchmark(render, repeat):
+    """Call render repeat times, returning (seconds per render, PDF bytes)"""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        data = render()
+    return (time.perf_counter() - start_time) / repeat, data
+
+def page_count(pdf):
+    """Count the pages in a reportlab PDF"""
+    return pdf.count(b'/Type /Page\n')
+
+def report(label, platypus_result, canvas_result):
+    """Print one comparison line"""
+    (platypus_time, platypus_pdf), (canvas_time, canvas_pdf) = platypus_result, canvas_result
+    print(f"  {label}: "
+          f"platypus {platypus_time * 1000:7.1f} ms {page_count(platypus_pdf):4d} pages {len(platypus_pdf) / 1024:7.1f} KB | "
+          f"canvas {canvas_time * 1000:7.1f} ms {page_count(canvas_pdf):4d} pages {len(canvas_pdf) / 1024:7.1f} KB | "
+          f"{platypus_time / max(canvas_time, 1e-9):.1f}x faster, {len(platypus_pdf) / max(len(canvas_pdf), 1):.1f}x smaller")
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Compare platypus and direct-canvas worksheet rendering")
+    parser.add_argument('--subject', default='maths')
+    parser.add_argument('--topic', default='addition_subtraction')
+    parser.add_argument('--year-group', default='Year 5')
+    parser.add_argument('--difficulty', default='Medium')
+    parser.add_argument('--sizes', default='10,50,200', help="Comma-separated worksheet sizes")
+    parser.add_argument('--repeat', type=int, default=5, help="Renders per size and backend")
+    parser.add_argument('--copies', default='1,10,30', help="Comma-separated copy counts for a 20-question worksheet")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible questions")
+    parser.add_argument('--calibrate', action='store_true', help="Fit the render cost estimator instead")
+    parser.add_argument('--output', default=None, help="Write calibrated coefficients to this JSON file")
+    args = parser.parse_args(argv)
+
+    question_bank = QuestionBank()
+    generator = PDFGenerator()
+    seed = args.seed if args.seed is not None else new_seed()
+
+    if args.calibrate:
+        return calibrate(question_bank, generator, args, seed)
+
+    print(f"📊 {args.subject} / {args.topic} / {args.year_group} / {args.difficulty}, "
+          f"{args.repeat} renders each, seed {seed}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        questions = question_bank.generate_questions(
+            args.subject, args.topic, args.year_group, args.difficulty, size, seed=seed
+        )
+        model = generator._document_model(
+            questions, args.subject, args.topic, args.year_group, args.difficulty
+        )
+        report(
+            f"{len(questions):4d} questions",
+            benchmark(lambda: generator.render_bytes('worksheet_model', model), args.repeat),
+            benchmark(lambda: generator.render_bytes('worksheet_canvas', model), args.repeat)
+        )
+
+    print("🖨️ Copies of one 20-question worksheet")
+    questions = question_bank.generate_questions(
+        args.subject, args.topic, args.year_group, args.difficulty, 20, seed=seed
+    )
+    details = (questions, args.subject, args.topic, args.year_group, args.difficulty)
+    for copies in (int(value) for value in args.copies.split(',')):
+        report(
+            f"{copies:4d} copies  ",
+            benchmark(lambda: generator.render_worksheet(*details, copies=copies), args.repeat),
+            benchmark(lambda: generator.render_worksheet(*details, renderer='canvas', copies=copies), args.repeat)
+        )
+
+    print(f"📐 Compact layout, 20 questions per {args.subject} topic")
+    totals = {'standard': [0, 0], 'compact': [0, 0]}
+    for topic in question_bank.get_topics(args.subject):
+        try:
+            questions = question_bank.generate_questions(
+                args.subject, topic, args.year_group, args.difficulty, 20, seed=seed
+            )
+        except Exception as e:
+            print(f"  ⚠️ {topic}: {e}")
+            continue
+        if not questions:
+            continue
+
+        line = []
+        for layout in ('standard', 'compact'):
+            pdf = generator.render_worksheet(
+                questions, args.subject, topic, args.year_group, args.difficulty, layout=layout
+            )
+            totals[layout][0] += page_count(pdf)
+            totals[layout][1] += len(pdf)
+            line.append(f"{layout} {page_count(pdf):3d} pages {len(pdf) / 1024:6.1f} KB")
+        print(f"  {topic:24s}: {' | '.join(line)}")
+
+    (standard_pages, standard_bytes), (compact_pages, compact_bytes) = totals['standard'], totals['compact']
+    if standard_pages:
+        print(f"  Total: {standard_pages} -> {compact_pages} pages "
+              f"({(1 - compact_pages / standard_pages) * 100:.0f}% fewer), "
+              f"{standard_bytes / 1024:.1f} -> {compact_bytes / 1024:.1f} KB "
+              f"({(1 - compact_bytes / standard_bytes) * 100:.0f}% smaller)")
+    return 0
+
+def calibrate(question_bank, generator, args, seed):
+    """Fit seconds-per-line for each backend and the answer key, then check the estimates"""
+    estimator = RenderEstimator()
+    renders = {
+        'platypus': lambda model: generator.render_bytes('worksheet_model', model),
+        'canvas': lambda model: generator.render_bytes('worksheet_canvas', model),
+        'compact': lambda model: generator.render_bytes('worksheet_compact', model),
+        'answer_key': lambda model: generator.render_bytes('answer_key_model', model)
+    }
+    samples = {kind: [] for kind in renders}
+    question_lists = []
+
+    print(f"📏 Calibrating on {args.subject} / {args.topic} / {args.year_group}, seed {seed}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        questions = question_bank.generate_questions(
+            args.subject, args.topic, args.year_group, args.difficulty, size, seed=seed
+        )
+        question_lists.append(questions)
+        model = generator._document_model(
+            questions, args.subject, args.topic, args.year_group, args.difficulty
+        )
+        for kind, render in renders.items():
+            measured = estimator.measure(questions, 'compact' if kind == 'compact' else 'standard')
+            lines = measured['answer_lines'] if kind == 'answer_key' else measured['lines']
+            seconds, _ = benchmark(lambda: render(model), args.repeat)
+            samples[kind].append((lines, seconds))
+
+    coefficients = {}
+    for kind, points in samples.items():
+        overhead, per_line = fit_line(points)
+        coefficients[kind] = {'overhead': round(overhead, 5), 'per_line': round(per_line, 7)}
+        print(f"  {kind:10s}: {overhead * 1000:6.2f} ms + {per_line * 1e6:6.1f} µs per line")
+
+    calibrated = RenderEstimator(coefficients)
+    print("🎯 Estimate vs actual (worksheet and answer key)")
+    for questions in question_lists:
+        details = (questions, args.subject, args.topic, args.year_group, args.difficulty)
+        for renderer, layout in (('platypus', 'standard'), ('canvas', 'standard'), ('platypus', 'compact')):
+            seconds, (worksheet_pdf, _) = benchmark(
+                lambda: generator.render_worksheet_and_answer_key(*details, renderer=renderer, layout=layout), 1
+            )
+            estimate = calibrated.estimate(questions, renderer=renderer, layout=layout)
+            print(f"  {len(questions):4d} questions {renderer:8s} {layout:8s}: "
+                  f"{estimate['pages']:4d} / {page_count(worksheet_pdf):4d} pages, "
+                  f"{estimate['seconds'] * 1000:7.1f} / {seconds * 1000:7.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(coefficients, f, indent=2)
+        print(f"💾 Coefficients written to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
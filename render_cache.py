@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for rendered PDFs
+Keys are a hash of the template version, the question content and the
+worksheet metadata, so identical requests are served without touching
+reportlab. A small memory tier sits in front of a bounded disk tier.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import string
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Characters allowed in keys, so a key can never name a path outside disk_dir
+KEY_CHARACTERS = frozenset(string.hexdigits + '-')
+
+class RenderCache:
+    """Two-tier LRU cache of rendered PDF bytes
+
+    The memory tier is bounded by total bytes; the disk tier by total bytes
+    on disk, with files written atomically so concurrent workers sharing a
+    cache directory never read half-written PDFs. Each process keeps its
+    own index of the directory: a lookup that misses the index checks the
+    file itself, and the index is rebuilt from the filesystem every
+    rescan_interval writes so the size bound covers what other processes
+    have added.
+    """
+
+    def __init__(self, max_memory_mb=64, disk_dir=None, max_disk_mb=512, rescan_interval=50):
+        self.memory = OrderedDict()
+        self.max_memory_size = max_memory_mb * 1024 * 1024
+        self.memory_size = 0
+
+        self.disk_dir = disk_dir
+        self.max_disk_size = max_disk_mb * 1024 * 1024
+        self.disk_index = OrderedDict()
+        self.disk_size = 0
+        self.rescan_interval = rescan_interval
+        self.writes_since_rescan = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(kind, template_version, questions, metadata, dynamic=()):
+        """Build a cache key for a render
+
+        The static part hashes everything that shapes the document. Values
+        that change on their own schedule, such as the footer date, are
+        passed as dynamic and appended in the clear, so a new day produces
+        a new key without rehashing and stale days simply age out.
+        """
+        payload = json.dumps(
+            [kind, template_version, metadata, questions],
+            sort_keys=True, default=str, ensure_ascii=False
+        )
+        static_key = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        if not dynamic:
+            return static_key
+        return static_key + '-' + hashlib.sha256('|'.join(map(str, dynamic)).encode('utf-8')).hexdigest()[:16]
+
+    def get(self, key):
+        """Get rendered bytes from memory, then disk; None on a miss"""
+        if not self._valid_key(key):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+            if key in self.disk_index:
+                self.disk_index.move_to_end(key)
+
+        if self.disk_dir:
+            # Read the file even when the index lacks it: another process
+            # sharing the directory may have written it since the last scan
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                data = None
+
+        with self.lock:
+            if data is None:
+                if key in self.disk_index:
+                    self.disk_size -= self.disk_index.pop(key)
+                self.misses += 1
+                return None
+            if key not in self.disk_index:
+                self.disk_index[key] = len(data)
+                self.disk_size += len(data)
+            self.hits += 1
+            self._store_memory(key, data)
+            return data
+
+    def get_file(self, key):
+        """Get the path of an entry's file in the disk tier; None if it has none
+
+        Lets a caller hand the file to sendfile or the web server instead of
+        reading it into memory. Counts as a hit and refreshes the entry's
+        age like get does.
+        """
+        if not self.disk_dir or not self._valid_key(key):
+            return None
+
+        path = self._disk_path(key)
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+
+        with self.lock:
+            if key in self.disk_index:
+                self.disk_index.move_to_end(key)
+            else:
+                self.disk_index[key] = size
+                self.disk_size += size
+            self.hits += 1
+        return path
+
+    def set(self, key, data):
+        """Store rendered bytes in both tiers"""
+        if not self._valid_key(key):
+            raise ValueError(f"Invalid render cache key: {key!r}")
+
+        data = bytes(data)
+        with self.lock:
+            self._store_memory(key, data)
+
+        if self.disk_dir and len(data) <= self.max_disk_size:
+            self._store_disk(key, data)
+
+    def get_stats(self):
+        """Get cache statistics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0,
+                'memory_entries': len(self.memory),
+                'memory_size_mb': self.memory_size / (1024 * 1024),
+                'disk_entries': len(self.disk_index),
+                'disk_size_mb': self.disk_size / (1024 * 1024)
+            }
+
+    def clear(self):
+        """Clear both tiers"""
+        with self.lock:
+            self.memory.clear()
+            self.memory_size = 0
+            for key in list(self.disk_index):
+                self._drop_disk_entry(key)
+
+    def _store_memory(self, key, data):
+        """Add to the memory tier, evicting least recently used entries (lock held)"""
+        if len(data) > self.max_memory_size:
+            return
+
+        old_data = self.memory.pop(key, None)
+        if old_data is not None:
+            self.memory_size -= len(old_data)
+
+        while self.memory_size + len(data) > self.max_memory_size and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+        self.memory[key] = data
+        self.memory_size += len(data)
+
+    def _store_disk(self, key, data):
+        """Write to the disk tier atomically, then enforce the size bound"""
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Render cache disk write failed: {e}")
+            return
+
+        with self.lock:
+            self.writes_since_rescan += 1
+            if self.writes_since_rescan >= self.rescan_interval:
+                self._load_disk_index()
+            else:
+                if key in self.disk_index:
+                    self.disk_size -= self.disk_index.pop(key)
+                self.disk_index[key] = len(data)
+                self.disk_size += len(data)
+
+            while self.disk_size > self.max_disk_size and self.disk_index:
+                self._drop_disk_entry(next(iter(self.disk_index)))
+
+    def _drop_disk_entry(self, key):
+        """Remove a disk entry and its file (lock held)"""
+        size = self.disk_index.pop(key, None)
+        if size is not None:
+            self.disk_size -= size
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _valid_key(key):
+        """Check a key is non-empty and safe to use as a file name"""
+        return bool(key) and isinstance(key, str) and KEY_CHARACTERS.issuperset(key)
+
+    def _disk_path(self, key):
+        """Fan entries out over subdirectories to keep directories small"""
+        return os.path.join(self.disk_dir, key[:2], key + '.pdf')
+
+    def _load_disk_index(self):
+        """Rebuild the disk index from the filesystem, least recently used first"""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for filename in files:
+                if filename.endswith('.pdf'):
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except OSError:
+                        # Evicted by another process mid-scan
+                        continue
+                    entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+
+        self.disk_index.clear()
+        self.disk_size = 0
+        self.writes_since_rescan = 0
+        for _, key, size in sorted(entries):
+            self.disk_index[key] = size
+            self.disk_size += size
+
+        while self.disk_size > self.max_disk_size and self.disk_index:
+            self._drop_disk_entry(next(iter(self.disk_index)))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Render cost estimation
+Predicts a worksheet's page count and the CPU time to render it and its
+answer key from the question list alone, using the standard font metrics
+and the worksheet layout's spacing. The time model is linear in laid-out
+lines and answer rows; its coefficients come from
+render_benchmark.py --calibrate on the machine that serves renders.
+"""
+
+import json
+import math
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from diagrams import diagram_size
+
+# Frame of a SimpleDocTemplate page: 1 inch margins less 6pt padding each side
+FRAME_WIDTH = A4[0] - 2 * inch - 12
+FRAME_HEIGHT = A4[1] - 2 * inch - 12
+
+# Header and footer height of a worksheet, in points
+HEADER_HEIGHT = 170
+FOOTER_HEIGHT = 45
+
+# Font size, leading, indent and spacing of the worksheet layouts (see PDFGenerator's styles)
+QUESTION = {'size': 12, 'leading': 12, 'indent': 20, 'before': 15, 'after': 10, 'gap': 10}
+COMPACT_QUESTION = dict(QUESTION, before=8, after=4, gap=4)
+OPTION = {'size': 11, 'leading': 12, 'indent': 40, 'after': 5}
+
+# Answer key explanation column width, less cell padding
+EXPLANATION_WIDTH = 3 * inch - 12
+
+class RenderEstimator:
+    """Cheap page-count and render-time prediction for admission control
+
+    Line counts come from the width of each string in the standard fonts,
+    without word wrapping, so an estimate costs a few microseconds per
+    question. Rendering is predicted as overhead + per_line * lines for
+    the worksheet plus overhead + per_line * explanation lines for the key.
+    """
+
+    # Seconds per document and per laid-out line, from render_benchmark.py --calibrate
+    DEFAULT_COEFFICIENTS = {
+        'platypus': {'overhead': 0.003, 'per_line': 0.00044},
+        'canvas': {'overhead': 0.001, 'per_line': 0.00009},
+        'compact': {'overhead': 0.002, 'per_line': 0.00135},
+        'answer_key': {'overhead': 0.002, 'per_line': 0.00116}
+    }
+
+    def __init__(self, coefficients=None):
+        self.coefficients = {kind: dict(values) for kind, values in self.DEFAULT_COEFFICIENTS.items()}
+        for kind, values in (coefficients or {}).items():
+            self.coefficients.setdefault(kind, {}).update(values)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load calibrated coefficients written by render_benchmark.py --calibrate"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def measure(self, questions, layout='standard'):
+        """Count laid-out worksheet lines, answer key lines and worksheet pages"""
+        question_style = COMPACT_QUESTION if layout == 'compact' else QUESTION
+        question_width = FRAME_WIDTH - question_style['indent']
+        option_width = FRAME_WIDTH - OPTION['indent']
+
+        lines = 0
+        answer_lines = 0
+        height = HEADER_HEIGHT + FOOTER_HEIGHT
+        for number, question in enumerate(questions, 1):
+            text_width = (
+                stringWidth(f"Question {number}: ", 'Helvetica-Bold', question_style['size'])
+                + stringWidth(str(question.get('question', '')), 'Helvetica', question_style['size'])
+            )
+            question_lines = math.ceil(text_width / question_width) or 1
+
+            option_widths = [
+                stringWidth("A. ", 'Helvetica-Bold', OPTION['size']) + stringWidth(str(option), 'Helvetica', OPTION['size'])
+                for option in question.get('options', [])
+            ]
+            if layout == 'compact':
+                # Options share rows when the widest fits a quarter or half of the line
+                widest = max(option_widths, default=0) + 12
+                columns = 4 if widest <= option_width / 4 else 2 if widest <= option_width / 2 else 1
+                option_lines = math.ceil(len(option_widths) / columns)
+                option_height = option_lines * (OPTION['leading'] + OPTION['after'])
+            else:
+                option_lines = sum(math.ceil(width / option_width) or 1 for width in option_widths)
+                option_height = option_lines * OPTION['leading'] + len(option_widths) * OPTION['after']
+
+            lines += question_lines + option_lines
+            height += (
+                question_style['before'] + question_lines * question_style['leading'] + question_style['after']
+                + option_height + question_style['gap']
+            )
+            if question.get('diagram'):
+                height += diagram_size(question['diagram'])[1] + 6
+            answer_lines += math.ceil(stringWidth(str(question.get('explanation', '')), 'Helvetica', 10) / EXPLANATION_WIDTH) or 1
+
+        return {
+            'lines': lines,
+            'answer_lines': answer_lines,
+            'pages': max(1, math.ceil(height / FRAME_HEIGHT))
+        }
+
+    def estimate(self, questions, renderer='platypus', layout='standard', copies=1, answer_key=True):
+        """Predict pages and render seconds for a worksheet (and its answer key)
+
+        The canvas backend only draws the standard layout, so a compact
+        request is always costed with the compact (platypus) coefficients.
+        """
+        questions = list(questions)
+        measured = self.measure(questions, layout)
+
+        backend = self.coefficients['compact' if layout == 'compact' else renderer]
+        seconds = backend['overhead'] + backend['per_line'] * measured['lines']
+        if answer_key:
+            key = self.coefficients['answer_key']
+            seconds += key['overhead'] + key['per_line'] * measured['answer_lines']
+
+        return {
+            'questions': len(questions),
+            'lines': measured['lines'],
+            'pages': measured['pages'] * copies,
+            'seconds': round(seconds, 4)
+        }
+
+    def estimate_class_set(self, question_lists):
+        """Predict pages and render seconds for a class set, one platypus worksheet per pupil
+
+        Each pupil is costed as a worksheet with its own answer key, which
+        slightly overstates the one combined key a class set has.
+        """
+        estimates = [self.estimate(questions) for questions in question_lists]
+        return {
+            'questions': sum(estimate['questions'] for estimate in estimates),
+            'lines': sum(estimate['lines'] for estimate in estimates),
+            'pages': sum(estimate['pages'] for estimate in estimates),
+            'seconds': round(sum(estimate['seconds'] for estimate in estimates), 4)
+        }
+
+def fit_line(samples):
+    """Least-squares (intercept, slope) for (x, seconds) samples"""
+    count = len(samples)
+    mean_x = sum(x for x, _ in samples) / count
+    mean_y = sum(y for _, y in samples) / count
+    spread = sum((x - mean_x) ** 2 for x, _ in samples)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in samples) / spread if spread else 0
+    return max(0.0, mean_y - slope * mean_x), max(0.0, slope)
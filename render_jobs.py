@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Background render job queue
+Renders predicted to take too long for a web request are queued here and
+run on background threads, shortest estimate first, so a burst of large
+worksheets cannot hold up small ones queued behind them. Clients poll a
+job by ID until its result is ready, and may cancel it. Every job runs
+under a RenderDeadline, so one that overruns stops rather than holding a
+worker thread.
+
+Jobs run in the process that queued them, but with a shared directory
+their records are written there too, so a poll or cancel that reaches
+another server process still finds the job.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from render_pool import RenderCancelledError, RenderDeadline, RenderTimeoutError
+
+# How often a process with a shared directory looks for cancel requests for its jobs, in seconds
+CANCEL_CHECK_INTERVAL = 0.5
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds as many waiting jobs as it allows"""
+
+class RenderJobQueue:
+    """Priority queue of render jobs run by a few worker threads
+
+    A job is a callable taking a RenderDeadline and returning a
+    JSON-serialisable result, plus the estimated seconds it will take.
+    Finished jobs are kept for polling until max_finished newer ones have
+    completed.
+
+    With shared_dir, every change to a job is also written there as
+    <job_id>.json, and get() falls back to those records for jobs queued by
+    other processes. cancel() on such a job leaves a <job_id>.cancel marker,
+    which the owning process picks up within CANCEL_CHECK_INTERVAL.
+    """
+
+    def __init__(self, max_workers=1, max_queued=100, max_finished=1000, timeout=60, shared_dir=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.shared_dir = shared_dir
+        self.jobs = {}
+        self.finished = OrderedDict()
+        self._queue = []
+        self._order = itertools.count()
+        self._workers = []
+        self._watcher = None
+        self._available = threading.Condition()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+
+    def submit(self, function, estimated_seconds):
+        """Queue a job and return its ID; QueueFullError when the queue is full"""
+        job_id = secrets.token_hex(16)
+        with self._available:
+            if len(self._queue) >= self.max_queued:
+                raise QueueFullError("Too many worksheets are waiting to be rendered, please try again shortly")
+            self.jobs[job_id] = {
+                'status': 'queued',
+                'estimated_seconds': estimated_seconds,
+                'submitted': time.time(),
+                'result': None,
+                'error': None,
+                'deadline': None
+            }
+            heapq.heappush(self._queue, (estimated_seconds, next(self._order), job_id, function))
+            self.submitted += 1
+            self._save(job_id)
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._run, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            if self.shared_dir and self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_cancellations, daemon=True)
+                self._watcher.start()
+            self._available.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Get a copy of a job's record, or None for an unknown or expired job"""
+        with self._available:
+            job = self.jobs.get(job_id)
+            if job is None:
+                # Queued by another process, if at all; its position is only known there
+                return self._load(job_id)
+            job = dict(job)
+            del job['deadline']
+            if job['status'] == 'queued':
+                # Jobs ahead are those with a smaller (estimate, submission order)
+                entry = next(item[:2] for item in self._queue if item[2] == job_id)
+                job['position'] = sum(1 for item in self._queue if item[:2] < entry)
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; False if it is unknown or already finished
+        
+        A queued job is dropped at once; a running one stops at its
+        render's next deadline check.
+        """
+        with self._available:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return self._request_cancel(job_id)
+            if job['status'] not in ('queued', 'running'):
+                return False
+            if job['status'] == 'running':
+                job['deadline'].cancel()
+                return True
+            self._queue = [item for item in self._queue if item[2] != job_id]
+            heapq.heapify(self._queue)
+            self._finish(job_id, 'cancelled', error="Rendering was cancelled")
+            return True
+
+    def _run(self):
+        """Worker loop: take the shortest queued job, run it and record the outcome"""
+        while True:
+            with self._available:
+                while not self._queue:
+                    self._available.wait()
+                _, _, job_id, function = heapq.heappop(self._queue)
+                deadline = RenderDeadline(self.timeout)
+                self.jobs[job_id].update(status='running', started=time.time(), deadline=deadline)
+                self._save(job_id)
+
+            result = error = None
+            try:
+                result, status = function(deadline), 'done'
+            except RenderCancelledError as e:
+                status, error = 'cancelled', str(e)
+            except RenderTimeoutError as e:
+                status, error = 'timed_out', str(e)
+            except Exception as e:
+                status, error = 'failed', str(e)
+
+            with self._available:
+                self._finish(job_id, status, result, error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        """Record a job's outcome and expire the oldest finished jobs; caller holds the lock"""
+        self.jobs[job_id].update(status=status, result=result, error=error, finished=time.time(), deadline=None)
+        if status == 'done':
+            self.completed += 1
+        elif status == 'cancelled':
+            self.cancelled += 1
+        elif status == 'timed_out':
+            self.timed_out += 1
+        else:
+            self.failed += 1
+        self.finished[job_id] = True
+        self._save(job_id)
+        while len(self.finished) > self.max_finished:
+            expired, _ = self.finished.popitem(last=False)
+            del self.jobs[expired]
+            self._remove(expired)
+
+    def _watch_cancellations(self):
+        """Cancel this process's jobs that another process has asked to stop"""
+        while True:
+            time.sleep(CANCEL_CHECK_INTERVAL)
+            with self._available:
+                active = [job_id for job_id, job in self.jobs.items() if job['status'] in ('queued', 'running')]
+            for job_id in active:
+                if os.path.exists(self._shared_path(job_id, '.cancel')):
+                    self.cancel(job_id)
+
+    def _shared_path(self, job_id, suffix='.json'):
+        """Path of a job's file in the shared directory"""
+        return os.path.join(self.shared_dir, job_id + suffix)
+
+    def _save(self, job_id):
+        """Write a job's record to the shared directory atomically (lock held)"""
+        if not self.shared_dir:
+            return
+        record = {key: value for key, value in self.jobs[job_id].items() if key != 'deadline'}
+        try:
+            os.makedirs(self.shared_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.shared_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(temp_path, self._shared_path(job_id))
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Render job record not shared: {e}")
+
+    def _load(self, job_id):
+        """Read another process's job record from the shared directory; None if there is none"""
+        if not self.shared_dir or not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._shared_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _request_cancel(self, job_id):
+        """Ask the process running another process's job to cancel it (lock held)"""
+        job = self._load(job_id)
+        if job is None or job['status'] not in ('queued', 'running'):
+            return False
+        try:
+            with open(self._shared_path(job_id, '.cancel'), 'w'):
+                pass
+        except OSError:
+            return False
+        return True
+
+    def _remove(self, job_id):
+        """Delete an expired job's files from the shared directory"""
+        if not self.shared_dir:
+            return
+        for suffix in ('.json', '.cancel'):
+            try:
+                os.remove(self._shared_path(job_id, suffix))
+            except OSError:
+                pass
+
+    def get_stats(self):
+        """Get queue statistics"""
+        with self._available:
+            return {
+                'workers': len(self._workers),
+                'queued': len(self._queue),
+                'running': sum(1 for job in self.jobs.values() if job['status'] == 'running'),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'cancelled': self.cancelled,
+                'timed_out': self.timed_out
+            }
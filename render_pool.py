@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Multiprocess PDF render pool
+reportlab builds are CPU-bound and hold the GIL, so a render on a web
+worker stalls every other connection it serves. The pool moves builds
+into dedicated processes that import reportlab and set up their styles
+once, then turn render jobs into PDF bytes.
+"""
+
+import os
+import pickle
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+# Length prefix for every message on a worker's pipes
+HEADER = struct.Struct('!I')
+
+# Longest a pool wait goes without checking for cancellation, in seconds
+CANCEL_POLL_INTERVAL = 0.1
+
+class RenderTimeoutError(Exception):
+    """Raised when a render job does not finish within its timeout"""
+
+class RenderCancelledError(Exception):
+    """Raised when a render is cancelled before it finishes"""
+
+class RenderDeadline:
+    """Time limit for one render, which another thread may also cancel early
+
+    In-process renders call check() between flowables or question blocks;
+    the pool checks it while waiting on workers and kills any still busy.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires = time.monotonic() + timeout
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Ask the render to stop at its next check"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline"""
+        return self.expires - time.monotonic()
+
+    def check(self):
+        """Raise RenderCancelledError or RenderTimeoutError if the render should stop"""
+        if self.cancelled:
+            raise RenderCancelledError("Rendering was cancelled")
+        if self.remaining() <= 0:
+            raise RenderTimeoutError(f"Rendering took longer than {self.timeout}s")
+
+def _write_message(stream, message):
+    """Send one pickled message over a pipe"""
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+def _read_message(stream):
+    """Receive one pickled message from a pipe; None when it is closed"""
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    return pickle.loads(stream.read(HEADER.unpack(header)[0]))
+
+def _worker_main():
+    """Render loop run by each worker process
+
+    Jobs arrive on stdin and results leave on stdout, so anything else the
+    renderer prints is moved to stderr to keep the protocol clean.
+    """
+    requests = sys.stdin.buffer
+    responses = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    from pdf_generator import PDFGenerator
+    generator = PDFGenerator()
+    _write_message(responses, ('ready', os.getpid()))
+
+    while True:
+        job = _read_message(requests)
+        if job is None:
+            return
+        kind, args = job
+        try:
+            _write_message(responses, ('ok', generator.render_bytes(kind, *args)))
+        except Exception as e:
+            _write_message(responses, ('error', f"{type(e).__name__}: {e}"))
+
+class _Worker:
+    """One render process and the pipes to it"""
+
+    def __init__(self):
+        # Run this file as a script so the worker imports only reportlab and
+        # pdf_generator, never the web app that owns the pool
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.jobs = 0
+        self._buffer = b''
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def send(self, job):
+        self.jobs += 1
+        _write_message(self.process.stdin, job)
+
+    def receive(self, deadline):
+        """Read the next message, or raise RenderTimeoutError at the deadline"""
+        while True:
+            if len(self._buffer) >= HEADER.size:
+                size = HEADER.unpack(self._buffer[:HEADER.size])[0]
+                if len(self._buffer) >= HEADER.size + size:
+                    payload = self._buffer[HEADER.size:HEADER.size + size]
+                    self._buffer = self._buffer[HEADER.size + size:]
+                    return pickle.loads(payload)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self], [], [], remaining)[0]:
+                raise RenderTimeoutError("Render worker did not respond in time")
+
+            chunk = os.read(self.fileno(), 1 << 16)
+            if not chunk:
+                raise RuntimeError(f"Render worker {self.process.pid} exited unexpectedly")
+            self._buffer += chunk
+
+    def stop(self):
+        """Ask the worker to exit once it is idle"""
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+    def kill(self):
+        """Stop the worker immediately, even mid-render"""
+        self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+class RenderPool:
+    """Fixed-size pool of pre-warmed render processes
+
+    Workers are separate interpreters started from this file, so they
+    never inherit a web worker's sockets or gevent hub and never re-import
+    the app. Each is replaced after max_tasks_per_child jobs to cap memory
+    growth from reportlab's font and image caches. A job that overruns its
+    timeout only costs its own worker, which is killed and replaced.
+    """
+
+    def __init__(self, max_workers=None, max_tasks_per_child=200, timeout=25):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self.timeout = timeout
+        self._idle = []
+        self._num_workers = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+        self.jobs = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.restarts = 0
+
+    def start(self):
+        """Start every worker and wait until each has loaded reportlab"""
+        deadline = time.monotonic() + self.timeout
+        workers = [self._acquire(deadline) for _ in range(self.max_workers)]
+        for worker in workers:
+            self._release(worker)
+
+    def _acquire(self, deadline):
+        """Take an idle worker, starting one if the pool is below size"""
+        with self._available:
+            while not self._idle and self._num_workers >= self.max_workers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    raise RenderTimeoutError("No render worker became free in time")
+                self._available.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._num_workers += 1
+
+        return self._start_worker(deadline)
+
+    def _try_acquire(self):
+        """Take an idle worker or start a new one without waiting; None if the pool is busy"""
+        with self._available:
+            if self._idle:
+                return self._idle.pop()
+            if self._num_workers >= self.max_workers or self._closed:
+                return None
+            self._num_workers += 1
+
+        return self._start_worker(time.monotonic() + self.timeout)
+
+    def _start_worker(self, deadline):
+        """Launch a worker for a slot already counted in _num_workers"""
+        worker = None
+        try:
+            worker = _Worker()
+            worker.receive(deadline)
+            return worker
+        except Exception:
+            self._discard(worker, kill=worker is not None)
+            raise
+
+    def _release(self, worker):
+        """Return a worker to the pool, recycling it after max_tasks_per_child jobs"""
+        if worker.jobs >= self.max_tasks_per_child or self._closed:
+            worker.stop()
+            self._discard(None)
+            return
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _discard(self, worker, kill=False):
+        """Forget a worker so a replacement can start"""
+        if worker is not None and kill:
+            worker.kill()
+        with self._available:
+            self._num_workers -= 1
+            self._available.notify()
+
+    def render(self, kind, *args, timeout=None, deadline=None):
+        """Render a document in the pool and return its PDF bytes
+
+        kind and args are as for PDFGenerator.render_bytes; questions must
+        be a list, since generators cannot be sent to another process.
+        """
+        return self.render_many([(kind, args)], timeout=timeout, deadline=deadline)[0]
+
+    def render_many(self, jobs, timeout=None, deadline=None):
+        """Render several (kind, args) jobs concurrently, returning bytes in job order
+
+        All jobs share one deadline, so a worksheet and its answer key
+        together take as long as the slower of the two. A RenderDeadline
+        may be passed instead of a timeout so the caller can cancel; the
+        workers still rendering are then killed.
+        """
+        if deadline is None:
+            deadline = RenderDeadline(self.timeout if timeout is None else timeout)
+        timeout = deadline.timeout
+        expires = deadline.expires
+
+        results = [None] * len(jobs)
+        pending = list(enumerate(jobs))
+        running = {}
+        try:
+            while pending or running:
+                # Hand out jobs while workers are free; block only when none are running
+                while pending:
+                    worker = self._try_acquire() if running else self._acquire(expires)
+                    if worker is None:
+                        break
+                    index, job = pending.pop(0)
+                    worker.send(job)
+                    self.jobs += 1
+                    running[worker] = index
+
+                remaining = deadline.remaining()
+                wait = min(remaining, CANCEL_POLL_INTERVAL)
+                ready = select.select(list(running), [], [], wait)[0] if remaining > 0 else []
+                if deadline.cancelled:
+                    raise RenderCancelledError("Rendering was cancelled")
+                if not ready:
+                    if remaining > CANCEL_POLL_INTERVAL:
+                        continue
+                    raise RenderTimeoutError("Render worker did not respond in time")
+
+                for worker in ready:
+                    status, value = worker.receive(expires)
+                    index = running.pop(worker)
+                    self._release(worker)
+                    if status != 'ok':
+                        raise RuntimeError(f"Rendering {jobs[index][0]} failed: {value}")
+                    results[index] = value
+        except RenderCancelledError:
+            self.cancelled += 1
+            raise
+        except RenderTimeoutError:
+            self.timeouts += 1
+            kinds = ', '.join(kind for kind, _ in jobs)
+            raise RenderTimeoutError(f"Rendering {kinds} took longer than {timeout}s")
+        finally:
+            # Anything still running is stuck or abandoned: kill just those
+            for worker in running:
+                self._discard(worker, kill=True)
+                self.restarts += 1
+
+        return results
+
+    def get_stats(self):
+        """Get pool statistics"""
+        return {
+            'workers': self.max_workers,
+            'running': self._num_workers,
+            'idle': len(self._idle),
+            'jobs': self.jobs,
+            'timeouts': self.timeouts,
+            'cancelled': self.cancelled,
+            'restarts': self.restarts
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for worker in idle:
+            worker.stop()
+            self._discard(None)
+
+if __name__ == '__main__' and sys.argv[1:] == ['--worker']:
+    _worker_main()
@@ -3,10 +3,19 @@
 Test script for the Kids Practice PDF Generator
 """
 
-from question_bank import QuestionBank
+from question_bank import QuestionBank, make_rng, spawn_seeds
 from pdf_generator import PDFGenerator
+from canvas_renderer import CanvasRenderer
+from batch_generation import BatchGenerator
+from answer_checker import AnswerIndex
+from render_cache import RenderCache
+from render_pool import RenderPool, RenderTimeoutError
+from artifact_retention import ArtifactRetention
+import time
 import tempfile
 import os
+import subprocess
+import sys
 
 def test_question_generation():
     """Test question generation for different subjects and topics"""
@@ -110,6 +119,1078 @@ def test_preview_generation():
             f.write(html_preview)
         print("💾 Preview saved to test_preview.html")
 
+def test_preview_templates():
+    """Test previews are escaped, memoized per question and styled by class"""
+    print("\n🧾 Testing Preview Templates...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Medium', 100, seed=11)
+    details = ('maths', 'addition_subtraction', 'Year 5', 'Medium')
+    
+    pdf_gen.generate_preview_worksheet(questions, *details)
+    start_time = time.perf_counter()
+    html_preview = pdf_gen.generate_preview_worksheet(questions, *details)
+    elapsed = time.perf_counter() - start_time
+    assert pdf_gen.preview_fragments.get_stats()['hits'] == 100
+    assert html_preview.count(pdf_gen.PREVIEW_STYLESHEET) == 1 and 'style="' not in html_preview
+    assert html_preview.count('class="qk-question"') == 100
+    
+    # The answer key reuses the same fragments
+    html_answer = pdf_gen.generate_preview_answer_key(questions, *details, include_stylesheet=False)
+    assert pdf_gen.preview_fragments.get_stats()['hits'] == 200
+    assert '<style>' not in html_answer and html_answer.count('<tr>') == 101
+    
+    unsafe = [dict(questions[0], id=None, question="Is 3 < 4 & 4 > 3?", explanation="<script>alert(1)</script>")]
+    html_unsafe = pdf_gen.generate_preview_worksheet(unsafe, *details) + pdf_gen.generate_preview_answer_key(unsafe, *details)
+    assert '3 &lt; 4 &amp; 4 &gt; 3' in html_unsafe and '<script>' not in html_unsafe
+    print(f"✅ 100-question preview: {len(html_preview)} characters in {elapsed * 1000:.2f} ms")
+
+def test_question_space_enumeration():
+    """Test small generators sample their enumerated space without repeats"""
+    print("\n🔢 Testing Question Space Enumeration...")
+    
+    qb = QuestionBank()
+    
+    capacity = qb.get_question_capacity('maths', 'geometry_shape', 'Year 1', 'Easy')
+    questions = qb.generate_questions('maths', 'geometry_shape', 'Year 1', 'Easy', 20)
+    texts = [q['question'] for q in questions]
+    
+    assert capacity == 4
+    assert len(texts) == len(set(texts)) == capacity
+    print(f"✅ Year 1 shapes: {len(questions)} distinct questions (capacity {capacity})")
+    
+    questions = qb.generate_questions('maths', 'geometry_position', 'Year 6', 'Hard', 5)
+    assert len(questions) == 1
+    assert qb.get_question_capacity('maths', 'geometry_position', 'Year 6', 'Hard') == 1
+    assert qb.get_question_capacity('maths', 'addition_subtraction', 'Year 5', 'Hard') is None
+    print(f"✅ Year 6 positions: capacity 1, unbounded generators report None")
+
+def test_unique_questions():
+    """Test large procedural requests never repeat a question"""
+    print("\n🧮 Testing Worksheet Uniqueness...")
+    
+    qb = QuestionBank()
+    
+    stats = {}
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Hard', 500, stats=stats)
+    texts = [q['question'] for q in questions]
+    
+    assert len(texts) == len(set(texts)) == 500
+    print(f"✅ 500 unique questions ({stats['collisions']} collisions, {stats['retries']} retries)")
+    
+    stats = {}
+    questions = qb.generate_questions('maths', 'ratio_proportion', 'Year 3', 'Easy', 40, stats=stats)
+    assert len(questions) == len({q['question'] for q in questions}) == 25
+    print(f"✅ Ratio request capped at 25 distinct questions (fallbacks: {stats['fallback_difficulties']})")
+
+def test_streamed_worksheet():
+    """Test a worksheet can be rendered straight from a question stream"""
+    print("\n🌊 Testing Streamed Worksheet...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    
+    spec = {
+        'subject': 'maths',
+        'topic': 'multiplication_division',
+        'year_group': 'Year 6',
+        'difficulty': 'Medium',
+        'num_questions': 200
+    }
+    stats = {}
+    
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as worksheet_file:
+        worksheet_path = worksheet_file.name
+    
+    try:
+        pdf_gen.generate_worksheet(
+            qb.iter_questions(spec, stats=stats), 'maths', 'multiplication_division',
+            'Year 6', 'Medium', worksheet_path, num_questions=spec['num_questions']
+        )
+        
+        assert os.path.getsize(worksheet_path) > 0
+        print(f"✅ Streamed {spec['num_questions']} questions into {os.path.getsize(worksheet_path)} bytes")
+    finally:
+        os.unlink(worksheet_path)
+    
+    # A stream cut short by capacity reports what it actually produced
+    short_spec = dict(spec, topic='geometry_position', num_questions=20)
+    story = pdf_gen._worksheet_story(
+        qb.iter_questions(short_spec), 'maths', 'geometry_position', 'Year 6', 'Medium', None
+    )
+    texts = [flowable.text for flowable in story if hasattr(flowable, 'text')]
+    assert 'Questions: 1' in texts and not any('Questions: 20' in text for text in texts)
+    print("✅ Short stream prints its real question count")
+
+def test_seeded_generation():
+    """Test per-request seeds give reproducible, independent selections"""
+    print("\n🎲 Testing Seeded Generation...")
+    
+    qb = QuestionBank()
+    
+    first = qb.generate_questions('maths', 'algebra', 'Year 5', 'Medium', 10, seed=1234)
+    second = qb.generate_questions('maths', 'algebra', 'Year 5', 'Medium', 10, seed=1234)
+    injected = qb.generate_questions('maths', 'algebra', 'Year 5', 'Medium', 10, rng=make_rng(1234))
+    assert first == second == injected
+    print("✅ Same seed reproduces the same worksheet")
+    
+    db_first = qb.generate_questions('maths', 'place_value', 'Year 1', 'Easy', 3, seed=7)
+    db_second = qb.generate_questions('maths', 'place_value', 'Year 1', 'Easy', 3, seed=7)
+    assert db_first == db_second
+    print("✅ Database selection honours the seed")
+    
+    child_seeds = spawn_seeds(1234, 4)
+    assert len(set(child_seeds)) == 4 and child_seeds == spawn_seeds(1234, 4)
+    print(f"✅ Spawned {len(child_seeds)} independent child seeds")
+
+def test_class_set():
+    """Test class sets are disjoint when the pool allows and render in one batch"""
+    print("\n🏫 Testing Class Set Generation...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    
+    spec = {
+        'subject': 'maths',
+        'topic': 'addition_subtraction',
+        'year_group': 'Year 4',
+        'difficulty': 'Medium',
+        'num_questions': 10
+    }
+    stats = {}
+    class_questions = qb.generate_class_set(spec, 30, seed=42, stats=stats)
+    all_texts = [q['question'] for questions in class_questions for q in questions]
+    
+    assert len(class_questions) == 30 and stats['disjoint']
+    assert len(all_texts) == len(set(all_texts)) == 300
+    print(f"✅ 30 disjoint worksheets from a pool of {stats['pool_size']} questions")
+    
+    small_spec = dict(spec, topic='geometry_shape', year_group='Year 3', num_questions=4)
+    small_set = qb.generate_class_set(small_spec, 6, seed=42)
+    assert all(len({q['question'] for q in questions}) == 4 for questions in small_set)
+    print("✅ Small pools overlap across pupils but never within a worksheet")
+    
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as worksheet_file:
+        worksheet_path = worksheet_file.name
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as answer_file:
+        answer_path = answer_file.name
+    
+    try:
+        worksheets = [(f"Pupil {i}", questions) for i, questions in enumerate(class_questions, 1)]
+        pdf_gen.generate_class_set(worksheets, 'maths', 'addition_subtraction', 'Year 4', 'Medium', worksheet_path, answer_path)
+        assert os.path.getsize(worksheet_path) > 0 and os.path.getsize(answer_path) > 0
+        print(f"✅ Class set rendered ({os.path.getsize(worksheet_path)} + {os.path.getsize(answer_path)} bytes)")
+    finally:
+        os.unlink(worksheet_path)
+        os.unlink(answer_path)
+
+def test_batch_generation():
+    """Test sharded batch generation is deterministic regardless of worker count"""
+    print("\n🏭 Testing Batch Generation...")
+    
+    plan = [
+        {'subject': 'maths', 'topic': topic, 'year_group': 'Year 5', 'difficulty': 'Medium', 'num_questions': 10}
+        for topic in ['addition_subtraction', 'multiplication_division', 'algebra', 'statistics'] * 3
+    ]
+    
+    serial = BatchGenerator(max_workers=1)
+    pooled = BatchGenerator(max_workers=2)
+    try:
+        serial_results = serial.generate(plan, seed=99)
+        pooled_results = pooled.submit(plan, seed=99).result()
+    finally:
+        serial.shutdown()
+        pooled.shutdown()
+    
+    assert serial_results == pooled_results
+    assert all(len(questions) == 10 for questions in pooled_results)
+    print(f"✅ {len(plan)} plan items merged in the same order with 1 and 2 workers")
+
+def test_answer_checking():
+    """Test batched marking by question ID"""
+    print("\n✔️ Testing Answer Checking...")
+    
+    qb = QuestionBank()
+    index = AnswerIndex()
+    index.load_database(qb.db)
+    
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Easy', 20, seed=3)
+    index.register_many(questions)
+    
+    answers = {q['id']: q['correct_answer'] for q in questions}
+    answers[questions[0]['id']] = 'not an answer'
+    answers['missing'] = 4
+    
+    result = index.grade(answers)
+    assert result['score'] == 19 and result['total'] == 20 and result['unknown'] == 1
+    print(f"✅ Marked {result['total']} answers: score {result['score']}")
+    
+    submissions = [{'pupil': f"Pupil {i}", 'answers': answers} for i in range(250)]
+    start_time = time.time()
+    results = index.grade_many(submissions)
+    elapsed = time.time() - start_time
+    assert len(results) == 250 and results[-1]['pupil'] == 'Pupil 249'
+    print(f"✅ Marked {250 * len(answers)} answers in {elapsed * 1000:.1f}ms")
+    
+    # A process that never saw the questions marks them from their signed IDs
+    served = AnswerIndex(secret='shared').register_many(questions[:3])
+    marker = AnswerIndex(secret='shared')
+    signed = {q['id']: q['correct_answer'] for q in served}
+    signed[served[0]['id']] = 'not an answer'
+    signed[served[1]['id'].split('.')[0] + '.' + '0' * 20] = served[1]['correct_answer']
+    result = marker.grade(signed)
+    assert result['score'] == 2 and result['total'] == 4 and result['unknown'] == 0
+    assert AnswerIndex(secret='other').grade({served[2]['id']: served[2]['correct_answer']})['score'] == 0
+    assert AnswerIndex().grade({served[2]['id']: served[2]['correct_answer']})['unknown'] == 1
+    print("✅ Signed question IDs are marked by any process sharing the secret")
+    
+    import app as web_app
+    client = web_app.app.test_client()
+    preview = client.post('/preview_questions', json={
+        'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5',
+        'difficulty': 'Easy', 'num_questions': 3, 'seed': 3
+    }).get_json()
+    answers = {q['id']: q['correct_answer'] for q in preview['questions']}
+    web_app.answer_index._answers.clear()
+    marked = client.post('/check_answers', json={'answers': answers}).get_json()['results'][0]
+    web_app.answer_index.load_database(qb.db)
+    assert marked['score'] == 3 and marked['unknown'] == 0
+    assert client.post('/check_answers', json={'answers': ['4']}).status_code == 400
+    assert client.post('/check_answers', json={'submissions': [{'answers': 'x'}]}).status_code == 400
+
+def test_render_cache():
+    """Test that repeat renders are served from the render cache"""
+    print("\n🗄️ Testing Render Cache...")
+    
+    qb = QuestionBank()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 3', 'Easy', 10, seed=5)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_dir = os.path.join(temp_dir, 'cache')
+        pdf_gen = PDFGenerator(render_cache=RenderCache(disk_dir=cache_dir))
+        first_path = os.path.join(temp_dir, 'first.pdf')
+        second_path = os.path.join(temp_dir, 'second.pdf')
+        
+        pdf_gen.generate_worksheet(questions, 'maths', 'addition_subtraction', 'Year 3', 'Easy', first_path)
+        pdf_gen.generate_worksheet(questions, 'maths', 'addition_subtraction', 'Year 3', 'Easy', second_path)
+        
+        with open(first_path, 'rb') as f1, open(second_path, 'rb') as f2:
+            assert f1.read() == f2.read()
+        stats = pdf_gen.render_cache.get_stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+        print(f"✅ Second render was a cache hit ({stats['memory_size_mb'] * 1024:.1f}KB cached)")
+        
+        # A new process starts with an empty memory tier but finds the disk copy
+        fresh_cache = RenderCache(disk_dir=cache_dir)
+        assert fresh_cache.get_stats()['disk_entries'] == 1
+        PDFGenerator(render_cache=fresh_cache).generate_worksheet(
+            questions, 'maths', 'addition_subtraction', 'Year 3', 'Hard', second_path
+        )
+        assert fresh_cache.get_stats()['misses'] == 1
+        print("✅ Disk tier survives restarts; changed metadata misses")
+        
+        # Entries written by another process are found, and the shared
+        # directory stays within the bound once an index is rescanned
+        shared_dir = os.path.join(temp_dir, 'shared')
+        writer = RenderCache(disk_dir=shared_dir, max_disk_mb=0.01, rescan_interval=1)
+        reader = RenderCache(disk_dir=shared_dir, max_disk_mb=0.01, rescan_interval=1)
+        writer.set('aa01', b'x' * 4000)
+        assert reader.get('aa01') == b'x' * 4000
+        reader.set('bb02', b'y' * 4000)
+        writer.set('cc03', b'z' * 4000)
+        assert sum(len(files) for _, _, files in os.walk(shared_dir)) == 2
+        assert reader.get('../first') is None
+        print("✅ Disk tier is shared and bounded across processes")
+
+def test_render_pool():
+    """Test rendering in pre-warmed worker processes"""
+    print("\n🏗️ Testing Render Pool...")
+    
+    qb = QuestionBank()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 3', 'Easy', 10, seed=6)
+    pool = RenderPool(max_workers=1, max_tasks_per_child=2)
+    
+    try:
+        pool.start()
+        pdf_gen = PDFGenerator(render_pool=pool)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ('first.pdf', 'second.pdf', 'third.pdf'):
+                path = os.path.join(temp_dir, name)
+                pdf_gen.generate_answer_key(questions, 'maths', 'addition_subtraction', 'Year 3', 'Easy', path)
+                with open(path, 'rb') as f:
+                    assert f.read(5) == b'%PDF-'
+        print("✅ Rendered 3 answer keys in the pool, recycling the worker after 2")
+        
+        worksheet_pdf, answer_pdf = pdf_gen.render_worksheet_and_answer_key(
+            questions, 'maths', 'addition_subtraction', 'Year 3', 'Easy'
+        )
+        assert worksheet_pdf[:5] == answer_pdf[:5] == b'%PDF-'
+        print("✅ Worksheet and answer key submitted to the pool together")
+        
+        large = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Easy', 300, seed=6)
+        try:
+            pool.render('worksheet', large, 'maths', 'addition_subtraction', 'Year 3', 'Easy', 300, timeout=0.01)
+            assert False, "expected a render timeout"
+        except RenderTimeoutError:
+            pass
+        assert pool.render('answer_key', questions, 'maths', 'addition_subtraction', 'Year 3', 'Easy')[:5] == b'%PDF-'
+        assert pool.get_stats()['restarts'] == 1
+        print("✅ Overrunning job timed out and only its worker was replaced")
+    finally:
+        pool.shutdown()
+    
+    # A process that hit a timeout with jobs in flight must still exit promptly
+    script = (
+        "from render_pool import RenderPool, RenderTimeoutError\n"
+        "questions = [{'question': f'{i} + 1?', 'options': ['1', '2', '3', '4'],\n"
+        "              'correct_answer': '2', 'explanation': ''} for i in range(300)]\n"
+        "pool = RenderPool(max_workers=1, max_tasks_per_child=2)\n"
+        "pool.render('answer_key', questions[:5], 'maths', 'topic', 'Year 3', 'Easy')\n"
+        "try:\n"
+        "    pool.render_many([('worksheet', (questions, 'maths', 'topic', 'Year 3', 'Easy', 300)),\n"
+        "                      ('answer_key', (questions, 'maths', 'topic', 'Year 3', 'Easy'))], timeout=0.01)\n"
+        "except RenderTimeoutError:\n"
+        "    pass\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)), timeout=60)
+    assert result.returncode == 0
+    print("✅ Process exits cleanly after a render timeout")
+    
+    # Serving processes start their own pool, sized by RENDER_POOL_WORKERS
+    import app as web_app
+    previous = os.environ.get('RENDER_POOL_WORKERS')
+    os.environ['RENDER_POOL_WORKERS'] = '1'
+    try:
+        started = web_app.start_render_pool()
+        assert started is web_app.render_pool is web_app.pdf_generator.render_pool
+        assert started.max_workers == 1 and started.get_stats()['idle'] == 1 and started.timeout < 30
+        assert web_app.start_render_pool() is started
+        print("✅ Serving process started one pre-warmed pool of its configured size")
+    finally:
+        if web_app.render_pool is not None:
+            web_app.render_pool.shutdown()
+        web_app.render_pool = web_app.pdf_generator.render_pool = None
+        if previous is None:
+            del os.environ['RENDER_POOL_WORKERS']
+        else:
+            os.environ['RENDER_POOL_WORKERS'] = previous
+
+def test_in_memory_rendering():
+    """Test rendering to bytes and spooled buffers without temp files"""
+    print("\n🧠 Testing In-Memory Rendering...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 4', 'Easy', 10, seed=7)
+    
+    worksheet_pdf = pdf_gen.render_worksheet(questions, 'maths', 'addition_subtraction', 'Year 4', 'Easy')
+    answer_pdf = pdf_gen.render_answer_key(questions, 'maths', 'addition_subtraction', 'Year 4', 'Easy')
+    assert worksheet_pdf.startswith(b'%PDF-') and answer_pdf.startswith(b'%PDF-')
+    print(f"✅ Rendered {len(worksheet_pdf) + len(answer_pdf)} bytes in memory")
+    
+    stream = qb.iter_questions({
+        'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 4', 'difficulty': 'Easy',
+        'num_questions': 200
+    }, seed=7)
+    spooled = pdf_gen.render_spooled(
+        'worksheet', stream, 'maths', 'addition_subtraction', 'Year 4', 'Easy', 200,
+        spill_threshold=16 * 1024
+    )
+    with spooled:
+        assert spooled._rolled and spooled.read(5) == b'%PDF-'
+    print("✅ Large streamed worksheet spilled to disk above the threshold")
+
+def test_single_pass_rendering():
+    """Test rendering a worksheet and answer key in one call"""
+    print("\n📑 Testing Single-Pass Rendering...")
+    
+    qb = QuestionBank()
+    spec = {
+        'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 4', 'difficulty': 'Easy',
+        'num_questions': 15
+    }
+    cache = RenderCache()
+    pdf_gen = PDFGenerator(render_cache=cache)
+    
+    # A lazy stream is read once and shared by both documents
+    worksheet_pdf, answer_pdf = pdf_gen.render_worksheet_and_answer_key(
+        qb.iter_questions(spec, seed=8), 'maths', 'addition_subtraction', 'Year 4', 'Easy'
+    )
+    assert worksheet_pdf.startswith(b'%PDF-') and answer_pdf.startswith(b'%PDF-')
+    assert cache.get_stats()['misses'] == 2
+    
+    # Both layouts come from one document model, so a repeat is two cache hits
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 4', 'Easy', 15, seed=8)
+    assert pdf_gen.render_worksheet_and_answer_key(
+        questions, 'maths', 'addition_subtraction', 'Year 4', 'Easy'
+    ) == (worksheet_pdf, answer_pdf)
+    assert cache.get_stats()['hits'] == 2
+    print("✅ Worksheet and answer key rendered together from one pass over the questions")
+
+def test_canvas_renderer():
+    """Test the direct-canvas worksheet backend and its platypus fallback"""
+    print("\n🖌️ Testing Canvas Renderer...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Medium', 30, seed=4)
+    
+    canvas_pdf = pdf_gen.render_worksheet(questions, 'maths', 'addition_subtraction', 'Year 5', 'Medium', renderer='canvas')
+    platypus_pdf = pdf_gen.render_worksheet(questions, 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+    assert canvas_pdf.startswith(b'%PDF-') and canvas_pdf != platypus_pdf
+    assert canvas_pdf.count(b'/Type /Page\n') > 1
+    
+    # Both backends break pages in the same places, even when a long question splits
+    for count, repeats in ((10, 1), (30, 1), (12, 20)):
+        sheet = [dict(question, question=question['question'] * repeats) for question in questions[:count]]
+        details = (sheet, 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+        assert (pdf_gen.render_worksheet(*details, renderer='canvas').count(b'/Type /Page\n')
+                == pdf_gen.render_worksheet(*details).count(b'/Type /Page\n'))
+    
+    # A first word too wide to sit beside its prefix moves to the next line, as in platypus
+    renderer = CanvasRenderer(pdf_gen)
+    lines = renderer._wrap('9' * 60 + ' tens', pdf_gen.question_style, prefix="Question 100: ")
+    assert lines == [("Question 100: ", ''), ('', '9' * 60), ('', 'tens')]
+    
+    # Markup the canvas backend cannot draw falls back to platypus
+    marked_up = [dict(questions[0], question="What is <i>half</i> of 10?")]
+    model = pdf_gen._document_model(marked_up, 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+    # PDFs embed a creation time, so compare sizes rather than bytes
+    assert len(pdf_gen.render_bytes('worksheet_canvas', model)) == len(pdf_gen.render_bytes('worksheet_model', model))
+    
+    try:
+        pdf_gen.render_worksheet(questions, 'maths', 'addition_subtraction', 'Year 5', 'Medium', renderer='latex')
+        assert False, "unknown renderer accepted"
+    except ValueError:
+        pass
+    print("✅ Canvas backend rendered the worksheet and fell back to platypus for markup")
+
+def test_fragment_cache():
+    """Test popular questions are wrapped once and reused across worksheets"""
+    print("\n🧩 Testing Fragment Cache...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Medium', 40, seed=7)
+    details = ('maths', 'addition_subtraction', 'Year 5', 'Medium')
+    
+    cold_start = time.time()
+    first_pdf = pdf_gen.render_worksheet(questions, *details, renderer='canvas')
+    cold_time = time.time() - cold_start
+    assert pdf_gen.fragment_cache.get_stats()['misses'] == 40
+    
+    # The same questions in another order reuse every fragment despite new numbers
+    warm_start = time.time()
+    pdf_gen.render_worksheet(questions[:9] + questions[:8:-1], *details, renderer='canvas')
+    warm_time = time.time() - warm_start
+    stats = pdf_gen.fragment_cache.get_stats()
+    assert stats['hits'] == 40 and stats['entries'] == 40
+    
+    # A question edited under the same ID is wrapped again, not served stale
+    edited = [dict(questions[0], question="What is 10 + 10? " * 12)] + questions[1:]
+    edited_pdf = pdf_gen.render_worksheet(edited, *details, renderer='canvas')
+    assert pdf_gen.fragment_cache.get_stats()['misses'] == 41
+    assert len(edited_pdf) > len(first_pdf)
+    print(f"✅ 40 fragments reused: {cold_time * 1000:.1f} ms cold, {warm_time * 1000:.1f} ms warm")
+
+def test_worksheet_copies():
+    """Test printed copies reuse one copy's page contents on every backend"""
+    print("\n🖨️ Testing Worksheet Copies...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Medium', 20, seed=6)
+    details = (questions, 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+    
+    single_pdf = pdf_gen.render_worksheet(*details, renderer='canvas')
+    pages = single_pdf.count(b'/Type /Page\n')
+    canvas_pdf = pdf_gen.render_worksheet(*details, renderer='canvas', copies=10)
+    platypus_pdf = pdf_gen.render_worksheet(*details, copies=10)
+    
+    assert canvas_pdf.count(b'/Type /Page\n') == platypus_pdf.count(b'/Type /Page\n') == 10 * pages
+    assert canvas_pdf.count(b'/Subtype /Form') == pages
+    
+    # Platypus copies repeat page objects over one set of content streams
+    from pdf_merge import concatenate_pdfs
+    single_platypus = pdf_gen.render_worksheet(*details)
+    assert platypus_pdf.count(b'endstream') == single_platypus.count(b'endstream')
+    assert len(platypus_pdf) < len(concatenate_pdfs([single_platypus] * 10)) / 3
+    compact_pdf = pdf_gen.render_worksheet(*details, layout='compact', copies=10)
+    assert compact_pdf.count(b'endstream') == pdf_gen.render_worksheet(*details, layout='compact').count(b'endstream')
+    print(f"✅ 10 copies of {pages} pages: {len(canvas_pdf)} bytes on canvas, {len(platypus_pdf)} with platypus")
+
+def test_compact_layout():
+    """Test the compact layout packs short options into columns"""
+    print("\n📐 Testing Compact Layout...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Medium', 20, seed=9)
+    details = (questions, 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+    
+    standard_pdf = pdf_gen.render_worksheet(*details)
+    compact_pdf = pdf_gen.render_worksheet(*details, layout='compact')
+    standard_pages = standard_pdf.count(b'/Type /Page\n')
+    compact_pages = compact_pdf.count(b'/Type /Page\n')
+    assert compact_pages < standard_pages
+    assert len(compact_pdf) < len(standard_pdf)
+    assert b'/FontFile' not in compact_pdf
+    
+    # Numbers share one row; long options keep a line each
+    assert len(pdf_gen._option_columns([('A', '3'), ('B', '40'), ('C', '7'), ('D', '12')])._cellvalues[0]) == 4
+    long_options = [(letter, "a much longer option that explains its reasoning at length") for letter in 'ABCD']
+    assert len(pdf_gen._option_columns(long_options)._cellvalues) == 4
+    
+    try:
+        pdf_gen.render_worksheet(*details, layout='tiny')
+        assert False, "unknown layout accepted"
+    except ValueError:
+        pass
+    print(f"✅ Compact layout: {compact_pages} pages, {len(compact_pdf)} bytes "
+          f"(standard {standard_pages} pages, {len(standard_pdf)} bytes)")
+
+def test_large_answer_key():
+    """Test answer keys for hundreds of questions wrap, split and scale linearly"""
+    print("\n🗝️ Testing Large Answer Keys...")
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    questions = qb.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Medium', 500, seed=10)
+    questions = [
+        dict(question, explanation=question['explanation'] + " Check by adding the answer back to the smaller number & comparing.")
+        for question in questions
+    ]
+    
+    timings = {}
+    for size in (125, 500):
+        start_time = time.time()
+        answer_pdf = pdf_gen.render_answer_key(questions[:size], 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+        timings[size] = time.time() - start_time
+    
+    assert len(questions) == 500 and answer_pdf.count(b'/Type /Page\n') > 20
+    assert timings[500] < 8 * timings[125] + 0.5
+    
+    tables = list(pdf_gen._answer_tables(pdf_gen._question_entries(questions)))
+    assert [rows for _, rows in tables] == [100] * 5
+    assert all(table.repeatRows == 1 for table, _ in tables)
+    print(f"✅ 500-question key in {timings[500]:.2f}s ({timings[125]:.2f}s for 125)")
+
+def test_geometry_diagrams():
+    """Test geometry questions carry diagrams that each PDF draws once as a form"""
+    print("\n📐 Testing Geometry Diagrams...")
+    
+    import re
+    from diagrams import build_drawing
+    
+    qb = QuestionBank()
+    pdf_gen = PDFGenerator()
+    
+    shapes = qb.generate_questions('maths', 'geometry_shape', 'Year 3', 'Medium', 5, seed=12)
+    grid_questions = qb.generate_questions('maths', 'geometry_position', 'Year 4', 'Medium', 25, seed=12)
+    assert all(question['diagram'] for question in shapes + grid_questions)
+    assert len({question['question'] for question in grid_questions}) == 25
+    
+    # Every coordinate question shares one grid form; each shape has its own
+    for renderer in PDFGenerator.RENDERERS:
+        grid_pdf = pdf_gen.render_worksheet(grid_questions, 'maths', 'geometry_position', 'Year 4', 'Medium', renderer=renderer)
+        shapes_pdf = pdf_gen.render_worksheet(shapes, 'maths', 'geometry_shape', 'Year 3', 'Medium', renderer=renderer)
+        assert grid_pdf.count(b'/Subtype /Form') == 1
+        assert shapes_pdf.count(b'/Subtype /Form') == 5
+    
+    # Repeating a shape adds a reference, not another copy of the drawing
+    repeated_pdf = pdf_gen.render_worksheet(shapes * 8, 'maths', 'geometry_shape', 'Year 3', 'Medium')
+    assert repeated_pdf.count(b'/Subtype /Form') == 5
+    
+    try:
+        build_drawing({'kind': 'hexagram'})
+        assert False, "unknown diagram kind accepted"
+    except ValueError:
+        pass
+    print(f"✅ 25 coordinate questions share one grid form ({len(grid_pdf)} bytes)")
+    
+    # Previews draw the diagram too, since the question text depends on it
+    html = pdf_gen.generate_preview_worksheet(grid_questions[:3] + shapes[:2], 'maths', 'geometry', 'Year 4', 'Medium')
+    assert html.count('<div class="qk-diagram"><svg') == 5 and '<?xml' not in html
+    assert len(set(re.findall(r'id="(clip-[0-9a-f]+)"', html))) == 5
+    
+    import app as web_app
+    preview = web_app.app.test_client().post('/preview_questions', json={
+        'subject': 'maths', 'topic': 'geometry_position', 'year_group': 'Year 4',
+        'difficulty': 'Medium', 'num_questions': 3, 'seed': 12
+    }).get_json()
+    assert all(question['diagram_svg'].startswith('<svg') for question in preview['questions'])
+    print("✅ HTML and JSON previews carry each question's diagram as inline SVG")
+
+def test_class_pack():
+    """Test a class pack split across render workers comes back as one document"""
+    print("\n📚 Testing Class Pack Rendering...")
+    
+    import re
+    
+    qb = QuestionBank()
+    spec = {
+        'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5', 'difficulty': 'Medium',
+        'num_questions': 20
+    }
+    worksheets = [(f"Pupil {i}", questions) for i, questions in enumerate(qb.generate_class_set(spec, 30, seed=5), 1)]
+    single_pdf, _ = PDFGenerator().render_class_set(worksheets, 'maths', 'addition_subtraction', 'Year 5', 'Medium')
+    
+    pool = RenderPool(max_workers=2)
+    try:
+        start_time = time.time()
+        pack_pdf, answer_pdf = PDFGenerator(render_pool=pool).render_class_set(
+            worksheets, 'maths', 'addition_subtraction', 'Year 5', 'Medium'
+        )
+        elapsed = time.time() - start_time
+    finally:
+        pool.shutdown()
+    
+    # Two chunks were rendered and joined: same pages as a single build, one page tree
+    pages = pack_pdf.count(b'/Type /Page\n')
+    assert pool.jobs == 3 and pages == single_pdf.count(b'/Type /Page\n')
+    assert re.search(rb'/Count (\d+) /Kids', pack_pdf).group(1) == str(pages).encode()
+    assert answer_pdf.startswith(b'%PDF-')
+    
+    # Every xref entry points at the object it names
+    xref = pack_pdf[pack_pdf.rindex(b'xref'):].split(b'\n')[3:]
+    offsets = [int(line[:10]) for line in xref if line.endswith(b' n ')]
+    assert all(pack_pdf.startswith(b'%d 0 obj' % number, offset) for number, offset in enumerate(offsets, 1))
+    print(f"✅ 30 x 20 class pack: {pages} pages from 2 workers in {elapsed:.2f}s")
+
+def test_shared_document_store():
+    """Test that a download can be served by a different server process"""
+    print("\n📦 Testing Shared Document Store...")
+    
+    import app as web_app
+    
+    with tempfile.TemporaryDirectory() as store_dir:
+        original_store = web_app.document_store
+        try:
+            # The process that rendered the document stores it...
+            web_app.document_store = RenderCache(disk_dir=store_dir)
+            document_id = web_app.store_document(b'%PDF-1.4 shared')
+            
+            # ...and another process with its own store serves the download
+            web_app.document_store = RenderCache(disk_dir=store_dir)
+            client = web_app.app.test_client()
+            response = client.get(f'/download/worksheet/20240101_000000?id={document_id}')
+            assert response.status_code == 200 and response.data == b'%PDF-1.4 shared'
+            assert client.get('/download/worksheet/20240101_000000?id=../app.py').status_code == 404
+        finally:
+            web_app.document_store = original_store
+    print("✅ Document rendered in one process downloaded from another")
+
+def test_request_validation():
+    """Test that malformed request fields are rejected with a 400"""
+    print("\n🛡️ Testing Request Validation...")
+    
+    import app as web_app
+    from question_bank import new_seed
+    
+    assert all(new_seed() < 2 ** 53 for _ in range(100))
+    
+    client = web_app.app.test_client()
+    body = {'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5', 'difficulty': 'Easy'}
+    for seed in ([1, 2], 'abc', 2 ** 60, True, -1):
+        response = client.post('/preview_questions', json=dict(body, seed=seed))
+        assert response.status_code == 400, seed
+    
+    first = client.post('/preview_questions', json=dict(body, seed='12345')).get_json()
+    second = client.post('/preview_questions', json=dict(body, seed=12345)).get_json()
+    assert first['seed'] == second['seed'] == 12345 and first['questions'] == second['questions']
+    print("✅ Seeds are validated and safe to echo back through JSON")
+    
+    for class_body in (
+        dict(body, pupils='Alice'),
+        dict(body, pupils=[1, 2]),
+        dict(body, num_pupils=10 ** 9),
+        dict(body, num_pupils=40, num_questions=1000),
+        dict(body, num_questions='many')
+    ):
+        assert client.post('/generate_class_set', json=class_body).status_code == 400, class_body
+    print("✅ Oversized or malformed class sets are rejected")
+
+def test_render_estimate():
+    """Test page and time prediction and the inline / queued / refused routing"""
+    print("\n⏱️ Testing Render Estimates...")
+    
+    import time
+    import app as web_app
+    from render_estimate import RenderEstimator
+    
+    question_bank = QuestionBank()
+    pdf_generator = PDFGenerator()
+    estimator = RenderEstimator()
+    details = ('maths', 'addition_subtraction', 'Year 5', 'Medium')
+    
+    seconds = []
+    for size in (10, 60):
+        questions = question_bank.generate_questions(*details, size, seed=3)
+        for layout in ('standard', 'compact'):
+            pdf = pdf_generator.render_worksheet(questions, *details, layout=layout)
+            estimate = estimator.estimate(questions, layout=layout)
+            assert abs(estimate['pages'] - pdf.count(b'/Type /Page\n')) <= 1, (size, layout, estimate)
+        seconds.append(estimator.estimate(questions)['seconds'])
+    assert seconds[0] < seconds[1]
+    assert estimator.estimate(questions, copies=3)['pages'] == 3 * estimator.estimate(questions)['pages']
+    print(f"✅ Page counts predicted within one page; 10 vs 60 questions: {seconds[0]:.3f}s vs {seconds[1]:.3f}s")
+    
+    client = web_app.app.test_client()
+    body = {'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5',
+            'difficulty': 'Medium', 'num_questions': 10, 'seed': 3}
+    estimated = client.post('/estimate_render', json=body).get_json()
+    assert estimated['admission'] == 'inline' and estimated['estimate']['questions'] == 10
+    assert client.post('/generate_worksheet', json=dict(body, num_questions=10 ** 7)).status_code == 400
+    registered = len(web_app.answer_index)
+    assert client.post('/preview_questions', json=dict(body, num_questions=10 ** 7)).status_code == 413
+    assert len(web_app.answer_index) == registered
+    
+    inline_limit, queued_limit = web_app.MAX_INLINE_RENDER_SECONDS, web_app.MAX_QUEUED_RENDER_SECONDS
+    try:
+        web_app.MAX_INLINE_RENDER_SECONDS = 0
+        response = client.post('/generate_worksheet', json=body)
+        assert response.status_code == 202
+        status_url = response.get_json()['status_url']
+        for _ in range(300):
+            status = client.get(status_url).get_json()
+            if status['status'] not in ('queued', 'running'):
+                break
+            time.sleep(0.1)
+        assert status['status'] == 'done' and status['num_questions'] == 10, status
+        assert client.get(f"/download/worksheet/{status['timestamp']}?id={status['worksheet_id']}").status_code == 200
+        
+        class_body = dict(body, num_pupils=4, num_questions=5)
+        response = client.post('/generate_class_set', json=class_body)
+        assert response.status_code == 202
+        status_url = response.get_json()['status_url']
+        for _ in range(300):
+            status = client.get(status_url).get_json()
+            if status['status'] not in ('queued', 'running'):
+                break
+            time.sleep(0.1)
+        assert status['status'] == 'done' and len(status['pupils']) == 4, status
+        
+        web_app.MAX_QUEUED_RENDER_SECONDS = 0
+        assert client.post('/generate_worksheet', json=body).status_code == 413
+        assert client.post('/generate_class_set', json=class_body).status_code == 413
+    finally:
+        web_app.MAX_INLINE_RENDER_SECONDS, web_app.MAX_QUEUED_RENDER_SECONDS = inline_limit, queued_limit
+    assert client.get('/render_jobs/unknown').status_code == 404
+    print("✅ Large worksheets and class sets are queued and polled, oversized ones refused")
+    
+    # Two queues sharing a directory stand in for two server processes
+    import threading
+    from render_jobs import RenderJobQueue
+    with tempfile.TemporaryDirectory() as temp_dir:
+        owner = RenderJobQueue(timeout=30, shared_dir=temp_dir)
+        other = RenderJobQueue(timeout=30, shared_dir=temp_dir)
+        job_id = owner.submit(lambda deadline: {'pages': 3}, 0)
+        for _ in range(100):
+            if other.get(job_id)['status'] == 'done':
+                break
+            time.sleep(0.05)
+        assert other.get(job_id)['result'] == {'pages': 3} and other.get('0' * 32) is None
+        
+        started = threading.Event()
+        def wait_for_cancel(deadline):
+            started.set()
+            while True:
+                deadline.check()
+                time.sleep(0.05)
+        job_id = owner.submit(wait_for_cancel, 0)
+        assert started.wait(5) and other.cancel(job_id)
+        for _ in range(100):
+            if other.get(job_id)['status'] != 'running':
+                break
+            time.sleep(0.1)
+        assert other.get(job_id)['status'] == 'cancelled' and owner.get_stats()['cancelled'] == 1
+        assert not other.cancel(job_id)
+    print("✅ Jobs are polled and cancelled from a process that did not queue them")
+
+def test_render_deadlines():
+    """Test that renders stop at their deadline or when cancelled, and are counted"""
+    print("\n⏰ Testing Render Deadlines...")
+    
+    import threading
+    import time
+    import app as web_app
+    from render_jobs import RenderJobQueue
+    from render_pool import RenderCancelledError, RenderDeadline
+    
+    qb = QuestionBank()
+    details = ('maths', 'addition_subtraction', 'Year 5', 'Easy')
+    questions = qb.generate_questions(*details, 300, seed=8)
+    pdf_gen = PDFGenerator()
+    model = pdf_gen._document_model(questions, *details)
+    
+    for kind in ('worksheet_model', 'worksheet_canvas', 'answer_key_model'):
+        try:
+            pdf_gen.render_bytes(kind, model, deadline=RenderDeadline(0))
+            assert False, f"expected {kind} to time out"
+        except RenderTimeoutError:
+            pass
+    cancelled = RenderDeadline(60)
+    cancelled.cancel()
+    try:
+        pdf_gen.render_bytes('worksheet_model', model, deadline=cancelled)
+        assert False, "expected the render to be cancelled"
+    except RenderCancelledError:
+        pass
+    assert pdf_gen.render_bytes('worksheet_model', model, deadline=RenderDeadline(60))[:5] == b'%PDF-'
+    print("✅ In-process builds stop between flowables at their deadline or on cancel")
+    
+    pool = RenderPool(max_workers=1)
+    try:
+        pool.start()
+        deadline = RenderDeadline(60)
+        threading.Timer(0.05, deadline.cancel).start()
+        try:
+            pool.render('answer_key_model', model, deadline=deadline)
+            assert False, "expected the pool render to be cancelled"
+        except RenderCancelledError:
+            pass
+        assert pool.get_stats()['cancelled'] == 1
+        assert pool.render('answer_key', questions[:5], *details)[:5] == b'%PDF-'
+    finally:
+        pool.shutdown()
+    print("✅ Cancelling a pool render kills only its worker")
+    
+    jobs = RenderJobQueue(max_workers=1, timeout=0.5)
+    release = threading.Event()
+    blocker = jobs.submit(lambda deadline: release.wait(5), 0)
+    waiting = jobs.submit(lambda deadline: 'never run', 1)
+    assert jobs.cancel(waiting) and jobs.get(waiting)['status'] == 'cancelled'
+    release.set()
+    overrun = jobs.submit(lambda deadline: pdf_gen.render_bytes('worksheet_model', model, deadline=deadline) and
+                          pdf_gen.render_bytes('worksheet_model', model, deadline=deadline) and
+                          pdf_gen.render_bytes('worksheet_model', model, deadline=deadline), 1)
+    for _ in range(100):
+        if jobs.get(overrun)['status'] not in ('queued', 'running'):
+            break
+        time.sleep(0.1)
+    assert jobs.get(blocker)['status'] == 'done' and jobs.get(overrun)['status'] == 'timed_out'
+    stats = jobs.get_stats()
+    assert stats['cancelled'] == 1 and stats['timed_out'] == 1 and not jobs.cancel(overrun)
+    print("✅ Queued jobs can be cancelled and overrunning ones time out")
+    
+    client = web_app.app.test_client()
+    body = {'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5',
+            'difficulty': 'Easy', 'num_questions': 10, 'seed': 8}
+    timeout = web_app.INLINE_RENDER_TIMEOUT
+    try:
+        web_app.INLINE_RENDER_TIMEOUT = 0
+        response = client.post('/generate_worksheet', json=dict(body, seed=9))
+        assert response.status_code == 413 and response.get_json()['use_async']
+    finally:
+        web_app.INLINE_RENDER_TIMEOUT = timeout
+    assert client.get('/render_stats').get_json()['inline_timeouts']['generate_worksheet'] >= 1
+    print("✅ Overrunning inline renders ask the client to queue them and are counted")
+
+def test_download_bundle():
+    """Test the worksheet and answer key download together as a streamed ZIP"""
+    print("\n📦 Testing Download Bundle...")
+    
+    import io
+    import json
+    import zipfile
+    import app as web_app
+    from zip_bundle import CHUNK_SIZE, stream_zip
+    
+    large = bytes(range(256)) * 1000
+    chunks = list(stream_zip([('large.bin', large), ('parts.bin', [b'abc', b'def'])], {'note': 'test'}))
+    assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE + 1024
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.testzip() is None and archive.read('large.bin') == large and archive.read('parts.bin') == b'abcdef'
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    manifest = json.loads(archive.read('manifest.json'))
+    assert manifest['note'] == 'test' and manifest['files'][0] == {'name': 'large.bin', 'bytes': len(large)}
+    print(f"✅ {len(large)} bytes streamed in {len(chunks)} chunks of at most {CHUNK_SIZE // 1024} KB")
+    
+    client = web_app.app.test_client()
+    generated = client.post('/generate_worksheet', json={
+        'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5',
+        'difficulty': 'Easy', 'num_questions': 10, 'seed': 21
+    }).get_json()
+    ids = f"worksheet_id={generated['worksheet_id']}&answer_id={generated['answer_id']}"
+    response = client.get(f"/download/bundle/{generated['timestamp']}?{ids}")
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    names = archive.namelist()
+    assert names == [f"worksheet_{generated['timestamp']}.pdf", f"answer_key_{generated['timestamp']}.pdf", 'manifest.json']
+    assert archive.read(names[0]) == client.get(f"/download/worksheet/{generated['timestamp']}?id={generated['worksheet_id']}").data
+    
+    response = client.get(f"/download/bundle/{generated['timestamp']}?{ids}&manifest=0")
+    assert zipfile.ZipFile(io.BytesIO(response.data)).namelist() == names[:2]
+    assert client.get(f"/download/bundle/{generated['timestamp']}?worksheet_id=missing").status_code == 404
+    
+    # A hostile timestamp cannot reach the entry names or the header
+    response = client.get(f"/download/bundle/..%5C..%5Cevil%22%0D%0AX-Injected:%201?{ids}")
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert 'X-Injected' not in response.headers and '"' not in response.headers['Content-Disposition'][:-1].split('filename="')[1]
+    assert all('/' not in name and '..' not in name for name in archive.namelist())
+    assert json.loads(archive.read('manifest.json'))['generated'] in archive.namelist()[0]
+    print("✅ Worksheet and answer key download as one ZIP with a manifest")
+
+def test_batch_render():
+    """Test the offline batch renderer checkpoints, resumes and packs a ZIP"""
+    print("\n🗂️ Testing Batch Rendering...")
+    
+    import json
+    import zipfile
+    import batch_render
+    
+    manifest = [
+        {'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 5', 'difficulty': 'Easy', 'num_questions': 20},
+        {'subject': 'maths', 'topic': 'geometry_position', 'year_group': 'Year 4', 'difficulty': 'Medium',
+         'num_questions': 10, 'name': 'term 1/position', 'layout': 'compact'},
+        {'subject': 'maths', 'topic': 'addition_subtraction', 'year_group': 'Year 3', 'difficulty': 'Hard',
+         'num_questions': 10, 'renderer': 'canvas', 'copies': 2, 'answer_key': False, 'seed': 5}
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manifest_path = os.path.join(temp_dir, 'manifest.ndjson')
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(json.dumps(spec) for spec in manifest[:2]) + '\n')
+        
+        output = os.path.join(temp_dir, 'pack')
+        renderer = batch_render.BatchRenderer(max_workers=1)
+        totals = renderer.render(batch_render.load_plan(manifest_path), output, seed=7)
+        assert totals['items'] == 2 and not totals['failed'] and totals['pages'] >= 4
+        assert os.path.exists(os.path.join(output, 'term_1_position_worksheet.pdf'))
+        
+        # Plain items are streamed, never building a question list, and match a list render
+        bank = batch_render._worker_bank
+        def no_lists(*args, **kwargs):
+            raise AssertionError("streamed items must not build question lists")
+        bank.generate_questions = no_lists
+        try:
+            streamed = renderer.render(manifest[:1], os.path.join(temp_dir, 'streamed'), seed=7)
+        finally:
+            del bank.generate_questions
+        assert streamed['items'] == 1 and not streamed['failed'], streamed
+        seed = spawn_seeds(7, 1)[0]
+        questions = bank.generate_questions('maths', 'addition_subtraction', 'Year 5', 'Easy', 20, seed=seed)
+        listed_pdf = PDFGenerator().render_answer_key(questions, 'maths', 'addition_subtraction', 'Year 5', 'Easy')
+        streamed_path = os.path.join(temp_dir, 'streamed', '00000_maths_addition_subtraction_Year_5_Easy_answer_key.pdf')
+        assert batch_render.file_page_count(streamed_path) == listed_pdf.count(b'/Type /Page\n')
+        print("✅ Plain items streamed straight to disk without question lists")
+        
+        # A longer manifest resumes from the checkpoint and keeps its seed
+        totals = renderer.render(manifest, output)
+        assert totals['seed'] == 7 and totals['skipped'] == 2 and totals['items'] == 1
+        assert sorted(os.listdir(output)) == sorted([
+            batch_render.CHECKPOINT_FILE,
+            '00000_maths_addition_subtraction_Year_5_Easy_worksheet.pdf',
+            '00000_maths_addition_subtraction_Year_5_Easy_answer_key.pdf',
+            'term_1_position_worksheet.pdf', 'term_1_position_answer_key.pdf',
+            '00002_maths_addition_subtraction_Year_3_Hard_worksheet.pdf'
+        ])
+        print(f"✅ Resumed a 3-item manifest after 2 items ({totals['pages']} pages in the last)")
+        
+        with open(manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(manifest[2]) + '\n')
+        zip_path = os.path.join(temp_dir, 'pack.zip')
+        assert batch_render.main([manifest_path, '--output', zip_path, '--workers', '1', '--seed', '7']) == 0
+        archive = zipfile.ZipFile(zip_path)
+        assert archive.testzip() is None and len(archive.namelist()) == 6
+        assert not os.path.exists(zip_path + '.parts')
+    print("✅ Manifest rendered into a ZIP of stored PDFs")
+
+def test_document_downloads():
+    """Test downloads by document ID answer ETag, Range and X-Accel-Redirect requests"""
+    print("\n📥 Testing Document Downloads...")
+    
+    import app as web_app
+    
+    client = web_app.app.test_client()
+    pdf = b'%PDF-1.4\n' + bytes(range(256)) * 40
+    original_store = web_app.document_store
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for label, store in (('memory', original_store), ('disk', RenderCache(max_memory_mb=0, disk_dir=temp_dir))):
+            web_app.document_store = store
+            try:
+                document_id = web_app.store_document(pdf)
+                response = client.get(f'/documents/{document_id}?filename=../worksheet 1.pdf')
+                assert response.status_code == 200 and response.data == pdf
+                assert response.headers['ETag'] == f'"{document_id}"' and response.headers['Accept-Ranges'] == 'bytes'
+                assert 'worksheet_1.pdf' in response.headers['Content-Disposition']
+                assert 'private' in response.headers['Cache-Control'] and 'public' not in response.headers['Cache-Control']
+                
+                response = client.get(f'/documents/{document_id}', headers={'If-None-Match': f'"{document_id}"'})
+                assert response.status_code == 304 and not response.data
+                response = client.get(f'/documents/{document_id}', headers={'Range': 'bytes=100-199'})
+                assert response.status_code == 206 and response.data == pdf[100:200]
+                assert response.headers['Content-Range'] == f'bytes 100-199/{len(pdf)}'
+                assert client.get(f'/download/answer/20240101?id={document_id}').data == pdf
+                print(f"✅ {label.title()} tier: full, 304 and 206 responses")
+                
+                if label == 'disk':
+                    web_app.DOCUMENT_ACCEL_PREFIX = '/protected_documents/'
+                    response = client.get(f'/documents/{document_id}')
+                    assert response.headers['X-Accel-Redirect'] == f'/protected_documents/{document_id[:2]}/{document_id}.pdf'
+                    assert not response.data and response.headers['ETag'] == f'"{document_id}"'
+                    print("✅ Disk tier hands the file to nginx with X-Accel-Redirect")
+            finally:
+                web_app.document_store = original_store
+                web_app.DOCUMENT_ACCEL_PREFIX = None
+    
+    assert client.get('/documents/0123456789abcdef').status_code == 404
+    assert client.get('/documents/..%2F..%2Fetc%2Fpasswd').status_code == 404
+
+def test_artifact_retention():
+    """Test generated files are expired, kept under quota and evicted under disk pressure"""
+    print("\n🧹 Testing Artifact Retention...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def write(name, size=1024):
+            path = os.path.join(temp_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            return path
+        
+        retention = ArtifactRetention(temp_dir, ttl_seconds=60, max_size_mb=1, scan_batch=2)
+        retention.register(write('a.pdf'), 1024)
+        retention.register(write('b.pdf'), 1024, ttl_seconds=3600)
+        now = time.time()
+        retention.sweep(now)
+        assert sorted(os.listdir(temp_dir)) == ['a.pdf', 'b.pdf']
+        retention.sweep(now + 120)
+        assert os.listdir(temp_dir) == ['b.pdf'] and retention.get_stats()['expired'] == 1
+        print("✅ Expired files deleted, unexpired kept")
+        
+        # Files from other processes are adopted a batch at a time, with their mtime as age
+        for i in range(5):
+            write(f"other_{i}.pdf")
+        os.utime(os.path.join(temp_dir, 'other_0.pdf'), (now - 600, now - 600))
+        sweeps = 0
+        while retention.get_stats()['adopted'] < 5:
+            retention.sweep(now)
+            sweeps += 1
+        assert sweeps >= 3 and 'other_0.pdf' not in os.listdir(temp_dir)
+        
+        # A file another process deleted is forgotten after a full scan
+        os.remove(os.path.join(temp_dir, 'other_1.pdf'))
+        for _ in range(4):
+            retention.sweep(now)
+        stats = retention.get_stats()
+        assert stats['files'] == len(os.listdir(temp_dir)) == 4
+        print(f"✅ Adopted {stats['adopted']} unknown files over {sweeps} sweeps")
+        
+        # Over quota, the oldest files go first
+        retention.register(write('big.pdf', 1024 * 1024), 1024 * 1024)
+        retention.sweep(now)
+        assert 'b.pdf' not in os.listdir(temp_dir) and 'big.pdf' in os.listdir(temp_dir)
+        assert retention.total_size <= retention.max_size and retention.get_stats()['evicted_quota'] > 0
+        print("✅ Oldest files evicted to stay under quota")
+        
+        # Watermarks of zero make any disk look full, so everything tracked goes
+        retention.high_watermark = retention.low_watermark = 0
+        retention.sweep(now)
+        stats = retention.get_stats()
+        assert os.listdir(temp_dir) == [] and stats['files'] == 0 and stats['evicted_pressure'] > 0
+        assert stats['disk_percent'] is not None and stats['freed_mb'] > 1
+        print(f"✅ Disk pressure evicted {stats['evicted_pressure']} files, {stats['freed_mb']:.2f}MB freed in all")
+
 if __name__ == "__main__":
     print("🎓 Kids Practice PDF Generator - Test Suite")
     print("=" * 50)
@@ -117,6 +1198,33 @@ if __name__ == "__main__":
     test_question_generation()
     test_pdf_generation()
     test_preview_generation()
+    test_preview_templates()
+    test_question_space_enumeration()
+    test_unique_questions()
+    test_streamed_worksheet()
+    test_seeded_generation()
+    test_class_set()
+    test_batch_generation()
+    test_answer_checking()
+    test_render_cache()
+    test_render_pool()
+    test_in_memory_rendering()
+    test_single_pass_rendering()
+    test_canvas_renderer()
+    test_fragment_cache()
+    test_worksheet_copies()
+    test_compact_layout()
+    test_large_answer_key()
+    test_geometry_diagrams()
+    test_class_pack()
+    test_shared_document_store()
+    test_request_validation()
+    test_render_estimate()
+    test_render_deadlines()
+    test_download_bundle()
+    test_batch_render()
+    test_document_downloads()
+    test_artifact_retention()
     
     print("\n" + "=" * 50)
     print("✅ All tests completed!")
@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 import logging
 import gzip
 import json
+from artifact_retention import ArtifactRetention
 
 class UltraStorage:
     def __init__(self):
@@ -35,9 +36,15 @@ class UltraStorage:
             self.storage_available = False
             logging.warning(f"⚠️ Cloudflare R2 not available: {e}")
         
-        # Local cache for frequently accessed files
+        # Local cache for frequently accessed files, expired and evicted by its retention sweeper
         self.local_cache_dir = '/tmp/pdf_cache'
         os.makedirs(self.local_cache_dir, exist_ok=True)
+        self.retention = ArtifactRetention(
+            self.local_cache_dir,
+            ttl_seconds=float(os.getenv('LOCAL_PDF_TTL_HOURS', 24)) * 3600,
+            max_size_mb=int(os.getenv('LOCAL_PDF_CACHE_MB', 1024))
+        )
+        self.retention.start()
     
     def upload_pdf(self, file_path, user_id, subject, topic):
         """Upload PDF with ultra-cost-effective organization"""
@@ -101,6 +108,8 @@ class UltraStorage:
         # Copy file to local cache
         import shutil
         shutil.copy2(file_path, local_path)
+        # copy2 keeps the source's mtime, so the copy is registered as new
+        self.retention.register(local_path)
         
         return f"/download/local/{filename}"
     
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Streamed ZIP bundles
+Writes a ZIP archive chunk by chunk as a response is sent, so a
+worksheet, its answer key and a manifest download together without the
+archive ever being assembled in memory or on disk. Entries are stored
+rather than deflated: reportlab's PDFs are already compressed, and
+storing keeps the archive's cost to a CRC pass over each file.
+"""
+
+import json
+import time
+import zipfile
+
+# Size of the slices each file is written and yielded in
+CHUNK_SIZE = 64 * 1024
+
+class _ZipSink:
+    """Write-only file for ZipFile that hands back whatever was written since the last drain
+
+    It has no seek or tell, so ZipFile writes sizes and CRCs in data
+    descriptors after each entry instead of seeking back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget the bytes written so far"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_zip(files, manifest=None):
+    """Yield a ZIP archive of (name, data) files, followed by manifest.json if given
+
+    data is bytes or an iterable of byte chunks; bytes are written in
+    CHUNK_SIZE slices, so only one slice is held beyond the caller's own
+    buffers. manifest is a dict, to which each file's name and size are
+    added.
+    """
+    sink = _ZipSink()
+    entries = []
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = zipfile.ZIP_STORED
+            size = 0
+            with archive.open(info, 'w') as entry:
+                for chunk in _chunks(data):
+                    entry.write(chunk)
+                    size += len(chunk)
+                    yield sink.drain()
+            entries.append({'name': name, 'bytes': size})
+            yield sink.drain()
+
+        if manifest is not None:
+            payload = json.dumps(dict(manifest, files=entries), indent=2).encode('utf-8')
+            archive.writestr(zipfile.ZipInfo('manifest.json', date_time=date_time), payload)
+    yield sink.drain()
+
+def _chunks(data):
+    """Split bytes into CHUNK_SIZE memoryview slices; pass other iterables through"""
+    if isinstance(data, (bytes, bytearray)):
+        view = memoryview(data)
+        return (view[start:start + CHUNK_SIZE] for start in range(0, len(view), CHUNK_SIZE))
+    return data